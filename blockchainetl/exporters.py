@@ -35,9 +35,10 @@ import io
 import threading
 from json import JSONEncoder
 
-import decimal
 import six
 
+from blockchainetl import json_codec
+
 
 class BaseItemExporter(object):
 
@@ -121,6 +122,8 @@ class CsvItemExporter(BaseItemExporter):
     def _join_if_needed(self, value):
         def to_string(x):
             if isinstance(x, dict):
+                if json_codec.is_compact_items():
+                    return json_codec.dumps(x)
                 # Separators without whitespace for compact format.
                 return JSONEncoder(separators=(',', ':')).encode(x)
             else:
@@ -165,10 +168,6 @@ class CsvItemExporter(BaseItemExporter):
             row = list(self._build_row(self.fields_to_export))
             self.csv_writer.writerow(row)
 
-def EncodeDecimal(o):
-    if isinstance(o, decimal.Decimal):
-        return float(round(o, 8))
-    raise TypeError(repr(o) + " is not JSON serializable")
 
 class JsonLinesItemExporter(BaseItemExporter):
 
@@ -176,13 +175,17 @@ class JsonLinesItemExporter(BaseItemExporter):
         self._configure(kwargs, dont_fail=True)
         self.file = file
         kwargs.setdefault('ensure_ascii', not self.encoding)
-        # kwargs.setdefault('default', EncodeDecimal)
-        self.encoder = JSONEncoder(default=EncodeDecimal, **kwargs)
+        self.encoder = JSONEncoder(default=json_codec.encode_default, **kwargs)
 
     def export_item(self, item):
         itemdict = dict(self._get_serialized_fields(item))
-        data = self.encoder.encode(itemdict) + '\n'
-        self.file.write(to_bytes(data, self.encoding))
+        if not json_codec.is_compact_items():
+            data = to_bytes(self.encoder.encode(itemdict), self.encoding)
+        elif self.encoding is None:
+            data = json_codec.dumps_bytes(itemdict)
+        else:
+            data = to_bytes(json_codec.dumps(itemdict), self.encoding)
+        self.file.write(data + b'\n')
 
 
 def to_native_str(text, encoding=None, errors='strict'):
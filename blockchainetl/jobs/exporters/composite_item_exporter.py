@@ -20,6 +20,7 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 import logging
+import os
 
 from blockchainetl.atomic_counter import AtomicCounter
 from blockchainetl.exporters import CsvItemExporter, JsonLinesItemExporter
@@ -27,10 +28,13 @@ from blockchainetl.file_utils import get_file_handle, close_silently
 from blockchainetl.jobs.exporters.converters.composite_item_converter import CompositeItemConverter
 
 
+# With file_offsets, a dict of file sizes by file name, the output files are truncated to those sizes and appended to
+# instead of being overwritten, e.g. to resume an export from a ProgressLedger checkpoint.
 class CompositeItemExporter:
-    def __init__(self, filename_mapping, field_mapping=None, converters=()):
+    def __init__(self, filename_mapping, field_mapping=None, converters=(), file_offsets=None):
         self.filename_mapping = filename_mapping
         self.field_mapping = field_mapping or {}
+        self.file_offsets = file_offsets
 
         self.file_mapping = {}
         self.exporter_mapping = {}
@@ -42,13 +46,18 @@ class CompositeItemExporter:
 
     def open(self):
         for item_type, filename in self.filename_mapping.items():
-            file = get_file_handle(filename, binary=True)
+            offset = self._get_resume_offset(filename)
+            if offset is None:
+                file = get_file_handle(filename, binary=True)
+            else:
+                file = open_truncated(filename, offset)
             fields = self.field_mapping.get(item_type)
             self.file_mapping[item_type] = file
             if str(filename).endswith('.json'):
                 item_exporter = JsonLinesItemExporter(file, fields_to_export=fields)
             else:
-                item_exporter = CsvItemExporter(file, fields_to_export=fields)
+                # The headers are already in the file when appending to it
+                item_exporter = CsvItemExporter(file, fields_to_export=fields, include_headers_line=not offset)
             self.exporter_mapping[item_type] = item_exporter
 
             self.counter_mapping[item_type] = AtomicCounter()
@@ -71,9 +80,45 @@ class CompositeItemExporter:
         if counter is not None:
             counter.increment()
 
+    def flush(self):
+        """Flushes the output files to disk."""
+        for file in self.file_mapping.values():
+            if is_regular_file(file):
+                file.flush()
+                os.fsync(file.fileno())
+
+    def get_file_offsets(self):
+        """Returns the current size of each output file by file name, skipping stdout."""
+        return {
+            self.filename_mapping[item_type]: file.tell()
+            for item_type, file in self.file_mapping.items()
+            if self.filename_mapping[item_type] != '-' and is_regular_file(file)
+        }
+
+    def _get_resume_offset(self, filename):
+        if self.file_offsets is None or filename is None or filename == '-':
+            return None
+        return self.file_offsets.get(filename, 0)
+
     def close(self):
         for item_type, file in self.file_mapping.items():
             close_silently(file)
             counter = self.counter_mapping[item_type]
             if counter is not None:
                 self.logger.info('{} items exported: {}'.format(item_type, counter.increment() - 1))
+
+
+def open_truncated(filename, offset):
+    """Opens the file for appending after truncating it to offset bytes."""
+    file = get_file_handle(filename, mode='a', binary=True)
+    size = file.seek(0, os.SEEK_END)
+    if size < offset:
+        file.close()
+        raise ValueError('{} has {} bytes, fewer than the {} bytes at the last checkpoint'.format(
+            filename, size, offset))
+    file.truncate(offset)
+    return file
+
+
+def is_regular_file(file):
+    return hasattr(file, 'fileno') and file.seekable() and not file.isatty()
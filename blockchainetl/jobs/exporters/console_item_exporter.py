@@ -20,7 +20,7 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-import json
+from blockchainetl import json_codec
 
 
 class ConsoleItemExporter:
@@ -32,7 +32,7 @@ class ConsoleItemExporter:
             self.export_item(item)
 
     def export_item(self, item):
-        print(json.dumps(item))
+        print(json_codec.dumps_item(item))
 
     def close(self):
         pass
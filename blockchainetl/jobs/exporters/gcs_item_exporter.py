@@ -20,12 +20,13 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-import json
 import logging
 from collections import defaultdict
 
 from google.cloud import storage
 
+from blockchainetl import json_codec
+
 
 def build_block_bundles(items):
     blocks = defaultdict(list)
@@ -93,7 +94,7 @@ class GcsItemExporter:
 
             bucket = self.storage_client.bucket(self.bucket)
             blob = bucket.blob(destination_blob_name)
-            blob.upload_from_string(json.dumps(block_bundle))
+            blob.upload_from_string(json_codec.dumps_item_bytes(block_bundle))
             logging.info(f'Uploaded file gs://{self.bucket}/{destination_blob_name}')
 
     def close(self):
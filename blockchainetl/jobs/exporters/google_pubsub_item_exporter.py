@@ -20,12 +20,13 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-import json
 import logging
 
 from google.cloud import pubsub_v1
 from timeout_decorator import timeout_decorator
 
+from blockchainetl import json_codec
+
 
 class GooglePubSubItemExporter:
 
@@ -74,7 +75,7 @@ class GooglePubSubItemExporter:
         item_type = item.get('type')
         if item_type is not None and item_type in self.item_type_to_topic_mapping:
             topic_path = self.item_type_to_topic_mapping.get(item_type)
-            data = json.dumps(item).encode('utf-8')
+            data = json_codec.dumps_item_bytes(item)
 
             ordering_key = 'all' if self.enable_message_ordering else ''
             message_future = self.publisher.publish(topic_path, data=data, ordering_key=ordering_key, **self.get_message_attributes(item))
@@ -1,9 +1,9 @@
 import collections
-import json
 import logging
 
 from kafka import KafkaProducer
 
+from blockchainetl import json_codec
 from blockchainetl.jobs.exporters.converters.composite_item_converter import CompositeItemConverter
 
 
@@ -32,7 +32,7 @@ class KafkaItemExporter:
     def export_item(self, item):
         item_type = item.get('type')
         if item_type is not None and item_type in self.item_type_to_topic_mapping:
-            data = json.dumps(item).encode('utf-8')
+            data = json_codec.dumps_item_bytes(item)
             logging.debug(data)
             return self.producer.send(self.item_type_to_topic_mapping[item_type], value=data)
         else:
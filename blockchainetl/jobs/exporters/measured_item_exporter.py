@@ -0,0 +1,73 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import collections
+import time
+
+from blockchainetl.metrics import Counter, Histogram, is_metrics_enabled
+
+ITEMS_EXPORTED = Counter('items_exported_total', 'The number of exported items by type and exporter.',
+                         ['type', 'exporter'])
+EXPORTER_WRITE_DURATION = Histogram(
+    'exporter_write_duration_seconds', 'The time an exporter takes to write an item or a list of items.',
+    ['exporter'])
+
+
+# Counts the exported items by type and measures the write latency of the wrapped exporter
+class MeasuredItemExporter:
+    def __init__(self, item_exporter):
+        self.item_exporter = item_exporter
+        self.exporter_name = type(item_exporter).__name__
+        self.write_duration = EXPORTER_WRITE_DURATION.labels(self.exporter_name)
+
+    def open(self):
+        self.item_exporter.open()
+
+    def export_items(self, items):
+        start_time = time.perf_counter()
+        if hasattr(self.item_exporter, 'export_items'):
+            self.item_exporter.export_items(items)
+        else:
+            for item in items:
+                self.item_exporter.export_item(item)
+        self.write_duration.observe(time.perf_counter() - start_time)
+        counts = collections.Counter(item.get('type') for item in items)
+        for item_type, count in counts.items():
+            ITEMS_EXPORTED.labels(item_type, self.exporter_name).inc(count)
+
+    def export_item(self, item):
+        start_time = time.perf_counter()
+        self.item_exporter.export_item(item)
+        self.write_duration.observe(time.perf_counter() - start_time)
+        ITEMS_EXPORTED.labels(item.get('type'), self.exporter_name).inc()
+
+    def close(self):
+        self.item_exporter.close()
+
+    def __getattr__(self, name):
+        # E.g. get_items of InMemoryItemExporter
+        return getattr(self.item_exporter, name)
+
+
+def measure_item_exporter(item_exporter):
+    """Returns the exporter wrapped in MeasuredItemExporter if metrics are enabled."""
+    return MeasuredItemExporter(item_exporter) if is_metrics_enabled() else item_exporter
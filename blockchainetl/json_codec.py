@@ -0,0 +1,205 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""JSON encoding and decoding for RPC payloads and exported items.
+
+Uses orjson or msgspec when installed and falls back to the json module otherwise. All codecs produce the same
+compact UTF-8 output, so exported files don't depend on which library is installed. Integers over 64 bits are
+encoded with the json module, but orjson decodes them as floats. That's fine for JSON-RPC payloads where quantities
+are hex encoded, exported items and other files written by the export are decoded with loads_item, which uses the
+json module.
+
+Exported items keep the format of json.dumps, with ", " and ": " separators and non-ASCII characters escaped,
+unless compact items are enabled with ETHEREUM_ETL_COMPACT_JSON_ITEMS or set_compact_items. Then items are encoded
+with the codec too.
+"""
+
+import decimal
+import json
+import os
+
+JSON_CODEC_ENV_VARIABLE = 'ETHEREUM_ETL_JSON_CODEC'
+COMPACT_JSON_ITEMS_ENV_VARIABLE = 'ETHEREUM_ETL_COMPACT_JSON_ITEMS'
+
+
+def encode_default(o):
+    if isinstance(o, decimal.Decimal):
+        return float(round(o, 8))
+    raise TypeError(repr(o) + " is not JSON serializable")
+
+
+class StdlibJsonCodec:
+    name = 'json'
+
+    def __init__(self):
+        self._encoder = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False, default=encode_default)
+
+    def dumps(self, obj):
+        return self._encoder.encode(obj)
+
+    def dumps_bytes(self, obj):
+        return self._encoder.encode(obj).encode('utf-8')
+
+    def loads(self, data):
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+        return json.loads(data)
+
+
+class OrjsonCodec(StdlibJsonCodec):
+    name = 'orjson'
+
+    def __init__(self):
+        super().__init__()
+        import orjson
+        self._orjson = orjson
+
+    def dumps(self, obj):
+        return self.dumps_bytes(obj).decode('utf-8')
+
+    def dumps_bytes(self, obj):
+        try:
+            return self._orjson.dumps(obj, default=encode_default)
+        except TypeError:
+            # Integers over 64 bits aren't supported by orjson
+            return super().dumps_bytes(obj)
+
+    def loads(self, data):
+        return self._orjson.loads(data)
+
+
+class MsgspecCodec(StdlibJsonCodec):
+    name = 'msgspec'
+
+    def __init__(self):
+        super().__init__()
+        import msgspec
+        self._msgspec = msgspec
+        self._encode_errors = (TypeError, OverflowError, msgspec.EncodeError)
+        try:
+            self._msgspec_encoder = msgspec.json.Encoder(enc_hook=encode_default, decimal_format='number')
+        except TypeError:
+            # decimal_format was added in msgspec 0.18, older versions encode decimals as strings
+            self._msgspec_encoder = msgspec.json.Encoder(enc_hook=encode_default)
+        self._msgspec_decoder = msgspec.json.Decoder()
+
+    def dumps(self, obj):
+        return self.dumps_bytes(obj).decode('utf-8')
+
+    def dumps_bytes(self, obj):
+        try:
+            return self._msgspec_encoder.encode(obj)
+        except self._encode_errors:
+            return super().dumps_bytes(obj)
+
+    def loads(self, data):
+        try:
+            return self._msgspec_decoder.decode(data)
+        except self._msgspec.DecodeError as e:
+            # Invalid JSON raises ValueError like with the other codecs
+            raise ValueError(str(e)) from e
+
+
+JSON_CODECS = {
+    'orjson': OrjsonCodec,
+    'msgspec': MsgspecCodec,
+    'json': StdlibJsonCodec,
+}
+
+
+def create_json_codec(name=None):
+    if name is not None:
+        if name not in JSON_CODECS:
+            raise ValueError('Unknown JSON codec {}. Supported codecs: {}'.format(name, ', '.join(JSON_CODECS)))
+        return JSON_CODECS[name]()
+
+    for codec_class in JSON_CODECS.values():
+        try:
+            return codec_class()
+        except ImportError:
+            continue
+
+
+_json_codec = create_json_codec(os.environ.get(JSON_CODEC_ENV_VARIABLE))
+_compact_items = os.environ.get(COMPACT_JSON_ITEMS_ENV_VARIABLE, '').lower() in ('1', 'true', 'yes')
+_item_encoder = json.JSONEncoder(default=encode_default)
+
+
+def get_json_codec():
+    return _json_codec
+
+
+def set_json_codec(name=None):
+    """Switches the codec used by dumps, dumps_bytes and loads. Picks the fastest installed one if name is None."""
+    global _json_codec
+    _json_codec = create_json_codec(name)
+    return _json_codec
+
+
+def dumps(obj):
+    return _json_codec.dumps(obj)
+
+
+def dumps_bytes(obj):
+    return _json_codec.dumps_bytes(obj)
+
+
+def loads(data):
+    """Decodes str, bytes, bytearray or memoryview. Bytes are decoded directly without converting them to str.
+
+    Raises ValueError for invalid JSON.
+    """
+    return _json_codec.loads(data)
+
+
+def loads_item(data):
+    """Decodes an exported item or another file written by the export with the json module.
+
+    Unlike loads with orjson, integers over 64 bits, e.g. total_difficulty of blocks, are decoded as integers.
+    """
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    return json.loads(data)
+
+
+def is_compact_items():
+    return _compact_items
+
+
+def set_compact_items(compact):
+    """Switches dumps_item and dumps_item_bytes to the compact UTF-8 output of the codec, or back to json.dumps."""
+    global _compact_items
+    _compact_items = compact
+
+
+def dumps_item(obj):
+    """Encodes an exported item, like json.dumps unless compact items are enabled."""
+    if _compact_items:
+        return _json_codec.dumps(obj)
+    return _item_encoder.encode(obj)
+
+
+def dumps_item_bytes(obj):
+    if _compact_items:
+        return _json_codec.dumps_bytes(obj)
+    return _item_encoder.encode(obj).encode('utf-8')
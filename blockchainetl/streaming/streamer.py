@@ -25,9 +25,16 @@ import logging
 import os
 import time
 
+from blockchainetl.metrics import Gauge
 from blockchainetl.streaming.streamer_adapter_stub import StreamerAdapterStub
 from blockchainetl.file_utils import smart_open
 
+STREAMER_LAG_BLOCKS = Gauge(
+    'streamer_lag_blocks', 'The number of blocks between the chain head and the last synced block.')
+# Set by streamer adapters that know the timestamps of the synced blocks
+STREAMER_LAG_SECONDS = Gauge('streamer_lag_seconds', 'The age of the last synced block in seconds when it was synced.')
+STREAMER_LAST_SYNCED_BLOCK = Gauge('streamer_last_synced_block', 'The number of the last synced block.')
+
 
 class Streamer:
     def __init__(
@@ -93,12 +100,15 @@ class Streamer:
 
         logging.info('Current block {}, target block {}, last synced block {}, blocks to sync {}'.format(
             current_block, target_block, self.last_synced_block, blocks_to_sync))
+        STREAMER_LAG_BLOCKS.set(current_block - self.last_synced_block)
 
         if blocks_to_sync != 0:
             self.blockchain_streamer_adapter.export_all(self.last_synced_block + 1, target_block)
             logging.info('Writing last synced block {}'.format(target_block))
             write_last_synced_block(self.last_synced_block_file, target_block)
             self.last_synced_block = target_block
+            STREAMER_LAG_BLOCKS.set(current_block - target_block)
+            STREAMER_LAST_SYNCED_BLOCK.set(target_block)
 
         return blocks_to_sync
 
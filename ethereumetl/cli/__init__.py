@@ -44,14 +44,39 @@ from ethereumetl.cli.filter_items import filter_items
 from ethereumetl.cli.get_block_range_for_date import get_block_range_for_date
 from ethereumetl.cli.get_block_range_for_timestamps import get_block_range_for_timestamps
 from ethereumetl.cli.get_keccak_hash import get_keccak_hash
+from ethereumetl.cli.redrive_dead_letters import redrive_dead_letters
 from ethereumetl.cli.stream import stream
+from blockchainetl.metrics import start_metrics_server
+from ethereumetl.executors.dead_letter import DeadLetterSink, set_dead_letter_sink
+from ethereumetl.providers.auto import record_rpc_requests
 
 
 @click.group()
 @click.version_option(version='2.3.1')
+@click.option('--record-rpc', default=None, type=str,
+              help='Record all JSON-RPC requests and responses with their latency to this gzipped archive. '
+                   'Replay it without a node using --provider-uri replay://<archive>.')
+@click.option('--dead-letters', default=None, type=str,
+              help='Record the items that keep failing after retries to this file and continue, '
+                   'instead of failing the command. Run them again with redrive_dead_letters.')
+@click.option('--metrics-port', default=None, type=int,
+              help='Serve Prometheus metrics at http://<metrics-host>:<metrics-port>/metrics, e.g. items exported '
+                   'per type, RPC latency per method, batch sizes, retries and the lag of the stream command.')
+@click.option('--metrics-host', default='127.0.0.1', show_default=True, type=str,
+              help='The address the metrics server listens on.')
 @click.pass_context
-def cli(ctx):
-    pass
+def cli(ctx, record_rpc=None, dead_letters=None, metrics_port=None, metrics_host='127.0.0.1'):
+    if metrics_port is not None:
+        ctx.call_on_close(start_metrics_server(metrics_port, metrics_host).shutdown)
+    if record_rpc is not None:
+        ctx.call_on_close(record_rpc_requests(record_rpc).close)
+    if dead_letters is not None:
+        dead_letter_sink = set_dead_letter_sink(DeadLetterSink(dead_letters))
+
+        def close_dead_letter_sink():
+            dead_letter_sink.close()
+            set_dead_letter_sink(None)
+        ctx.call_on_close(close_dead_letter_sink)
 
 
 # export
@@ -68,6 +93,7 @@ cli.add_command(export_geth_traces, "export_geth_traces")
 cli.add_command(extract_geth_traces, "extract_geth_traces")
 cli.add_command(extract_contracts, "extract_contracts")
 cli.add_command(extract_tokens, "extract_tokens")
+cli.add_command(redrive_dead_letters, "redrive_dead_letters")
 
 # streaming
 cli.add_command(stream, "stream")
@@ -31,6 +31,8 @@ from ethereumetl.web3_utils import build_web3
 
 from ethereumetl.jobs.export_all_common import export_all_common
 from ethereumetl.providers.auto import get_provider_from_uri
+from ethereumetl.service.token_cache import open_token_cache, DEFAULT_TOTAL_SUPPLY_REFRESH_BLOCKS
+from ethereumetl.providers.cache import open_rpc_cache, DEFAULT_RPC_CACHE_MAX_SIZE_MB, DEFAULT_FINALITY_DEPTH
 from ethereumetl.service.eth_service import EthService
 from ethereumetl.utils import check_classic_provider_uri
 
@@ -115,10 +117,27 @@ def get_partitions(start, end, partition_batch_size, provider_uri):
 @click.option('-o', '--output-dir', default='output', show_default=True, type=str, help='Output directory, partitioned in Hive style.')
 @click.option('-w', '--max-workers', default=5, show_default=True, type=int, help='The maximum number of workers.')
 @click.option('-B', '--export-batch-size', default=100, show_default=True, type=int, help='The number of requests in JSON RPC batches.')
+@click.option('--rpc-cache', default=None, type=str,
+              help='Path to a SQLite file caching JSON-RPC responses for finalized blocks, '
+                   'so re-exporting the same range doesn\'t fetch them from the node again.')
+@click.option('--rpc-cache-max-size', default=DEFAULT_RPC_CACHE_MAX_SIZE_MB, show_default=True, type=int,
+              help='The maximum size of the RPC cache in megabytes. Least recently used responses are evicted first.')
+@click.option('--rpc-cache-finality-depth', default=DEFAULT_FINALITY_DEPTH, show_default=True, type=int,
+              help='Only responses for blocks at least this many blocks behind the chain head are cached.')
+@click.option('--token-cache', default=None, type=str,
+              help='Path to a SQLite file caching token metadata across runs, '
+                   'so tokens already in it aren\'t requested from the node again.')
+@click.option('--token-cache-refresh-blocks', default=DEFAULT_TOTAL_SUPPLY_REFRESH_BLOCKS, show_default=True, type=int,
+              help='The total supply of a cached token is read again once the chain head is this many blocks further.')
 @click.option('-c', '--chain', default='ethereum', show_default=True, type=str, help='The chain network to connect to.')
 def export_all(start, end, partition_batch_size, provider_uri, output_dir, max_workers, export_batch_size,
-               chain='ethereum'):
+               rpc_cache=None, rpc_cache_max_size=DEFAULT_RPC_CACHE_MAX_SIZE_MB,
+               rpc_cache_finality_depth=DEFAULT_FINALITY_DEPTH, token_cache=None,
+               token_cache_refresh_blocks=DEFAULT_TOTAL_SUPPLY_REFRESH_BLOCKS, chain='ethereum'):
     """Exports all data for a range of blocks."""
     provider_uri = check_classic_provider_uri(chain, provider_uri)
+    rpc_cache = open_rpc_cache(rpc_cache, rpc_cache_max_size, rpc_cache_finality_depth)
+    token_cache = open_token_cache(token_cache, token_cache_refresh_blocks)
     export_all_common(get_partitions(start, end, partition_batch_size, provider_uri),
-                      output_dir, provider_uri, max_workers, export_batch_size)
+                      output_dir, provider_uri, max_workers, export_batch_size, rpc_cache=rpc_cache,
+                      token_cache=token_cache)
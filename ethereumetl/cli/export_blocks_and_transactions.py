@@ -23,10 +23,13 @@
 
 import click
 
+from ethereumetl.executors.batch_weights import get_block_weights
+from ethereumetl.executors.progress_ledger import open_progress_ledger
 from ethereumetl.jobs.export_blocks_job import ExportBlocksJob
 from ethereumetl.jobs.exporters.blocks_and_transactions_item_exporter import blocks_and_transactions_item_exporter
 from blockchainetl.logging_utils import logging_basic_config
-from ethereumetl.providers.auto import get_provider_from_uri
+from ethereumetl.providers.auto import get_provider_from_uri, get_async_provider_from_uri
+from ethereumetl.providers.cache import open_rpc_cache, DEFAULT_RPC_CACHE_MAX_SIZE_MB, DEFAULT_FINALITY_DEPTH
 from ethereumetl.thread_local_proxy import ThreadLocalProxy
 from ethereumetl.utils import check_classic_provider_uri
 
@@ -41,26 +44,79 @@ logging_basic_config()
               help='The URI of the web3 provider e.g. '
                    'file://$HOME/Library/Ethereum/geth.ipc or https://mainnet.infura.io')
 @click.option('-w', '--max-workers', default=5, show_default=True, type=int, help='The maximum number of workers.')
+@click.option('--cpu-workers', default=None, type=int,
+              help='The number of worker processes for decoding and mapping responses. '
+                   'By default they are mapped in the worker threads.')
 @click.option('--blocks-output', default=None, show_default=True, type=str,
               help='The output file for blocks. If not provided blocks will not be exported. Use "-" for stdout')
 @click.option('--transactions-output', default=None, show_default=True, type=str,
               help='The output file for transactions. '
                    'If not provided transactions will not be exported. Use "-" for stdout')
+@click.option('--async', 'use_async', is_flag=True, default=False,
+              help='Run batches on a single asyncio event loop, --max-workers is then the number of batches in flight. '
+                   'Only http and https provider URIs are supported.')
+@click.option('--rpc-cache', default=None, type=str,
+              help='Path to a SQLite file caching JSON-RPC responses for finalized blocks, '
+                   'so re-exporting the same range doesn\'t fetch them from the node again.')
+@click.option('--rpc-cache-max-size', default=DEFAULT_RPC_CACHE_MAX_SIZE_MB, show_default=True, type=int,
+              help='The maximum size of the RPC cache in megabytes. Least recently used responses are evicted first.')
+@click.option('--rpc-cache-finality-depth', default=DEFAULT_FINALITY_DEPTH, show_default=True, type=int,
+              help='Only responses for blocks at least this many blocks behind the chain head are cached.')
+@click.option('--ordered', is_flag=True, default=False,
+              help='Write the items sorted by block number. Finished batches wait in a bounded buffer '
+                   'until all earlier batches are written.')
+@click.option('--resume', is_flag=True, default=False,
+              help='Record the completed blocks in a progress file and continue an interrupted export from it. '
+                   'Blocks completed before the last checkpoint are skipped and the output files are appended to.')
+@click.option('--progress-file', default=None, type=str,
+              help='The file recording the completed blocks, written atomically every few seconds. '
+                   'By default it\'s the first output file name with a .progress.json suffix, used with --resume.')
+@click.option('--block-weights', default=None, type=str,
+              help='A blocks file exported before, csv or json. Batches are packed by the transaction_count '
+                   'of the blocks, so busy blocks are sent in smaller batches than empty ones.')
+@click.option('--prefetch-block-weights', is_flag=True, default=False,
+              help='Fetch the transaction count of each block first and pack batches by it, see --block-weights.')
 @click.option('-c', '--chain', default='ethereum', show_default=True, type=str, help='The chain network to connect to.')
 def export_blocks_and_transactions(start_block, end_block, batch_size, provider_uri, max_workers, blocks_output,
-                                   transactions_output, chain='ethereum'):
+                                   transactions_output, use_async=False, rpc_cache=None,
+                                   rpc_cache_max_size=DEFAULT_RPC_CACHE_MAX_SIZE_MB,
+                                   rpc_cache_finality_depth=DEFAULT_FINALITY_DEPTH, cpu_workers=None, ordered=False,
+                                   resume=False, progress_file=None, block_weights=None, prefetch_block_weights=False,
+                                   chain='ethereum'):
     """Exports blocks and transactions."""
     provider_uri = check_classic_provider_uri(chain, provider_uri)
     if blocks_output is None and transactions_output is None:
         raise ValueError('Either --blocks-output or --transactions-output options must be provided')
 
+    progress_ledger = open_progress_ledger(
+        progress_file, [blocks_output, transactions_output], resume=resume, work_range=(start_block, end_block))
+    file_offsets = progress_ledger.file_offsets if resume else None
+
+    rpc_cache = open_rpc_cache(rpc_cache, rpc_cache_max_size, rpc_cache_finality_depth)
+
+    if use_async:
+        batch_web3_provider = get_async_provider_from_uri(provider_uri, rpc_cache=rpc_cache)
+    else:
+        batch_web3_provider = ThreadLocalProxy(
+            lambda: get_provider_from_uri(provider_uri, batch=True, rpc_cache=rpc_cache))
+
+    block_weights = get_block_weights(
+        block_weights, prefetch_block_weights,
+        ThreadLocalProxy(lambda: get_provider_from_uri(provider_uri, batch=True)),
+        start_block, end_block, max_workers)
+
     job = ExportBlocksJob(
         start_block=start_block,
         end_block=end_block,
         batch_size=batch_size,
-        batch_web3_provider=ThreadLocalProxy(lambda: get_provider_from_uri(provider_uri, batch=True)),
+        batch_web3_provider=batch_web3_provider,
         max_workers=max_workers,
-        item_exporter=blocks_and_transactions_item_exporter(blocks_output, transactions_output),
+        cpu_workers=cpu_workers,
+        item_exporter=blocks_and_transactions_item_exporter(blocks_output, transactions_output, file_offsets),
         export_blocks=blocks_output is not None,
-        export_transactions=transactions_output is not None)
+        export_transactions=transactions_output is not None,
+        use_async=use_async,
+        ordered=ordered,
+        progress_ledger=progress_ledger,
+        block_weights=block_weights)
     job.run()
@@ -28,7 +28,7 @@ from ethereumetl.jobs.export_contracts_job import ExportContractsJob
 from ethereumetl.jobs.exporters.contracts_item_exporter import contracts_item_exporter
 from blockchainetl.logging_utils import logging_basic_config
 from ethereumetl.thread_local_proxy import ThreadLocalProxy
-from ethereumetl.providers.auto import get_provider_from_uri
+from ethereumetl.providers.auto import get_provider_from_uri, get_async_provider_from_uri
 from ethereumetl.utils import check_classic_provider_uri
 
 logging_basic_config()
@@ -40,21 +40,39 @@ logging_basic_config()
               help='The file containing contract addresses, one per line.')
 @click.option('-o', '--output', default='-', show_default=True, type=str, help='The output file. If not specified stdout is used.')
 @click.option('-w', '--max-workers', default=5, show_default=True, type=int, help='The maximum number of workers.')
+@click.option('--cpu-workers', default=None, type=int,
+              help='The number of worker processes for decoding and mapping responses. '
+                   'By default they are mapped in the worker threads.')
+@click.option('--bytecode-memo', default=None, type=str,
+              help='Path to a SQLite file memoizing the sighashes and ERC20/ERC721 flags by bytecode hash across runs. '
+                   'Identical bytecodes are classified once either way.')
 @click.option('-p', '--provider-uri', default='https://mainnet.infura.io', show_default=True, type=str,
               help='The URI of the web3 provider e.g. '
                    'file://$HOME/Library/Ethereum/geth.ipc or https://mainnet.infura.io')
+@click.option('--async', 'use_async', is_flag=True, default=False,
+              help='Run batches on a single asyncio event loop, --max-workers is then the number of batches in flight. '
+                   'Only http and https provider URIs are supported.')
 @click.option('-c', '--chain', default='ethereum', show_default=True, type=str, help='The chain network to connect to.')
-def export_contracts(batch_size, contract_addresses, output, max_workers, provider_uri, chain='ethereum'):
+def export_contracts(batch_size, contract_addresses, output, max_workers, provider_uri, use_async=False,
+                     cpu_workers=None, bytecode_memo=None, chain='ethereum'):
     """Exports contracts bytecode and sighashes."""
     check_classic_provider_uri(chain, provider_uri)
+    if use_async:
+        batch_web3_provider = get_async_provider_from_uri(provider_uri)
+    else:
+        batch_web3_provider = ThreadLocalProxy(lambda: get_provider_from_uri(provider_uri, batch=True))
+
     with smart_open(contract_addresses, 'r') as contract_addresses_file:
         contract_addresses = (contract_address.strip() for contract_address in contract_addresses_file
                               if contract_address.strip())
         job = ExportContractsJob(
             contract_addresses_iterable=contract_addresses,
             batch_size=batch_size,
-            batch_web3_provider=ThreadLocalProxy(lambda: get_provider_from_uri(provider_uri, batch=True)),
+            batch_web3_provider=batch_web3_provider,
             item_exporter=contracts_item_exporter(output),
-            max_workers=max_workers)
+            max_workers=max_workers,
+            cpu_workers=cpu_workers,
+            use_async=use_async,
+            bytecode_memo_path=bytecode_memo)
 
         job.run()
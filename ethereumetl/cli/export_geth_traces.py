@@ -26,7 +26,8 @@ import click
 from ethereumetl.jobs.export_geth_traces_job import ExportGethTracesJob
 from ethereumetl.jobs.exporters.geth_traces_item_exporter import geth_traces_item_exporter
 from blockchainetl.logging_utils import logging_basic_config
-from ethereumetl.providers.auto import get_provider_from_uri
+from ethereumetl.providers.auto import get_provider_from_uri, get_async_provider_from_uri
+from ethereumetl.providers.cache import open_rpc_cache, DEFAULT_RPC_CACHE_MAX_SIZE_MB, DEFAULT_FINALITY_DEPTH
 from ethereumetl.thread_local_proxy import ThreadLocalProxy
 
 logging_basic_config()
@@ -39,17 +40,41 @@ logging_basic_config()
 @click.option('-o', '--output', default='-', show_default=True, type=str,
               help='The output file for geth traces. If not specified stdout is used.')
 @click.option('-w', '--max-workers', default=5, show_default=True, type=int, help='The maximum number of workers.')
+@click.option('--cpu-workers', default=None, type=int,
+              help='The number of worker processes for decoding and mapping responses. '
+                   'By default they are mapped in the worker threads.')
 @click.option('-p', '--provider-uri', required=True, type=str,
               help='The URI of the web3 provider e.g. '
                    'file://$HOME/Library/Ethereum/geth.ipc or http://localhost:8545/')
-def export_geth_traces(start_block, end_block, batch_size, output, max_workers, provider_uri):
+@click.option('--async', 'use_async', is_flag=True, default=False,
+              help='Run batches on a single asyncio event loop, --max-workers is then the number of batches in flight. '
+                   'Only http and https provider URIs are supported.')
+@click.option('--rpc-cache', default=None, type=str,
+              help='Path to a SQLite file caching JSON-RPC responses for finalized blocks, '
+                   'so re-exporting the same range doesn\'t fetch them from the node again.')
+@click.option('--rpc-cache-max-size', default=DEFAULT_RPC_CACHE_MAX_SIZE_MB, show_default=True, type=int,
+              help='The maximum size of the RPC cache in megabytes. Least recently used responses are evicted first.')
+@click.option('--rpc-cache-finality-depth', default=DEFAULT_FINALITY_DEPTH, show_default=True, type=int,
+              help='Only responses for blocks at least this many blocks behind the chain head are cached.')
+def export_geth_traces(start_block, end_block, batch_size, output, max_workers, provider_uri, use_async=False,
+                       rpc_cache=None, rpc_cache_max_size=DEFAULT_RPC_CACHE_MAX_SIZE_MB,
+                       rpc_cache_finality_depth=DEFAULT_FINALITY_DEPTH, cpu_workers=None):
     """Exports traces from geth node."""
+    rpc_cache = open_rpc_cache(rpc_cache, rpc_cache_max_size, rpc_cache_finality_depth)
+    if use_async:
+        batch_web3_provider = get_async_provider_from_uri(provider_uri, rpc_cache=rpc_cache)
+    else:
+        batch_web3_provider = ThreadLocalProxy(
+            lambda: get_provider_from_uri(provider_uri, batch=True, rpc_cache=rpc_cache))
+
     job = ExportGethTracesJob(
         start_block=start_block,
         end_block=end_block,
         batch_size=batch_size,
-        batch_web3_provider=ThreadLocalProxy(lambda: get_provider_from_uri(provider_uri, batch=True)),
+        batch_web3_provider=batch_web3_provider,
         max_workers=max_workers,
-        item_exporter=geth_traces_item_exporter(output))
+        cpu_workers=cpu_workers,
+        item_exporter=geth_traces_item_exporter(output),
+        use_async=use_async)
 
     job.run()
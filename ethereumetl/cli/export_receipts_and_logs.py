@@ -24,20 +24,26 @@
 import click
 
 from blockchainetl.file_utils import smart_open
+from ethereumetl.executors.batch_weights import get_block_weights
 from ethereumetl.jobs.export_receipts_job import ExportReceiptsJob
 from ethereumetl.jobs.exporters.receipts_and_logs_item_exporter import receipts_and_logs_item_exporter
 from blockchainetl.logging_utils import logging_basic_config
 from ethereumetl.thread_local_proxy import ThreadLocalProxy
-from ethereumetl.providers.auto import get_provider_from_uri
+from ethereumetl.providers.auto import get_provider_from_uri, get_async_provider_from_uri
+from ethereumetl.providers.cache import open_rpc_cache, DEFAULT_RPC_CACHE_MAX_SIZE_MB, DEFAULT_FINALITY_DEPTH
 from ethereumetl.utils import check_classic_provider_uri
 
 logging_basic_config()
 
 
 @click.command(context_settings=dict(help_option_names=['-h', '--help']))
-@click.option('-b', '--batch-size', default=100, show_default=True, type=int, help='The number of receipts to export at a time.')
-@click.option('-t', '--transaction-hashes', required=True, type=str,
+@click.option('-b', '--batch-size', default=100, show_default=True, type=int, help='The number of receipts, or blocks with --start-block, to export at a time.')
+@click.option('-t', '--transaction-hashes', default=None, type=str,
               help='The file containing transaction hashes, one per line.')
+@click.option('-s', '--start-block', default=None, type=int,
+              help='Start block. Exports receipts of whole blocks instead of --transaction-hashes.')
+@click.option('-e', '--end-block', default=None, type=int,
+              help='End block. Exports receipts of whole blocks instead of --transaction-hashes.')
 @click.option('-p', '--provider-uri', default='https://mainnet.infura.io', show_default=True, type=str,
               help='The URI of the web3 provider e.g. '
                    'file://$HOME/Library/Ethereum/geth.ipc or https://mainnet.infura.io')
@@ -47,19 +53,75 @@ logging_basic_config()
 @click.option('--logs-output', default=None, show_default=True, type=str,
               help='The output file for receipt logs. '
                    'If not provided receipt logs will not be exported. Use "-" for stdout')
+@click.option('--async', 'use_async', is_flag=True, default=False,
+              help='Run batches on a single asyncio event loop, --max-workers is then the number of batches in flight. '
+                   'Only http and https provider URIs are supported.')
+@click.option('--rpc-cache', default=None, type=str,
+              help='Path to a SQLite file caching JSON-RPC responses for finalized blocks, '
+                   'so re-exporting the same range doesn\'t fetch them from the node again.')
+@click.option('--rpc-cache-max-size', default=DEFAULT_RPC_CACHE_MAX_SIZE_MB, show_default=True, type=int,
+              help='The maximum size of the RPC cache in megabytes. Least recently used responses are evicted first.')
+@click.option('--rpc-cache-finality-depth', default=DEFAULT_FINALITY_DEPTH, show_default=True, type=int,
+              help='Only responses for blocks at least this many blocks behind the chain head are cached.')
+@click.option('--ordered', is_flag=True, default=False,
+              help='Write the items in the order of the blocks or transaction hashes. '
+                   'Finished batches wait in a bounded buffer until all earlier batches are written.')
+@click.option('--block-weights', default=None, type=str,
+              help='With --start-block, a blocks file exported before, csv or json. Batches are packed by the transaction_count '
+                   'of the blocks, so busy blocks are sent in smaller batches than empty ones.')
+@click.option('--prefetch-block-weights', is_flag=True, default=False,
+              help='Fetch the transaction count of each block first and pack batches by it, see --block-weights.')
 @click.option('-c', '--chain', default='ethereum', show_default=True, type=str, help='The chain network to connect to.')
-def export_receipts_and_logs(batch_size, transaction_hashes, provider_uri, max_workers, receipts_output, logs_output,
-                             chain='ethereum'):
+def export_receipts_and_logs(batch_size, transaction_hashes, start_block, end_block, provider_uri, max_workers,
+                             receipts_output, logs_output, use_async=False, rpc_cache=None,
+                             rpc_cache_max_size=DEFAULT_RPC_CACHE_MAX_SIZE_MB,
+                             rpc_cache_finality_depth=DEFAULT_FINALITY_DEPTH, ordered=False, block_weights=None,
+                             prefetch_block_weights=False, chain='ethereum'):
     """Exports receipts and logs."""
     provider_uri = check_classic_provider_uri(chain, provider_uri)
+    rpc_cache = open_rpc_cache(rpc_cache, rpc_cache_max_size, rpc_cache_finality_depth)
+    if use_async:
+        batch_web3_provider = get_async_provider_from_uri(provider_uri, rpc_cache=rpc_cache)
+    else:
+        batch_web3_provider = ThreadLocalProxy(
+            lambda: get_provider_from_uri(provider_uri, batch=True, rpc_cache=rpc_cache))
+
+    if start_block is not None or end_block is not None:
+        if start_block is None or end_block is None:
+            raise click.BadOptionUsage('--start-block', '--start-block and --end-block must be provided together')
+        block_weights = get_block_weights(
+            block_weights, prefetch_block_weights,
+            ThreadLocalProxy(lambda: get_provider_from_uri(provider_uri, batch=True)),
+            start_block, end_block, max_workers)
+        job = ExportReceiptsJob(
+            transaction_hashes_iterable=None,
+            start_block=start_block,
+            end_block=end_block,
+            batch_size=batch_size,
+            batch_web3_provider=batch_web3_provider,
+            max_workers=max_workers,
+            item_exporter=receipts_and_logs_item_exporter(receipts_output, logs_output),
+            export_receipts=receipts_output is not None,
+            export_logs=logs_output is not None,
+            use_async=use_async,
+            ordered=ordered,
+            block_weights=block_weights)
+        job.run()
+        return
+
+    if transaction_hashes is None:
+        raise click.BadOptionUsage('--transaction-hashes',
+                                   'Either --transaction-hashes or --start-block and --end-block must be provided')
     with smart_open(transaction_hashes, 'r') as transaction_hashes_file:
         job = ExportReceiptsJob(
             transaction_hashes_iterable=(transaction_hash.strip() for transaction_hash in transaction_hashes_file),
             batch_size=batch_size,
-            batch_web3_provider=ThreadLocalProxy(lambda: get_provider_from_uri(provider_uri, batch=True)),
+            batch_web3_provider=batch_web3_provider,
             max_workers=max_workers,
             item_exporter=receipts_and_logs_item_exporter(receipts_output, logs_output),
             export_receipts=receipts_output is not None,
-            export_logs=logs_output is not None)
+            export_logs=logs_output is not None,
+            use_async=use_async,
+            ordered=ordered)
 
         job.run()
@@ -30,6 +30,7 @@ from ethereumetl.jobs.export_token_transfers_job import ExportTokenTransfersJob
 from ethereumetl.jobs.exporters.token_transfers_item_exporter import token_transfers_item_exporter
 from blockchainetl.logging_utils import logging_basic_config
 from ethereumetl.providers.auto import get_provider_from_uri
+from ethereumetl.service.log_density import DEFAULT_MAX_LOGS_PER_REQUEST
 from ethereumetl.thread_local_proxy import ThreadLocalProxy
 
 logging_basic_config()
@@ -44,7 +45,11 @@ logging_basic_config()
 @click.option('-p', '--provider-uri', required=True, type=str,
               help='The URI of the web3 provider e.g. file://$HOME/Library/Ethereum/geth.ipc or http://localhost:8545/')
 @click.option('-t', '--tokens', default=None, show_default=True, type=str, multiple=True, help='The list of token addresses to filter by.')
-def export_token_transfers(start_block, end_block, batch_size, output, max_workers, provider_uri, tokens):
+@click.option('--max-logs-per-request', default=DEFAULT_MAX_LOGS_PER_REQUEST, show_default=True, type=int,
+              help='The maximum number of logs the provider returns for one eth_getLogs request. '
+                   'Block ranges are sized to stay under it.')
+def export_token_transfers(start_block, end_block, batch_size, output, max_workers, provider_uri, tokens,
+                           max_logs_per_request=DEFAULT_MAX_LOGS_PER_REQUEST):
     """Exports ERC20/ERC721 transfers."""
     set_max_field_size_limit()
     job = ExportTokenTransfersJob(
@@ -54,5 +59,6 @@ def export_token_transfers(start_block, end_block, batch_size, output, max_worke
         web3=ThreadLocalProxy(lambda: build_web3(get_provider_from_uri(provider_uri))),
         item_exporter=token_transfers_item_exporter(output),
         max_workers=max_workers,
-        tokens=tokens)
+        tokens=tokens,
+        max_logs_per_request=max_logs_per_request)
     job.run()
@@ -26,12 +26,13 @@ import click
 from ethereumetl.web3_utils import build_web3
 
 from blockchainetl.file_utils import smart_open
-from ethereumetl.jobs.export_tokens_job import ExportTokensJob
+from ethereumetl.jobs.export_tokens_job import ExportTokensJob, DEFAULT_TOKEN_BATCH_SIZE
 from ethereumetl.jobs.exporters.tokens_item_exporter import tokens_item_exporter
 from blockchainetl.logging_utils import logging_basic_config
 from ethereumetl.thread_local_proxy import ThreadLocalProxy
 from ethereumetl.providers.auto import get_provider_from_uri
 from ethereumetl.utils import check_classic_provider_uri
+from ethereumetl.service.token_cache import open_token_cache, DEFAULT_TOTAL_SUPPLY_REFRESH_BLOCKS
 
 logging_basic_config()
 
@@ -41,18 +42,29 @@ logging_basic_config()
               help='The file containing token addresses, one per line.')
 @click.option('-o', '--output', default='-', show_default=True, type=str, help='The output file. If not specified stdout is used.')
 @click.option('-w', '--max-workers', default=5, show_default=True, type=int, help='The maximum number of workers.')
+@click.option('-b', '--batch-size', default=DEFAULT_TOKEN_BATCH_SIZE, show_default=True, type=int,
+              help='The number of tokens to get the metadata for in one batch.')
 @click.option('-p', '--provider-uri', default='https://mainnet.infura.io', show_default=True, type=str,
               help='The URI of the web3 provider e.g. '
                    'file://$HOME/Library/Ethereum/geth.ipc or https://mainnet.infura.io')
+@click.option('--token-cache', default=None, type=str,
+              help='Path to a SQLite file caching token metadata across runs, '
+                   'so tokens already in it aren\'t requested from the node again.')
+@click.option('--token-cache-refresh-blocks', default=DEFAULT_TOTAL_SUPPLY_REFRESH_BLOCKS, show_default=True, type=int,
+              help='The total supply of a cached token is read again once the chain head is this many blocks further.')
 @click.option('-c', '--chain', default='ethereum', show_default=True, type=str, help='The chain network to connect to.')
-def export_tokens(token_addresses, output, max_workers, provider_uri, chain='ethereum'):
+def export_tokens(token_addresses, output, max_workers, provider_uri, chain='ethereum',
+                  batch_size=DEFAULT_TOKEN_BATCH_SIZE, token_cache=None,
+                  token_cache_refresh_blocks=DEFAULT_TOTAL_SUPPLY_REFRESH_BLOCKS):
     """Exports ERC20/ERC721 tokens."""
     provider_uri = check_classic_provider_uri(chain, provider_uri)
     with smart_open(token_addresses, 'r') as token_addresses_file:
         job = ExportTokensJob(
             token_addresses_iterable=(token_address.strip() for token_address in token_addresses_file),
-            web3=ThreadLocalProxy(lambda: build_web3(get_provider_from_uri(provider_uri))),
+            web3=ThreadLocalProxy(lambda: build_web3(get_provider_from_uri(provider_uri, batch=True))),
             item_exporter=tokens_item_exporter(output),
-            max_workers=max_workers)
+            max_workers=max_workers,
+            batch_size=batch_size,
+            token_cache=open_token_cache(token_cache, token_cache_refresh_blocks))
 
         job.run()
@@ -25,6 +25,7 @@ import click
 
 from ethereumetl.web3_utils import build_web3
 
+from ethereumetl.executors.progress_ledger import open_progress_ledger
 from ethereumetl.jobs.export_traces_job import ExportTracesJob
 from blockchainetl.logging_utils import logging_basic_config
 from ethereumetl.providers.auto import get_provider_from_uri
@@ -46,21 +47,38 @@ logging_basic_config()
 @click.option('--genesis-traces/--no-genesis-traces', default=False, show_default=True, help='Whether to include genesis traces')
 @click.option('--daofork-traces/--no-daofork-traces', default=False, show_default=True, help='Whether to include daofork traces')
 @click.option('-t', '--timeout', default=60, show_default=True, type=int, help='IPC or HTTP request timeout.')
+@click.option('--resume', is_flag=True, default=False,
+              help='Record the completed blocks in a progress file and continue an interrupted export from it. '
+                   'Blocks completed before the last checkpoint are skipped and the output files are appended to.')
+@click.option('--progress-file', default=None, type=str,
+              help='The file recording the completed blocks, written atomically every few seconds. '
+                   'By default it\'s the first output file name with a .progress.json suffix, used with --resume.')
+@click.option('--trace-filter', is_flag=True, default=False,
+              help='Trace each batch of blocks with one trace_filter call instead of a trace_block call per block. '
+                   'Falls back to trace_block if the node doesn\'t support trace_filter.')
 @click.option('-c', '--chain', default='ethereum', show_default=True, type=str, help='The chain network to connect to.')
 def export_traces(start_block, end_block, batch_size, output, max_workers, provider_uri,
-                  genesis_traces, daofork_traces, timeout=60, chain='ethereum'):
+                  genesis_traces, daofork_traces, timeout=60, resume=False, progress_file=None, trace_filter=False,
+                  chain='ethereum'):
     """Exports traces from parity node."""
     if chain == 'classic' and daofork_traces == True:
         raise ValueError(
             'Classic chain does not include daofork traces. Disable daofork traces with --no-daofork-traces option.')
+    progress_ledger = open_progress_ledger(
+        progress_file, [output], resume=resume, work_range=(start_block, end_block))
+    file_offsets = progress_ledger.file_offsets if resume else None
+
     job = ExportTracesJob(
         start_block=start_block,
         end_block=end_block,
         batch_size=batch_size,
         web3=ThreadLocalProxy(lambda: build_web3(get_provider_from_uri(provider_uri, timeout=timeout))),
-        item_exporter=traces_item_exporter(output),
+        item_exporter=traces_item_exporter(output, file_offsets),
         max_workers=max_workers,
         include_genesis_traces=genesis_traces,
-        include_daofork_traces=daofork_traces)
+        include_daofork_traces=daofork_traces,
+        progress_ledger=progress_ledger,
+        batch_web3_provider=ThreadLocalProxy(lambda: get_provider_from_uri(provider_uri, timeout=timeout, batch=True)),
+        use_trace_filter=trace_filter)
 
     job.run()
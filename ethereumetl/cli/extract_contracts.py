@@ -39,7 +39,13 @@ logging_basic_config()
 @click.option('-b', '--batch-size', default=100, show_default=True, type=int, help='The number of blocks to filter at a time.')
 @click.option('-o', '--output', default='-', show_default=True, type=str, help='The output file. If not specified stdout is used.')
 @click.option('-w', '--max-workers', default=5, show_default=True, type=int, help='The maximum number of workers.')
-def extract_contracts(traces, batch_size, output, max_workers):
+@click.option('--cpu-workers', default=None, type=int,
+              help='The number of worker processes for mapping items. '
+                   'By default they are mapped in the worker threads.')
+@click.option('--bytecode-memo', default=None, type=str,
+              help='Path to a SQLite file memoizing the sighashes and ERC20/ERC721 flags by bytecode hash across runs. '
+                   'Identical bytecodes are classified once either way.')
+def extract_contracts(traces, batch_size, output, max_workers, cpu_workers=None, bytecode_memo=None):
     """Extracts contracts from traces file."""
 
     set_max_field_size_limit()
@@ -53,6 +59,8 @@ def extract_contracts(traces, batch_size, output, max_workers):
             traces_iterable=traces_iterable,
             batch_size=batch_size,
             max_workers=max_workers,
-            item_exporter=contracts_item_exporter(output))
+            cpu_workers=cpu_workers,
+            item_exporter=contracts_item_exporter(output),
+            bytecode_memo_path=bytecode_memo)
 
         job.run()
@@ -30,6 +30,7 @@ from blockchainetl.file_utils import smart_open
 from blockchainetl.jobs.exporters.converters.int_to_string_item_converter import IntToStringItemConverter
 from ethereumetl.jobs.exporters.tokens_item_exporter import tokens_item_exporter
 from ethereumetl.jobs.extract_tokens_job import ExtractTokensJob
+from ethereumetl.jobs.export_tokens_job import DEFAULT_TOKEN_BATCH_SIZE
 from blockchainetl.logging_utils import logging_basic_config
 from ethereumetl.providers.auto import get_provider_from_uri
 from ethereumetl.thread_local_proxy import ThreadLocalProxy
@@ -45,8 +46,11 @@ logging_basic_config()
                    'file://$HOME/Library/Ethereum/geth.ipc or https://mainnet.infura.io')
 @click.option('-o', '--output', default='-', show_default=True, type=str, help='The output file. If not specified stdout is used.')
 @click.option('-w', '--max-workers', default=5, show_default=True, type=int, help='The maximum number of workers.')
+@click.option('-b', '--batch-size', default=DEFAULT_TOKEN_BATCH_SIZE, show_default=True, type=int,
+              help='The number of tokens to get the metadata for in one batch.')
 @click.option('--values-as-strings', default=False, show_default=True, is_flag=True, help='Whether to convert values to strings.')
-def extract_tokens(contracts, provider_uri, output, max_workers, values_as_strings=False):
+def extract_tokens(contracts, provider_uri, output, max_workers, values_as_strings=False,
+                   batch_size=DEFAULT_TOKEN_BATCH_SIZE):
     """Extracts tokens from contracts file."""
 
     set_max_field_size_limit()
@@ -59,8 +63,9 @@ def extract_tokens(contracts, provider_uri, output, max_workers, values_as_strin
         converters = [IntToStringItemConverter(keys=['decimals', 'total_supply'])] if values_as_strings else []
         job = ExtractTokensJob(
             contracts_iterable=contracts_iterable,
-            web3=ThreadLocalProxy(lambda: build_web3(get_provider_from_uri(provider_uri))),
+            web3=ThreadLocalProxy(lambda: build_web3(get_provider_from_uri(provider_uri, batch=True))),
             max_workers=max_workers,
-            item_exporter=tokens_item_exporter(output, converters))
+            item_exporter=tokens_item_exporter(output, converters),
+            batch_size=batch_size)
 
         job.run()
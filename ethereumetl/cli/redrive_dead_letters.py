@@ -0,0 +1,54 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import click
+
+from blockchainetl.logging_utils import logging_basic_config
+from ethereumetl.executors.dead_letter import read_dead_letters, set_redrive_filter, RedriveFilter
+
+logging_basic_config()
+
+
+@click.command(context_settings=dict(help_option_names=['-h', '--help'], ignore_unknown_options=True))
+@click.option('-i', '--input', required=True, type=str, help='The dead letters file written with --dead-letters.')
+@click.argument('command_args', nargs=-1, required=True, type=click.UNPROCESSED)
+@click.pass_context
+def redrive_dead_letters(ctx, input, command_args):
+    """Runs a command again for the items in a dead letters file only.
+
+    Pass the command and its options after the dead letters file, e.g.
+
+    \b
+    redrive_dead_letters -i dead_letters.json export_blocks_and_transactions -s 0 -e 1000 --blocks-output blocks.csv
+    """
+    root = ctx.find_root()
+    command_name, args = command_args[0], list(command_args[1:])
+    command = root.command.get_command(root, command_name)
+    if command is None or command_name == ctx.info_name:
+        raise click.BadParameter('{} is not a command that can be re-driven'.format(command_name))
+
+    set_redrive_filter(RedriveFilter(read_dead_letters(input)))
+    try:
+        with command.make_context(command_name, args, parent=root) as command_ctx:
+            command.invoke(command_ctx)
+    finally:
+        set_redrive_filter(None)
@@ -0,0 +1,123 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import logging
+import math
+import threading
+import time
+
+CONTROL_INTERVAL_SECONDS = 5
+# TCP Vegas thresholds for the estimated number of batches queued at the node
+MIN_QUEUED_BATCHES = 1
+MAX_QUEUED_BATCHES = 3
+# The base latency slowly drifts up to the observed latency, so the controller adapts when the node gets slower
+BASE_LATENCY_DRIFT = 0.05
+BATCH_SIZE_INCREASE_RATIO = 0.1
+
+
+class AdaptiveController:
+    """Tunes the batch size and the number of batches in flight from the measured latency and throughput.
+
+    Both are halved when a batch fails, at most once per round trip (AIMD). Otherwise every
+    CONTROL_INTERVAL_SECONDS the number of batches queued at the node is estimated from the per item latency
+    as in TCP Vegas: concurrency * (1 - base_latency / latency). When it's low the batch size is increased
+    additively up to max_batch_size and then the concurrency by one up to max_concurrency. When it's high
+    the concurrency is decreased by one.
+    """
+
+    def __init__(self, max_batch_size, max_concurrency, clock=time.monotonic):
+        self.max_batch_size = max_batch_size
+        self.max_concurrency = max_concurrency
+        self.batch_size = max_batch_size
+        self.concurrency = max_concurrency
+        # Items per second and seconds per item in the last control interval
+        self.throughput = None
+        self.latency = None
+        self.base_latency = None
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._interval_started_at = clock()
+        self._interval_items = 0
+        self._interval_duration = 0.0
+        self._latest_decrease_time = None
+        self.logger = logging.getLogger('AdaptiveController')
+
+    def on_success(self, item_count, duration):
+        if item_count == 0:
+            return
+        with self._lock:
+            self._interval_items += item_count
+            self._interval_duration += duration
+            now = self._clock()
+            elapsed = now - self._interval_started_at
+            if elapsed >= CONTROL_INTERVAL_SECONDS:
+                self._adjust(elapsed)
+                self._start_interval(now)
+
+    def on_failure(self, item_count, duration):
+        with self._lock:
+            now = self._clock()
+            # Batches in flight when the node started failing fail as well, they shouldn't decrease again
+            if self._latest_decrease_time is not None and now - self._latest_decrease_time < duration:
+                return
+            self._latest_decrease_time = now
+            new_batch_size = max(1, self.batch_size // 2)
+            new_concurrency = max(1, math.ceil(self.concurrency / 2))
+            if new_batch_size != self.batch_size or new_concurrency != self.concurrency:
+                self.logger.info('Reducing batch size to {} and concurrency to {}.'.format(
+                    new_batch_size, new_concurrency))
+            self.batch_size = new_batch_size
+            self.concurrency = new_concurrency
+            self._start_interval(now)
+
+    def describe(self):
+        description = 'Batch size is {}, concurrency is {}'.format(self.batch_size, self.concurrency)
+        throughput = self.throughput
+        if throughput is not None:
+            description += ', throughput is {:.1f} items/s'.format(throughput)
+        return description + '.'
+
+    def _adjust(self, elapsed):
+        self.throughput = self._interval_items / elapsed
+        self.latency = self._interval_duration / self._interval_items
+        if self.base_latency is None:
+            self.base_latency = self.latency
+        else:
+            self.base_latency = min(self.base_latency * (1 + BASE_LATENCY_DRIFT), self.latency)
+
+        queued_batches = self.concurrency * (1 - self.base_latency / self.latency) if self.latency > 0 else 0
+        if queued_batches < MIN_QUEUED_BATCHES:
+            if self.batch_size < self.max_batch_size:
+                batch_size_step = max(1, int(self.max_batch_size * BATCH_SIZE_INCREASE_RATIO))
+                self.batch_size = min(self.max_batch_size, self.batch_size + batch_size_step)
+                self.logger.debug('Increasing batch size to {}.'.format(self.batch_size))
+            elif self.concurrency < self.max_concurrency:
+                self.concurrency += 1
+                self.logger.debug('Increasing concurrency to {}.'.format(self.concurrency))
+        elif queued_batches > MAX_QUEUED_BATCHES and self.concurrency > 1:
+            self.concurrency -= 1
+            self.logger.debug('Decreasing concurrency to {}.'.format(self.concurrency))
+
+    def _start_interval(self, now):
+        self._interval_started_at = now
+        self._interval_items = 0
+        self._interval_duration = 0.0
@@ -0,0 +1,148 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import asyncio
+import logging
+import time
+
+from aiohttp import ClientError
+
+from ethereumetl.executors.batch_work_executor import BatchWorkExecutor, RETRY_EXCEPTIONS, DEFAULT_MAX_BATCH_BYTES, \
+    MAX_WEIGHTED_BATCH_SIZE_RATIO, map_json_bytes, BATCH_ERRORS, BATCHES_IN_FLIGHT
+from ethereumetl.executors.dead_letter import get_work_handler_name
+from ethereumetl.executors.reorder_buffer import start_batch, end_batch, batch_attempt
+from ethereumetl.providers.async_rpc import close_async_sessions
+from ethereumetl.providers.sized_response import get_raw_response
+
+ASYNC_RETRY_EXCEPTIONS = RETRY_EXCEPTIONS + (ClientError, asyncio.TimeoutError)
+
+
+# Runs coroutine work handlers on a single event loop.
+# max_workers is the maximum number of batches in flight, it can be much higher than the number of threads
+# BatchWorkExecutor is able to handle.
+class AsyncBatchWorkExecutor(BatchWorkExecutor):
+    def __init__(self, starting_batch_size, max_workers, retry_exceptions=ASYNC_RETRY_EXCEPTIONS, max_retries=5,
+                 max_batch_bytes=DEFAULT_MAX_BATCH_BYTES, retry_policy=None, cpu_workers=None, ordered=False,
+                 reorder_buffer_size=None, progress_ledger=None, dead_letter_sink=None, item_weights=None,
+                 max_weighted_batch_size_ratio=MAX_WEIGHTED_BATCH_SIZE_RATIO):
+        super().__init__(starting_batch_size, max_workers, retry_exceptions=retry_exceptions, max_retries=max_retries,
+                         max_batch_bytes=max_batch_bytes, retry_policy=retry_policy, cpu_workers=cpu_workers,
+                         ordered=ordered, reorder_buffer_size=reorder_buffer_size, progress_ledger=progress_ledger,
+                         dead_letter_sink=dead_letter_sink, item_weights=item_weights,
+                         max_weighted_batch_size_ratio=max_weighted_batch_size_ratio)
+        self.logger = logging.getLogger('AsyncBatchWorkExecutor')
+
+    def _create_executor(self):
+        # Batches run as tasks on the event loop, there is no thread pool
+        return None
+
+    def execute(self, work_iterable, work_handler, total_items=None):
+        work_iterable, total_items = self._filter_work(work_iterable, work_handler, total_items)
+        self.progress_logger.start(total_items=total_items)
+        self.job_name = get_work_handler_name(work_handler)
+        asyncio.run(self._execute(work_iterable, work_handler))
+
+    async def _execute(self, work_iterable, work_handler):
+        pending = set()
+        failures = []
+
+        def on_done(task):
+            pending.discard(task)
+            if not task.cancelled() and task.exception() is not None:
+                failures.append(task.exception())
+
+        try:
+            for batch in self._iterate_batches(work_iterable):
+                self._update_metrics()
+                BATCHES_IN_FLIGHT.labels(self.job_name).set(len(pending))
+                await self.retry_policy.wait_for_endpoints_async()
+                while len(pending) >= self.controller.concurrency or self._is_reorder_buffer_full():
+                    await asyncio.wait(set(pending), return_when=asyncio.FIRST_COMPLETED)
+                # Fail fast in case of errors, same as FailSafeExecutor
+                if failures:
+                    raise failures[0]
+                sequence = self.reorder_buffer.reserve() if self.reorder_buffer is not None else None
+                task = asyncio.ensure_future(self._fail_safe_execute(work_handler, batch, sequence))
+                pending.add(task)
+                task.add_done_callback(on_done)
+            if pending:
+                await asyncio.wait(set(pending))
+            if failures:
+                raise failures[0]
+        finally:
+            for task in set(pending):
+                task.cancel()
+            await close_async_sessions()
+
+    def _is_reorder_buffer_full(self):
+        # The oldest batch is still pending when the buffer is full, so waiting for pending tasks frees it up
+        return self.reorder_buffer is not None and self.reorder_buffer.is_full()
+
+    async def _fail_safe_execute(self, work_handler, batch, sequence=None):
+        # Runs in its own task, so the batch items are not shared with other batches
+        batch_items = start_batch() if self._collects_batch_items() else None
+        completed = False
+        try:
+            start_time = time.time()
+            self.retry_policy.record_request()
+            try:
+                await self._attempt_async(work_handler, batch)
+                self.controller.on_success(len(batch), time.time() - start_time)
+            except self.batch_fallback_exceptions:
+                BATCH_ERRORS.labels(get_work_handler_name(work_handler)).inc()
+                self.logger.exception('An exception occurred while executing work_handler.')
+                self.controller.on_failure(len(batch), time.time() - start_time)
+                self.logger.info('The batch of size {} will be retried one item at a time.'.format(len(batch)))
+                for item in batch:
+                    try:
+                        await self.retry_policy.execute_with_retries_async(
+                            self._attempt_async, work_handler, [item],
+                            max_retries=self.max_retries, retry_exceptions=self.retry_exceptions)
+                    except Exception as e:
+                        self._dead_letter(work_handler, item, e)
+
+            self.progress_logger.track(len(batch))
+            completed = True
+        finally:
+            if batch_items is not None:
+                end_batch()
+                self._complete_batch(sequence, batch, batch_items if completed else None)
+
+    @staticmethod
+    async def _attempt_async(work_handler, batch):
+        with batch_attempt():
+            await work_handler(batch)
+
+    async def map_in_cpu_stage_async(self, mapper, data, *args):
+        """Same as map_in_cpu_stage, without blocking the event loop while the process pool works."""
+        if self.cpu_executor is None:
+            return mapper(data, *args)
+        return await asyncio.wrap_future(
+            self.cpu_executor.submit(map_json_bytes, mapper, get_raw_response(data), *args))
+
+    def shutdown(self):
+        self._checkpoint()
+        self._shutdown_cpu_executor()
+        self._remove_metrics()
+        self.progress_logger.finish()
+
@@ -0,0 +1,103 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import csv
+import logging
+
+from blockchainetl import json_codec
+from blockchainetl.csv_utils import set_max_field_size_limit
+from blockchainetl.file_utils import smart_open
+from ethereumetl.executors.batch_work_executor import BatchWorkExecutor
+from ethereumetl.json_rpc_requests import generate_get_block_by_number_json_rpc
+from ethereumetl.providers.batch_request import make_batch_request
+from ethereumetl.utils import rpc_response_batch_to_results, hex_to_dec
+
+# The work for a block besides its transactions, in transactions
+BLOCK_BASE_WEIGHT = 1
+DEFAULT_PREFETCH_BATCH_SIZE = 100
+
+logger = logging.getLogger('BatchWeights')
+
+
+# The expected work for each block, its transaction count plus BLOCK_BASE_WEIGHT, so BatchWorkExecutor can
+# pack batches with similar amounts of work. Blocks with an unknown transaction count weigh as much as
+# the mean block.
+class BlockWeights:
+    def __init__(self, transaction_counts):
+        self.weights = {block_number: BLOCK_BASE_WEIGHT + transaction_count
+                        for block_number, transaction_count in transaction_counts.items()}
+        self.mean_weight = sum(self.weights.values()) / len(self.weights) if self.weights else BLOCK_BASE_WEIGHT
+
+    def get_weight(self, block_number):
+        return self.weights.get(block_number, self.mean_weight)
+
+    def __len__(self):
+        return len(self.weights)
+
+
+def read_block_weights(blocks_file):
+    """Reads the transaction counts from a blocks file exported by export_blocks_and_transactions, csv or json."""
+    transaction_counts = {}
+    with smart_open(blocks_file, 'r') as file:
+        if blocks_file.endswith('.json'):
+            rows = (json_codec.loads_item(line) for line in file if line.strip())
+        else:
+            set_max_field_size_limit()
+            rows = csv.DictReader(file)
+        for row in rows:
+            transaction_counts[int(row['number'])] = int(row['transaction_count'])
+    logger.info('Read the transaction counts of {} blocks from {}.'.format(len(transaction_counts), blocks_file))
+    return BlockWeights(transaction_counts)
+
+
+def prefetch_block_weights(batch_web3_provider, start_block, end_block, max_workers,
+                           batch_size=DEFAULT_PREFETCH_BATCH_SIZE):
+    """Fetches the transaction counts of the blocks in the range.
+
+    Blocks are requested without transaction objects, so the responses only have the transaction hashes and are
+    a small fraction of the size of the blocks.
+    """
+    transaction_counts = {}
+
+    def prefetch_batch(block_number_batch):
+        response = make_batch_request(
+            batch_web3_provider, list(generate_get_block_by_number_json_rpc(block_number_batch, False)))
+        for result in rpc_response_batch_to_results(response):
+            transaction_counts[hex_to_dec(result['number'])] = len(result.get('transactions') or [])
+
+    batch_work_executor = BatchWorkExecutor(batch_size, max_workers)
+    try:
+        batch_work_executor.execute(range(start_block, end_block + 1), prefetch_batch,
+                                    total_items=end_block - start_block + 1)
+    finally:
+        batch_work_executor.shutdown()
+    logger.info('Prefetched the transaction counts of {} blocks.'.format(len(transaction_counts)))
+    return BlockWeights(transaction_counts)
+
+
+def get_block_weights(blocks_file, prefetch, batch_web3_provider, start_block, end_block, max_workers):
+    """Returns the weights read from blocks_file, or prefetched from the node if prefetch is set, otherwise None."""
+    if blocks_file is not None:
+        return read_block_weights(blocks_file)
+    if prefetch:
+        return prefetch_block_weights(batch_web3_provider, start_block, end_block, max_workers)
+    return None
@@ -20,93 +20,311 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import functools
 import logging
+import multiprocessing
+import threading
 import time
+from concurrent.futures import ProcessPoolExecutor
 
 from requests.exceptions import Timeout as RequestsTimeout, HTTPError, TooManyRedirects
 from web3._utils.threads import Timeout as Web3Timeout
 
+from blockchainetl.jobs.exporters.measured_item_exporter import measure_item_exporter
+from blockchainetl.metrics import Counter, Gauge
+
+from ethereumetl.executors.adaptive_controller import AdaptiveController
 from ethereumetl.executors.bounded_executor import BoundedExecutor
+from ethereumetl.executors.dead_letter import get_dead_letter_sink, get_redrive_filter, get_work_handler_name
 from ethereumetl.executors.fail_safe_executor import FailSafeExecutor
+from ethereumetl.executors.reorder_buffer import ReorderBuffer, OrderedItemExporter, start_batch, end_batch, \
+    batch_attempt, export_batch_items
+from ethereumetl.executors.retry_policy import get_retry_policy
+from ethereumetl.executors.scheduler import get_scheduler, ScheduledExecutor
 from ethereumetl.misc.retriable_value_error import RetriableValueError
 from ethereumetl.progress_logger import ProgressLogger
-from ethereumetl.utils import dynamic_batch_iterator
+from blockchainetl import json_codec
+from ethereumetl.providers.sized_response import get_byte_size, get_raw_response
+from ethereumetl.utils import dynamic_batch_iterator, weighted_batch_iterator
 
 RETRY_EXCEPTIONS = (ConnectionError, HTTPError, RequestsTimeout, TooManyRedirects, Web3Timeout, OSError,
                     RetriableValueError)
 
-BATCH_CHANGE_COOLDOWN_PERIOD_SECONDS = 2 * 60
+# Nodes limit the size of batch responses, e.g. geth to 25 MB
+DEFAULT_MAX_BATCH_BYTES = 10 * 1024 * 1024
+BYTES_PER_ITEM_SMOOTHING_FACTOR = 0.3
+# In ordered mode, the number of batches that can be submitted ahead of the oldest running one, per worker
+REORDER_BUFFER_BATCHES_PER_WORKER = 4
+# With item weights, a batch of light items can have up to this many times the batch size items by default
+MAX_WEIGHTED_BATCH_SIZE_RATIO = 4
+
+BATCH_SIZE = Gauge('batch_size', 'The current batch size by job.', ['job'])
+WORKERS = Gauge('workers', 'The current number of batches allowed in flight by job.', ['job'])
+BATCHES_IN_FLIGHT = Gauge('batches_in_flight', 'The number of batches submitted and not completed by job.', ['job'])
+EXECUTOR_QUEUE_DEPTH = Gauge('executor_queue_depth', 'The number of batches waiting for a worker by job.', ['job'])
+BATCH_ERRORS = Counter('batch_errors_total', 'The number of batches that failed and were retried one item at a time '
+                                             'by job.', ['job'])
 
 
-# Executes the given work in batches, reducing the batch size exponentially in case of errors.
+# Executes the given work in batches. The batch size and the number of batches in flight are tuned by
+# AdaptiveController, see its docs. Batches are also limited to about max_batch_bytes of response,
+# estimated from the sizes passed to track_response_size.
+# Retries use the process-wide RetryPolicy: backoff with jitter and a retry budget, and no batches are submitted
+# while the circuit breakers of all endpoints are open.
+# With cpu_workers, work handlers can move CPU bound mapping off the I/O threads with map_in_cpu_stage.
+# With ordered=True, items exported through wrap_item_exporter are released in the order of the work items,
+# see ReorderBuffer.
+# With a progress_ledger, work items it has recorded as completed are skipped, and the items of each batch are
+# exported together with recording the batch as completed, see ProgressLedger.
+# With a dead_letter_sink, items that still fail when retried one at a time are recorded in it instead of failing
+# the job. By default the process-wide sink is used, see the --dead-letters option.
+# With item_weights, e.g. BlockWeights, batches are packed to the weight of an average batch of batch size items
+# instead of a fixed number of items, so batches of busy blocks are smaller than batches of empty ones. A batch of
+# light items has at most max_weighted_batch_size_ratio times the batch size items.
 class BatchWorkExecutor:
-    def __init__(self, starting_batch_size, max_workers, retry_exceptions=RETRY_EXCEPTIONS, max_retries=5):
-        self.batch_size = starting_batch_size
-        self.max_batch_size = starting_batch_size
-        self.latest_batch_size_change_time = None
+    def __init__(self, starting_batch_size, max_workers, retry_exceptions=RETRY_EXCEPTIONS, max_retries=5,
+                 max_batch_bytes=DEFAULT_MAX_BATCH_BYTES, retry_policy=None, cpu_workers=None, ordered=False,
+                 reorder_buffer_size=None, progress_ledger=None, dead_letter_sink=None, item_weights=None,
+                 max_weighted_batch_size_ratio=MAX_WEIGHTED_BATCH_SIZE_RATIO):
+        self.controller = AdaptiveController(starting_batch_size, max_workers)
+        self.max_batch_bytes = max_batch_bytes
+        self.bytes_per_item = None
         self.max_workers = max_workers
-        # Using bounded executor prevents unlimited queue growth
-        # and allows monitoring in-progress futures and failing fast in case of errors.
-        self.executor = FailSafeExecutor(BoundedExecutor(1, self.max_workers))
+        self.executor = self._create_executor()
+        self._in_flight_count = 0
+        self._in_flight_condition = threading.Condition()
         self.retry_exceptions = retry_exceptions
         self.max_retries = max_retries
-        self.progress_logger = ProgressLogger()
+        self.retry_policy = retry_policy if retry_policy is not None else get_retry_policy()
+        # Worker processes are spawned rather than forked, forking a process with running threads isn't safe
+        self.cpu_executor = ProcessPoolExecutor(cpu_workers, mp_context=multiprocessing.get_context('spawn')) \
+            if cpu_workers else None
+        self.reorder_buffer = ReorderBuffer(
+            reorder_buffer_size or REORDER_BUFFER_BATCHES_PER_WORKER * max_workers, release=self._release_batch) \
+            if ordered else None
+        self.progress_ledger = progress_ledger
+        self.item_weights = item_weights
+        self.max_weighted_batch_size_ratio = max_weighted_batch_size_ratio
+        self.dead_letter_sink = dead_letter_sink if dead_letter_sink is not None else get_dead_letter_sink()
+        # Without a dead letter sink, non-retriable errors fail the job right away
+        self.batch_fallback_exceptions = Exception if self.dead_letter_sink is not None else retry_exceptions
+        self.progress_logger = ProgressLogger(status_getter=self.describe)
+        # The name of the work handler, which labels the metrics of the executor
+        self.job_name = None
         self.logger = logging.getLogger('BatchWorkExecutor')
 
+    def _create_executor(self):
+        # Using bounded executor prevents unlimited queue growth
+        # and allows monitoring in-progress futures and failing fast in case of errors.
+        # If the process has a shared scheduler, the batches run on its threads instead, see Scheduler.
+        scheduler = get_scheduler()
+        delegate = ScheduledExecutor(scheduler) if scheduler is not None else BoundedExecutor(1, self.max_workers)
+        return FailSafeExecutor(delegate)
+
+    @property
+    def batch_size(self):
+        return self.controller.batch_size
+
     def execute(self, work_iterable, work_handler, total_items=None):
+        work_iterable, total_items = self._filter_work(work_iterable, work_handler, total_items)
         self.progress_logger.start(total_items=total_items)
-        for batch in dynamic_batch_iterator(work_iterable, lambda: self.batch_size):
-            self.executor.submit(self._fail_safe_execute, work_handler, batch)
+        self.job_name = get_work_handler_name(work_handler)
+        for batch in self._iterate_batches(work_iterable):
+            self._update_metrics()
+            self.retry_policy.wait_for_endpoints()
+            sequence = self.reorder_buffer.reserve() if self.reorder_buffer is not None else None
+            self._wait_for_capacity()
+            try:
+                future = self.executor.submit(self._fail_safe_execute, work_handler, batch, sequence)
+            except BaseException:
+                self._release_capacity()
+                raise
+            future.add_done_callback(functools.partial(self._on_batch_done, sequence))
+
+    def describe(self):
+        status = self.controller.describe()
+        if self.executor is not None:
+            status += ' {} batches in flight, {} queued.'.format(
+                self.executor.in_flight_count, self.executor.queue_depth)
+        return status
+
+    def wrap_item_exporter(self, item_exporter):
+        """In ordered mode or with a progress ledger, returns the exporter work handlers must export items with.
+
+        Otherwise returns item_exporter.
+        """
+        if self.progress_ledger is not None:
+            self.progress_ledger.track_item_exporter(item_exporter)
+        item_exporter = measure_item_exporter(item_exporter)
+        return OrderedItemExporter(item_exporter) if self._collects_batch_items() else item_exporter
+
+    def _collects_batch_items(self):
+        return self.reorder_buffer is not None or self.progress_ledger is not None
+
+    def _filter_work(self, work_iterable, work_handler, total_items):
+        """Skips the items completed by an earlier run, and when re-driving dead letters, the items that didn't fail."""
+        if self.progress_ledger is not None:
+            if total_items is not None:
+                total_items = max(0, total_items - len(self.progress_ledger.completed))
+            work_iterable = self.progress_ledger.skip_completed(work_iterable)
+        redrive_filter = get_redrive_filter()
+        if redrive_filter is not None:
+            total_items = redrive_filter.get_item_count(work_handler)
+            work_iterable = redrive_filter.filter(work_handler, work_iterable)
+        return work_iterable, total_items
+
+    def _complete_batch(self, sequence, batch, batch_items):
+        """batch_items is None if the batch failed or wasn't collected."""
+        if sequence is not None:
+            self.reorder_buffer.complete(sequence, (batch, batch_items))
+        else:
+            self._release_batch((batch, batch_items))
+
+    def _release_batch(self, completed_batch):
+        batch, batch_items = completed_batch
+        if batch_items is None:
+            return
+        if self.progress_ledger is not None:
+            self.progress_ledger.record(batch, batch_items)
+        else:
+            export_batch_items(batch_items)
+
+    def track_response_size(self, item_count, response):
+        """Records the size of the response for a batch of item_count items, if the provider reported it."""
+        byte_size = get_byte_size(response)
+        if byte_size is None or item_count == 0:
+            return
+        bytes_per_item = byte_size / item_count
+        if self.bytes_per_item is None:
+            self.bytes_per_item = bytes_per_item
+        else:
+            self.bytes_per_item = BYTES_PER_ITEM_SMOOTHING_FACTOR * bytes_per_item + \
+                (1 - BYTES_PER_ITEM_SMOOTHING_FACTOR) * self.bytes_per_item
+
+    def map_in_cpu_stage(self, mapper, data, *args):
+        """Returns mapper(data, *args), computed in the process pool if the executor has cpu_workers.
+
+        data is a decoded JSON-RPC response or other JSON value. It's sent to the worker process as JSON bytes,
+        which is cheaper to pickle than the decoded objects, and for responses the provider kept these bytes already.
+        mapper must be a module level function and should return the item dicts for the item exporter.
+        """
+        if self.cpu_executor is None:
+            return mapper(data, *args)
+        return self.cpu_executor.submit(map_json_bytes, mapper, get_raw_response(data), *args).result()
 
-    def _fail_safe_execute(self, work_handler, batch):
+    def _get_batch_size(self):
+        batch_size = self.controller.batch_size
+        bytes_per_item = self.bytes_per_item
+        if self.max_batch_bytes is not None and bytes_per_item:
+            batch_size = min(batch_size, max(1, int(self.max_batch_bytes / bytes_per_item)))
+        return batch_size
+
+    def _iterate_batches(self, work_iterable):
+        if self.item_weights is None:
+            return dynamic_batch_iterator(work_iterable, self._get_batch_size)
+        return weighted_batch_iterator(
+            work_iterable, self._get_target_batch_weight, self.item_weights.get_weight,
+            lambda: self._get_batch_size() * self.max_weighted_batch_size_ratio)
+
+    def _get_target_batch_weight(self):
+        return self._get_batch_size() * self.item_weights.mean_weight
+
+    def _wait_for_capacity(self):
+        with self._in_flight_condition:
+            while self._in_flight_count >= self.controller.concurrency:
+                self._in_flight_condition.wait()
+            self._in_flight_count += 1
+
+    def _release_capacity(self):
+        with self._in_flight_condition:
+            self._in_flight_count -= 1
+            self._in_flight_condition.notify_all()
+
+    def _on_batch_done(self, sequence, future):
+        # Batches cancelled by FailSafeExecutor after a failure never run, so they are completed here
+        if future.cancelled():
+            if sequence is not None:
+                self.reorder_buffer.complete(sequence, (None, None))
+            self._release_capacity()
+
+    def _fail_safe_execute(self, work_handler, batch, sequence=None):
+        batch_items = start_batch() if self._collects_batch_items() else None
+        completed = False
         try:
+            start_time = time.time()
+            self.retry_policy.record_request()
+            try:
+                self._attempt(work_handler, batch)
+                self.controller.on_success(len(batch), time.time() - start_time)
+            except self.batch_fallback_exceptions:
+                BATCH_ERRORS.labels(get_work_handler_name(work_handler)).inc()
+                self.logger.exception('An exception occurred while executing work_handler.')
+                self.controller.on_failure(len(batch), time.time() - start_time)
+                self.logger.info('The batch of size {} will be retried one item at a time.'.format(len(batch)))
+                for item in batch:
+                    try:
+                        self.retry_policy.execute_with_retries(
+                            self._attempt, work_handler, [item],
+                            max_retries=self.max_retries, retry_exceptions=self.retry_exceptions)
+                    except Exception as e:
+                        self._dead_letter(work_handler, item, e)
+
+            self.progress_logger.track(len(batch))
+            completed = True
+        finally:
+            try:
+                if batch_items is not None:
+                    end_batch()
+                    # The job fails anyway if the batch failed, the batches after it are still released
+                    self._complete_batch(sequence, batch, batch_items if completed else None)
+            finally:
+                self._release_capacity()
+
+    def _dead_letter(self, work_handler, item, exception):
+        """Records the item in the dead letter sink, or re-raises the exception if there is none."""
+        if self.dead_letter_sink is None:
+            raise exception
+        self.dead_letter_sink.record(work_handler, item, exception)
+
+    @staticmethod
+    def _attempt(work_handler, batch):
+        with batch_attempt():
             work_handler(batch)
-            self._try_increase_batch_size(len(batch))
-        except self.retry_exceptions:
-            self.logger.exception('An exception occurred while executing work_handler.')
-            self._try_decrease_batch_size(len(batch))
-            self.logger.info('The batch of size {} will be retried one item at a time.'.format(len(batch)))
-            for item in batch:
-                execute_with_retries(work_handler, [item],
-                                     max_retries=self.max_retries, retry_exceptions=self.retry_exceptions)
-
-        self.progress_logger.track(len(batch))
-
-    # Some acceptable race conditions are possible
-    def _try_decrease_batch_size(self, current_batch_size):
-        batch_size = self.batch_size
-        if batch_size == current_batch_size and batch_size > 1:
-            new_batch_size = int(current_batch_size / 2)
-            self.logger.info('Reducing batch size to {}.'.format(new_batch_size))
-            self.batch_size = new_batch_size
-            self.latest_batch_size_change_time = time.time()
-
-    def _try_increase_batch_size(self, current_batch_size):
-        if current_batch_size * 2 <= self.max_batch_size:
-            current_time = time.time()
-            latest_batch_size_change_time = self.latest_batch_size_change_time
-            seconds_since_last_change = current_time - latest_batch_size_change_time \
-                if latest_batch_size_change_time is not None else 0
-            if seconds_since_last_change > BATCH_CHANGE_COOLDOWN_PERIOD_SECONDS:
-                new_batch_size = current_batch_size * 2
-                self.logger.info('Increasing batch size to {}.'.format(new_batch_size))
-                self.batch_size = new_batch_size
-                self.latest_batch_size_change_time = current_time
 
     def shutdown(self):
-        self.executor.shutdown()
+        try:
+            self.executor.shutdown()
+        finally:
+            self._checkpoint()
+        self._shutdown_cpu_executor()
+        self._remove_metrics()
         self.progress_logger.finish()
 
+    def _checkpoint(self):
+        if self.progress_ledger is not None:
+            self.progress_ledger.checkpoint()
 
-def execute_with_retries(func, *args, max_retries=5, retry_exceptions=RETRY_EXCEPTIONS, sleep_seconds=1):
-    for i in range(max_retries):
-        try:
-            return func(*args)
-        except retry_exceptions:
-            logging.exception('An exception occurred while executing execute_with_retries. Retry #{}'.format(i))
-            if i < max_retries - 1:
-                logging.info('The request will be retried after {} seconds. Retry #{}'.format(sleep_seconds, i))
-                time.sleep(sleep_seconds)
-                continue
-            else:
-                raise
+    def _update_metrics(self):
+        BATCH_SIZE.labels(self.job_name).set(self._get_batch_size())
+        WORKERS.labels(self.job_name).set(self.controller.concurrency)
+        if self.executor is not None:
+            BATCHES_IN_FLIGHT.labels(self.job_name).set(self.executor.in_flight_count)
+            EXECUTOR_QUEUE_DEPTH.labels(self.job_name).set(self.executor.queue_depth)
+
+    def _remove_metrics(self):
+        if self.job_name is not None:
+            for gauge in (BATCH_SIZE, WORKERS, BATCHES_IN_FLIGHT, EXECUTOR_QUEUE_DEPTH):
+                gauge.remove(self.job_name)
+
+    def _shutdown_cpu_executor(self):
+        if self.cpu_executor is not None:
+            self.cpu_executor.shutdown()
+
+
+def map_json_bytes(mapper, json_bytes, *args):
+    return mapper(json_codec.loads(json_bytes), *args)
+
+
+def execute_with_retries(func, *args, max_retries=5, retry_exceptions=RETRY_EXCEPTIONS, retry_policy=None):
+    retry_policy = retry_policy if retry_policy is not None else get_retry_policy()
+    return retry_policy.execute_with_retries(func, *args, max_retries=max_retries, retry_exceptions=retry_exceptions)
@@ -0,0 +1,122 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import collections
+import logging
+import threading
+import time
+
+from blockchainetl import json_codec
+from blockchainetl.file_utils import get_file_handle, close_silently
+from blockchainetl.metrics import Counter
+
+DEAD_LETTERS = Counter('dead_letters_total', 'The number of work items recorded in the dead letter sink by job.',
+                       ['job'])
+
+
+# Records the work items that keep failing, so the job can continue without them.
+# Each line of the file is a JSON object with the job, i.e. the work handler, the work item, e.g. a block number
+# or a transaction hash, and the error. redrive_dead_letters runs a command again for these items only.
+class DeadLetterSink:
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._file = None
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger('DeadLetterSink')
+
+    def record(self, work_handler, item, exception):
+        dead_letter = {
+            'job': get_work_handler_name(work_handler),
+            'item': item,
+            'error_type': type(exception).__name__,
+            'error': str(exception),
+            'timestamp': int(time.time()),
+        }
+        line = json_codec.dumps_bytes(dead_letter) + b'\n'
+        with self._lock:
+            # The file is only created if an item fails
+            if self._file is None:
+                self._file = get_file_handle(self.path, mode='a', binary=True)
+            self._file.write(line)
+            self._file.flush()
+            self.count += 1
+        DEAD_LETTERS.labels(dead_letter['job']).inc()
+        self.logger.error('Item {} of {} failed with {}, it is recorded in {}.'.format(
+            json_codec.dumps(item), dead_letter['job'], repr(exception), self.path))
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                close_silently(self._file)
+                self._file = None
+        if self.count > 0:
+            self.logger.warning('{} items failed and were recorded in {}.'.format(self.count, self.path))
+
+
+def get_work_handler_name(work_handler):
+    return getattr(work_handler, '__qualname__', None) or repr(work_handler)
+
+
+def read_dead_letters(path):
+    with open(path, 'rb') as file:
+        return [json_codec.loads_item(line) for line in file if line.strip()]
+
+
+# Restricts the work of each job to the dead-lettered items of the job, see redrive_dead_letters
+class RedriveFilter:
+    def __init__(self, dead_letters):
+        self._items_by_job = collections.defaultdict(set)
+        for dead_letter in dead_letters:
+            self._items_by_job[dead_letter['job']].add(json_codec.dumps(dead_letter['item']))
+
+    def get_item_count(self, work_handler):
+        return len(self._items_by_job.get(get_work_handler_name(work_handler), ()))
+
+    def filter(self, work_handler, work_iterable):
+        items = self._items_by_job.get(get_work_handler_name(work_handler), set())
+        return (item for item in work_iterable if json_codec.dumps(item) in items)
+
+
+_dead_letter_sink = None
+_redrive_filter = None
+
+
+def get_dead_letter_sink():
+    """Returns the sink for items that keep failing, or None if they fail the job."""
+    return _dead_letter_sink
+
+
+def set_dead_letter_sink(dead_letter_sink):
+    global _dead_letter_sink
+    _dead_letter_sink = dead_letter_sink
+    return _dead_letter_sink
+
+
+def get_redrive_filter():
+    return _redrive_filter
+
+
+def set_redrive_filter(redrive_filter):
+    global _redrive_filter
+    _redrive_filter = redrive_filter
+    return _redrive_filter
@@ -21,28 +21,83 @@
 # SOFTWARE.
 
 
+import queue
+import threading
+
+
+# Fail safe in this case means fail fast: the first exception raised by a task cancels the tasks that haven't
+# started yet and is raised from the next call to submit or shutdown.
+# Finished futures are pushed to a completion queue by their done callbacks, so the cost of a submit doesn't
+# depend on the number of tasks in flight.
 class FailSafeExecutor:
 
     def __init__(self, delegate):
         self._delegate = delegate
-        self._futures = []
+        self._completed_futures = queue.SimpleQueue()
+        self._in_flight_futures = set()
+        self._queued_count = 0
+        self._error = None
+        self._lock = threading.Lock()
+
+    @property
+    def in_flight_count(self):
+        """The number of submitted tasks that haven't finished, including the queued ones."""
+        with self._lock:
+            return len(self._in_flight_futures)
+
+    @property
+    def queue_depth(self):
+        """The number of submitted tasks that are waiting for a worker."""
+        with self._lock:
+            return self._queued_count
 
     def submit(self, fn, *args, **kwargs):
         self._check_completed_futures()
-        future = self._delegate.submit(fn, *args, **kwargs)
-        self._futures.append(future)
-
+        with self._lock:
+            self._queued_count += 1
+        try:
+            future = self._delegate.submit(self._run, fn, *args, **kwargs)
+        except BaseException:
+            with self._lock:
+                self._queued_count -= 1
+            raise
+        with self._lock:
+            self._in_flight_futures.add(future)
+        # Called immediately if the future is already done
+        future.add_done_callback(self._on_done)
         return future
 
     def shutdown(self):
         self._delegate.shutdown(wait=True)
         self._check_completed_futures()
-        assert len(self._futures) == 0
+
+    def _run(self, fn, *args, **kwargs):
+        with self._lock:
+            self._queued_count -= 1
+        return fn(*args, **kwargs)
+
+    def _on_done(self, future):
+        pending_futures = []
+        with self._lock:
+            self._in_flight_futures.discard(future)
+            if future.cancelled():
+                self._queued_count -= 1
+            elif future.exception() is not None and self._error is None:
+                self._error = future.exception()
+                pending_futures = list(self._in_flight_futures)
+        self._completed_futures.put(future)
+        # Running tasks can't be cancelled, they are left to finish
+        for pending_future in pending_futures:
+            pending_future.cancel()
 
     def _check_completed_futures(self):
-        """Fail safe in this case means fail fast. TODO: Add retry logic"""
-        for future in self._futures.copy():
-            if future.done():
+        while True:
+            try:
+                future = self._completed_futures.get_nowait()
+            except queue.Empty:
+                break
+            if not future.cancelled():
                 # Will throw an exception here if the future failed
                 future.result()
-                self._futures.remove(future)
+        if self._error is not None:
+            raise self._error
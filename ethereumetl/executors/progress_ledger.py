@@ -0,0 +1,191 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import bisect
+import logging
+import os
+import threading
+import time
+
+from blockchainetl import json_codec
+from ethereumetl.executors.reorder_buffer import export_batch_items
+
+DEFAULT_CHECKPOINT_INTERVAL_SECONDS = 10
+PROGRESS_FILE_SUFFIX = '.progress.json'
+
+
+# A set of integers stored as sorted disjoint inclusive intervals, e.g. the completed block ranges of an export.
+# Adjacent and overlapping intervals are merged, so a mostly contiguous set takes a handful of intervals.
+class IntervalSet:
+    def __init__(self, intervals=()):
+        self._starts = []
+        self._ends = []
+        for start, end in intervals:
+            self.add(start, end)
+
+    def add(self, start, end):
+        if start > end:
+            raise ValueError('start must not be greater than end')
+        # The intervals from i to j overlap [start, end] or are adjacent to it
+        i = bisect.bisect_left(self._ends, start - 1)
+        j = bisect.bisect_right(self._starts, end + 1)
+        if i < j:
+            start = min(start, self._starts[i])
+            end = max(end, self._ends[j - 1])
+        self._starts[i:j] = [start]
+        self._ends[i:j] = [end]
+
+    def update(self, values):
+        run_start = run_end = None
+        for value in sorted(values):
+            if run_end is not None and value <= run_end + 1:
+                run_end = max(run_end, value)
+                continue
+            if run_start is not None:
+                self.add(run_start, run_end)
+            run_start = run_end = value
+        if run_start is not None:
+            self.add(run_start, run_end)
+
+    def __contains__(self, value):
+        i = bisect.bisect_right(self._starts, value) - 1
+        return i >= 0 and value <= self._ends[i]
+
+    def __len__(self):
+        return sum(end - start + 1 for start, end in self)
+
+    def __iter__(self):
+        return iter(zip(self._starts, self._ends))
+
+    def __repr__(self):
+        return 'IntervalSet({})'.format(list(self))
+
+
+# Records which work items, e.g. block numbers, a job has completed, so an interrupted job can be resumed.
+# Completed batches are exported and recorded together under a lock, see BatchWorkExecutor with progress_ledger.
+# At most every checkpoint_interval seconds, and when the job ends, the output files are flushed to disk and then
+# the ledger is written atomically with the completed intervals and the size of each output file.
+# Resuming truncates the output files to those sizes, which drops the items of batches that completed after
+# the last checkpoint, and skips the completed intervals. Every item is then in the output exactly once.
+# With work_range, e.g. the start and end block, the ledger can only be resumed by a job with the same range.
+class ProgressLedger:
+    def __init__(self, path, checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL_SECONDS, clock=time.monotonic,
+                 work_range=None):
+        self.path = path
+        self.work_range = list(work_range) if work_range is not None else None
+        self.checkpoint_interval = checkpoint_interval
+        self.clock = clock
+        self.completed = IntervalSet()
+        # The sizes of the output files at the last checkpoint, by file name
+        self.file_offsets = {}
+        self.item_exporter = None
+        self._last_checkpoint_time = clock()
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger('ProgressLedger')
+
+    def load(self):
+        """Reads the ledger from path. A missing file is an empty ledger."""
+        try:
+            with open(self.path, 'rb') as file:
+                state = json_codec.loads_item(file.read())
+        except FileNotFoundError:
+            return self
+        stored_work_range = state.get('range')
+        if self.work_range is not None and stored_work_range is not None and stored_work_range != self.work_range:
+            raise ValueError('{} is the progress of {} to {}, it can\'t be resumed for {} to {}'.format(
+                self.path, *stored_work_range, *self.work_range))
+        self.completed = IntervalSet(state.get('completed', []))
+        self.file_offsets = state.get('files', {})
+        self.logger.info('Resuming from {}, {} items completed.'.format(self.path, len(self.completed)))
+        return self
+
+    def track_item_exporter(self, item_exporter):
+        """Sets the exporter whose files are flushed and measured at each checkpoint."""
+        self.item_exporter = item_exporter
+
+    def skip_completed(self, work_iterable):
+        return (item for item in work_iterable if item not in self.completed)
+
+    def record(self, batch, batch_items):
+        """Exports batch_items, the (item_exporter, item) pairs of the completed batch, and records the batch."""
+        with self._lock:
+            export_batch_items(batch_items)
+            self.completed.update(batch)
+            if self.clock() - self._last_checkpoint_time >= self.checkpoint_interval:
+                self._checkpoint()
+
+    def checkpoint(self):
+        with self._lock:
+            self._checkpoint()
+
+    def _checkpoint(self):
+        # The items must be on disk before the ledger says their batches are completed
+        if self.item_exporter is not None and hasattr(self.item_exporter, 'flush'):
+            self.item_exporter.flush()
+            self.file_offsets = self.item_exporter.get_file_offsets()
+        state = {
+            'completed': [[start, end] for start, end in self.completed],
+            'files': self.file_offsets,
+        }
+        if self.work_range is not None:
+            state['range'] = self.work_range
+        write_atomically(self.path, json_codec.dumps_bytes(state))
+        self._last_checkpoint_time = self.clock()
+
+
+def write_atomically(path, data):
+    """Replaces the file at path with data, so readers see either the old or the new content after a crash."""
+    dirname = os.path.dirname(path)
+    if dirname:
+        os.makedirs(dirname, exist_ok=True)
+    temp_path = '{}.tmp'.format(path)
+    with open(temp_path, 'wb') as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, path)
+
+
+def open_progress_ledger(progress_file, outputs, resume=False, work_range=None):
+    """Returns the ledger for a job writing to outputs, or None if the progress isn't recorded.
+
+    The progress is recorded with resume or a progress_file. By default the ledger is kept next to the first output
+    file. Without resume, an existing ledger is reset right away, so it never describes output files that are being
+    overwritten.
+    """
+    if progress_file is None and not resume:
+        return None
+    if progress_file is None:
+        output_files = [output for output in outputs if output is not None and output != '-']
+        if output_files:
+            progress_file = output_files[0] + PROGRESS_FILE_SUFFIX
+    if progress_file is None:
+        if resume:
+            raise ValueError('Resuming requires output files or a progress file')
+        return None
+
+    ledger = ProgressLedger(progress_file, work_range=work_range)
+    if resume:
+        ledger.load()
+    else:
+        ledger.checkpoint()
+    return ledger
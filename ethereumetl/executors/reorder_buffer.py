@@ -0,0 +1,138 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import contextlib
+import contextvars
+import threading
+
+# The items exported by the batch running in the current thread or asyncio task
+_current_batch_items = contextvars.ContextVar('current_batch_items', default=None)
+
+
+# Holds the items of completed batches until all earlier batches complete, then releases them to the item exporters
+# in the order the batches were submitted. At most max_size batches can be submitted ahead of the oldest one that
+# is still running, reserve waits for it to complete.
+# release is called with what each batch completed with, in order. By default that's the list of
+# (item_exporter, item) pairs of the batch, which are exported.
+class ReorderBuffer:
+    def __init__(self, max_size, release=None):
+        if max_size < 1:
+            raise ValueError('max_size must be at least 1')
+        self.max_size = max_size
+        self.release = release if release is not None else export_batch_items
+        self._next_sequence = 0
+        self._next_release = 0
+        self._completed = {}
+        # Set if an item exporter failed, nothing is released after that
+        self._error = None
+        self._condition = threading.Condition()
+
+    def is_full(self):
+        with self._condition:
+            return self._next_sequence - self._next_release >= self.max_size and self._error is None
+
+    def reserve(self):
+        """Returns the sequence number for the next batch, waiting while the buffer is full."""
+        with self._condition:
+            while self._next_sequence - self._next_release >= self.max_size and self._error is None:
+                self._condition.wait()
+            if self._error is not None:
+                raise self._error
+            sequence = self._next_sequence
+            self._next_sequence += 1
+            return sequence
+
+    def complete(self, sequence, items):
+        """items is passed to release, by default a list of (item_exporter, item) pairs.
+
+        A failed batch completes with no items.
+        """
+        with self._condition:
+            self._completed[sequence] = items
+            try:
+                while self._error is None and self._next_release in self._completed:
+                    self.release(self._completed.pop(self._next_release))
+                    self._next_release += 1
+            except BaseException as e:
+                self._error = e
+                raise
+            finally:
+                self._condition.notify_all()
+
+
+def export_batch_items(items):
+    for item_exporter, item in items:
+        item_exporter.export_item(item)
+
+
+def start_batch():
+    """Starts collecting the items exported in the current thread or asyncio task. Returns the list they go to."""
+    items = []
+    _current_batch_items.set(items)
+    return items
+
+
+def end_batch():
+    _current_batch_items.set(None)
+
+
+def get_current_batch_items():
+    return _current_batch_items.get()
+
+
+@contextlib.contextmanager
+def batch_attempt():
+    """Drops the items exported in the block if it raises, so a retry of the batch doesn't export them twice."""
+    items = get_current_batch_items()
+    mark = len(items) if items is not None else 0
+    try:
+        yield
+    except BaseException:
+        if items is not None:
+            del items[mark:]
+        raise
+
+
+# Collects the exported items of the current batch, which BatchWorkExecutor releases when the batch completes,
+# see BatchWorkExecutor with ordered=True or a progress_ledger.
+# Items exported outside of batches go directly to the wrapped exporter.
+class OrderedItemExporter:
+    def __init__(self, item_exporter):
+        self.item_exporter = item_exporter
+
+    def open(self):
+        self.item_exporter.open()
+
+    def export_items(self, items):
+        for item in items:
+            self.export_item(item)
+
+    def export_item(self, item):
+        batch_items = get_current_batch_items()
+        if batch_items is None:
+            self.item_exporter.export_item(item)
+        else:
+            batch_items.append((self.item_exporter, item))
+
+    def close(self):
+        self.item_exporter.close()
@@ -0,0 +1,275 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import asyncio
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+from blockchainetl.metrics import Counter
+
+DEFAULT_BASE_DELAY_SECONDS = 1
+DEFAULT_MAX_DELAY_SECONDS = 60
+# Retries are allowed for up to 20% of requests, plus one retry per second
+DEFAULT_RETRY_BUDGET_RATIO = 0.2
+DEFAULT_MIN_RETRIES_PER_SECOND = 1
+DEFAULT_MAX_RETRY_TOKENS = 100
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_TIMEOUT_SECONDS = 10
+RETRY_AFTER_STATUS_CODES = (429, 503)
+
+logger = logging.getLogger('RetryPolicy')
+
+RETRIES = Counter('retries_total', 'The number of requests and work items that were retried.')
+
+
+# Decorrelated jitter from https://aws.amazon.com/blogs/architecture/exponential-backoff-and-jitter/
+# Each delay is random between the base delay and 3 times the previous delay, so retries from many workers
+# that failed at the same time don't hit the node at the same time again.
+class DecorrelatedJitterBackoff:
+    def __init__(self, base_delay=DEFAULT_BASE_DELAY_SECONDS, max_delay=DEFAULT_MAX_DELAY_SECONDS,
+                 uniform=random.uniform):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.uniform = uniform
+        self.delay = base_delay
+
+    def next_delay(self):
+        self.delay = min(self.max_delay, self.uniform(self.base_delay, self.delay * 3))
+        return self.delay
+
+
+# A token bucket shared by all retries in the process. Every request adds ratio tokens, every retry takes one,
+# and min_retries_per_second tokens are added over time. When the node is down, this limits retries to a fraction
+# of the traffic instead of multiplying it by max_retries.
+class RetryBudget:
+    def __init__(self, ratio=DEFAULT_RETRY_BUDGET_RATIO, min_retries_per_second=DEFAULT_MIN_RETRIES_PER_SECOND,
+                 max_tokens=DEFAULT_MAX_RETRY_TOKENS, clock=time.monotonic):
+        self.ratio = ratio
+        self.min_retries_per_second = min_retries_per_second
+        self.max_tokens = max_tokens
+        self.clock = clock
+        self.tokens = max_tokens
+        self._refilled_at = clock()
+        self._lock = threading.Lock()
+
+    def record_request(self):
+        with self._lock:
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def try_acquire(self):
+        """Takes a token for a retry. Returns False if the budget is exhausted and the retry should not be made."""
+        with self._lock:
+            now = self.clock()
+            self.tokens = min(self.max_tokens, self.tokens + (now - self._refilled_at) * self.min_retries_per_second)
+            self._refilled_at = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+# Opens after failure_threshold consecutive failures, or when the endpoint asks to back off with Retry-After.
+# While open no batches are submitted, see RetryPolicy.wait_for_endpoints. After reset_timeout it's half open:
+# requests are let through, and a single failure opens it again.
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, endpoint, failure_threshold=DEFAULT_FAILURE_THRESHOLD,
+                 reset_timeout=DEFAULT_RESET_TIMEOUT_SECONDS, clock=time.monotonic):
+        self.endpoint = endpoint
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.open_until = 0
+        self._lock = threading.Lock()
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+
+    def record_failure(self, retry_after=None):
+        with self._lock:
+            self.consecutive_failures += 1
+            if retry_after is not None:
+                self._open(retry_after)
+            elif self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                self._open(self.reset_timeout)
+
+    def _open(self, seconds):
+        if self.state != self.OPEN:
+            logger.warning('Pausing requests to {} for {:.1f} seconds after {} consecutive failures.'.format(
+                self.endpoint, seconds, self.consecutive_failures))
+        self.state = self.OPEN
+        self.open_until = max(self.open_until, self.clock() + seconds)
+
+    def get_wait_seconds(self):
+        with self._lock:
+            if self.state != self.OPEN:
+                return 0
+            wait_seconds = self.open_until - self.clock()
+            if wait_seconds <= 0:
+                self.state = self.HALF_OPEN
+                return 0
+            return wait_seconds
+
+
+# Retry settings shared by all batch jobs in the process, see get_retry_policy.
+class RetryPolicy:
+    def __init__(self, base_delay=DEFAULT_BASE_DELAY_SECONDS, max_delay=DEFAULT_MAX_DELAY_SECONDS, budget=None,
+                 failure_threshold=DEFAULT_FAILURE_THRESHOLD, reset_timeout=DEFAULT_RESET_TIMEOUT_SECONDS):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget if budget is not None else RetryBudget()
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._circuit_breakers = {}
+        self._circuit_breakers_lock = threading.Lock()
+
+    def create_backoff(self):
+        return DecorrelatedJitterBackoff(self.base_delay, self.max_delay)
+
+    def record_request(self):
+        self.budget.record_request()
+
+    def get_retry_delay(self, backoff, exception=None):
+        """Returns the number of seconds to wait before the next retry, or None if the retry budget is exhausted."""
+        if not self.budget.try_acquire():
+            return None
+        delay = backoff.next_delay()
+        retry_after = get_retry_after(exception)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def get_circuit_breaker(self, endpoint):
+        with self._circuit_breakers_lock:
+            circuit_breaker = self._circuit_breakers.get(endpoint)
+            if circuit_breaker is None:
+                circuit_breaker = CircuitBreaker(endpoint, self.failure_threshold, self.reset_timeout)
+                self._circuit_breakers[endpoint] = circuit_breaker
+            return circuit_breaker
+
+    def get_wait_seconds(self):
+        """Returns how long to wait until one of the endpoints accepts requests, 0 if any of them does."""
+        with self._circuit_breakers_lock:
+            circuit_breakers = list(self._circuit_breakers.values())
+        if not circuit_breakers:
+            return 0
+        return min(circuit_breaker.get_wait_seconds() for circuit_breaker in circuit_breakers)
+
+    def wait_for_endpoints(self):
+        wait_seconds = self.get_wait_seconds()
+        while wait_seconds > 0:
+            time.sleep(wait_seconds)
+            wait_seconds = self.get_wait_seconds()
+
+    async def wait_for_endpoints_async(self):
+        wait_seconds = self.get_wait_seconds()
+        while wait_seconds > 0:
+            await asyncio.sleep(wait_seconds)
+            wait_seconds = self.get_wait_seconds()
+
+    def execute_with_retries(self, func, *args, max_retries=5, retry_exceptions=()):
+        self.record_request()
+        backoff = self.create_backoff()
+        for i in range(max_retries):
+            try:
+                return func(*args)
+            except retry_exceptions as e:
+                logging.exception('An exception occurred while executing execute_with_retries. Retry #{}'.format(i))
+                delay = self._get_delay_or_raise(backoff, e, i, max_retries)
+                logging.info('The request will be retried after {:.1f} seconds. Retry #{}'.format(delay, i))
+                time.sleep(delay)
+
+    async def execute_with_retries_async(self, func, *args, max_retries=5, retry_exceptions=()):
+        self.record_request()
+        backoff = self.create_backoff()
+        for i in range(max_retries):
+            try:
+                return await func(*args)
+            except retry_exceptions as e:
+                logging.exception(
+                    'An exception occurred while executing execute_with_retries_async. Retry #{}'.format(i))
+                delay = self._get_delay_or_raise(backoff, e, i, max_retries)
+                logging.info('The request will be retried after {:.1f} seconds. Retry #{}'.format(delay, i))
+                await asyncio.sleep(delay)
+
+    def _get_delay_or_raise(self, backoff, exception, retry, max_retries):
+        if retry >= max_retries - 1:
+            raise exception
+        delay = self.get_retry_delay(backoff, exception)
+        if delay is None:
+            logging.warning('The retry budget is exhausted, giving up.')
+            raise exception
+        RETRIES.inc()
+        return delay
+
+
+def get_retry_after(exception):
+    """Returns the Retry-After of a 429 or 503 HTTP response in seconds, if the exception has one."""
+    if exception is None:
+        return None
+    # requests.HTTPError has the response, aiohttp.ClientResponseError has the status and headers
+    response = getattr(exception, 'response', None)
+    status = getattr(response, 'status_code', None) if response is not None else getattr(exception, 'status', None)
+    headers = getattr(response, 'headers', None) if response is not None else getattr(exception, 'headers', None)
+    if status not in RETRY_AFTER_STATUS_CODES or not headers:
+        return None
+    return parse_retry_after(headers.get('Retry-After'))
+
+
+def parse_retry_after(value, now=None):
+    """Parses Retry-After, which is either a number of seconds or an HTTP date."""
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - (now if now is not None else time.time()))
+
+
+_retry_policy = RetryPolicy()
+
+
+def get_retry_policy():
+    return _retry_policy
+
+
+def set_retry_policy(retry_policy):
+    """Replaces the retry policy shared by all batch jobs and providers in the process."""
+    global _retry_policy
+    _retry_policy = retry_policy
+    return _retry_policy
@@ -0,0 +1,199 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import collections
+import contextlib
+import contextvars
+import threading
+from concurrent.futures import Future, wait as wait_for_futures
+
+from blockchainetl.metrics import Gauge
+
+DEFAULT_STAGE = 'default'
+
+# The stage and endpoint that work submitted from the current thread is tagged with, see scheduled_stage
+_current_stage = contextvars.ContextVar('current_stage', default=(DEFAULT_STAGE, None))
+
+SCHEDULER_QUEUE_DEPTH = Gauge(
+    'scheduler_queue_depth', 'The number of work items waiting for a scheduler thread by stage.', ['stage'])
+
+
+# A thread pool shared by all jobs in the process. Work is queued per stage and the workers take it from the stages
+# in turn, so a stage with a long queue doesn't starve the others. At most max_requests_per_endpoint work items
+# tagged with the same endpoint run at a time, across all stages.
+# The worker threads live as long as the process, and so do the clients they create with ThreadLocalProxy.
+class Scheduler:
+    def __init__(self, max_workers, max_requests_per_endpoint=None):
+        if max_workers < 1:
+            raise ValueError('max_workers must be at least 1')
+        self.max_workers = max_workers
+        self.max_requests_per_endpoint = max_requests_per_endpoint or max_workers
+        self._queues = collections.OrderedDict()
+        self._running_by_endpoint = collections.Counter()
+        self._threads = []
+        self._idle_count = 0
+        self._shutdown = False
+        self._condition = threading.Condition()
+
+    def submit(self, stage, endpoint, fn, *args, **kwargs):
+        future = Future()
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError('Cannot submit work after shutdown')
+            stage_queue = self._queues.setdefault(stage, collections.deque())
+            stage_queue.append((future, endpoint, fn, args, kwargs))
+            SCHEDULER_QUEUE_DEPTH.labels(stage).set(len(stage_queue))
+            if self._idle_count == 0 and len(self._threads) < self.max_workers:
+                self._start_thread()
+            self._condition.notify()
+        return future
+
+    def queue_depth(self, stage=None):
+        with self._condition:
+            if stage is not None:
+                return len(self._queues.get(stage, ()))
+            return sum(len(stage_queue) for stage_queue in self._queues.values())
+
+    def running_count(self, endpoint=None):
+        with self._condition:
+            if endpoint is not None:
+                return self._running_by_endpoint[endpoint]
+            return sum(self._running_by_endpoint.values())
+
+    def shutdown(self, wait=True):
+        with self._condition:
+            self._shutdown = True
+            self._condition.notify_all()
+            threads = list(self._threads)
+        if wait:
+            for thread in threads:
+                thread.join()
+
+    def _start_thread(self):
+        thread = threading.Thread(
+            target=self._work, name='Scheduler-{}'.format(len(self._threads)), daemon=True)
+        self._threads.append(thread)
+        thread.start()
+
+    def _take_work(self):
+        """Takes the first runnable work item of the first stage that has one, then moves the stage to the end."""
+        for stage, stage_queue in self._queues.items():
+            if not stage_queue:
+                continue
+            work = stage_queue[0]
+            if self._running_by_endpoint[work[1]] >= self.max_requests_per_endpoint:
+                continue
+            stage_queue.popleft()
+            SCHEDULER_QUEUE_DEPTH.labels(stage).set(len(stage_queue))
+            self._queues.move_to_end(stage)
+            if not stage_queue:
+                del self._queues[stage]
+            self._running_by_endpoint[work[1]] += 1
+            return work
+        return None
+
+    def _work(self):
+        while True:
+            with self._condition:
+                work = self._take_work()
+                while work is None:
+                    if self._shutdown:
+                        return
+                    self._idle_count += 1
+                    self._condition.wait()
+                    self._idle_count -= 1
+                    work = self._take_work()
+
+            future, endpoint, fn, args, kwargs = work
+            try:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        result = fn(*args, **kwargs)
+                    except BaseException as e:
+                        future.set_exception(e)
+                    else:
+                        future.set_result(result)
+            finally:
+                with self._condition:
+                    self._running_by_endpoint[endpoint] -= 1
+                    if self._running_by_endpoint[endpoint] == 0:
+                        del self._running_by_endpoint[endpoint]
+                    self._condition.notify_all()
+
+
+# An executor for BatchWorkExecutor that runs the work on the scheduler, tagged with the stage current at submit.
+# shutdown only waits for the work submitted through this executor, the scheduler keeps running.
+class ScheduledExecutor:
+    def __init__(self, scheduler):
+        self._scheduler = scheduler
+        self._futures = set()
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs):
+        stage, endpoint = _current_stage.get()
+        future = self._scheduler.submit(stage, endpoint, fn, *args, **kwargs)
+        with self._lock:
+            self._futures.add(future)
+        future.add_done_callback(self._discard)
+        return future
+
+    def _discard(self, future):
+        with self._lock:
+            self._futures.discard(future)
+
+    def shutdown(self, wait=True):
+        if wait:
+            with self._lock:
+                futures = list(self._futures)
+            wait_for_futures(futures)
+
+
+@contextlib.contextmanager
+def scheduled_stage(stage, endpoint=None):
+    """Tags the work submitted to the scheduler in the block with the stage and endpoint."""
+    token = _current_stage.set((stage, endpoint))
+    try:
+        yield
+    finally:
+        _current_stage.reset(token)
+
+
+_scheduler = None
+
+
+def get_scheduler():
+    """Returns the scheduler shared by the jobs in the process, or None if jobs use their own thread pools."""
+    return _scheduler
+
+
+def set_scheduler(scheduler):
+    global _scheduler
+    _scheduler = scheduler
+    return _scheduler
+
+
+def get_or_create_scheduler(max_workers, max_requests_per_endpoint=None):
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = Scheduler(max_workers, max_requests_per_endpoint)
+    return _scheduler
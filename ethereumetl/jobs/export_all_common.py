@@ -29,6 +29,7 @@ from time import time
 
 from ethereumetl.csv_utils import set_max_field_size_limit
 from blockchainetl.file_utils import smart_open
+from ethereumetl.executors.scheduler import get_or_create_scheduler, scheduled_stage
 from ethereumetl.jobs.export_blocks_job import ExportBlocksJob
 from ethereumetl.jobs.export_contracts_job import ExportContractsJob
 from ethereumetl.jobs.export_receipts_job import ExportReceiptsJob
@@ -63,7 +64,16 @@ def extract_csv_column_unique(input, output, column):
             output_file.write(row[column] + '\n')
 
 
-def export_all_common(partitions, output_dir, provider_uri, max_workers, batch_size):
+def export_all_common(partitions, output_dir, provider_uri, max_workers, batch_size, rpc_cache=None,
+                      token_cache=None):
+    # All partitions and stages run on the threads of one scheduler, so the clients created by the thread local
+    # proxies below are reused rather than created again for every job
+    get_or_create_scheduler(max_workers)
+    batch_web3_provider = ThreadLocalProxy(
+        lambda: get_provider_from_uri(provider_uri, batch=True, rpc_cache=rpc_cache))
+    uncached_batch_web3_provider = ThreadLocalProxy(lambda: get_provider_from_uri(provider_uri, batch=True))
+    # A batch provider so token metadata calls can be sent in batches
+    web3 = ThreadLocalProxy(lambda: build_web3(get_provider_from_uri(provider_uri, batch=True)))
 
     for batch_start_block, batch_end_block, partition_dir in partitions:
         # # # start # # #
@@ -116,12 +126,13 @@ def export_all_common(partitions, output_dir, provider_uri, max_workers, batch_s
             start_block=batch_start_block,
             end_block=batch_end_block,
             batch_size=batch_size,
-            batch_web3_provider=ThreadLocalProxy(lambda: get_provider_from_uri(provider_uri, batch=True)),
+            batch_web3_provider=batch_web3_provider,
             max_workers=max_workers,
             item_exporter=blocks_and_transactions_item_exporter(blocks_file, transactions_file),
             export_blocks=blocks_file is not None,
             export_transactions=transactions_file is not None)
-        job.run()
+        with scheduled_stage('blocks_and_transactions', endpoint=provider_uri):
+            job.run()
 
         # # # token_transfers # # #
 
@@ -146,10 +157,11 @@ def export_all_common(partitions, output_dir, provider_uri, max_workers, batch_s
                 start_block=batch_start_block,
                 end_block=batch_end_block,
                 batch_size=batch_size,
-                web3=ThreadLocalProxy(lambda: build_web3(get_provider_from_uri(provider_uri))),
+                web3=web3,
                 item_exporter=token_transfers_item_exporter(token_transfers_file),
                 max_workers=max_workers)
-            job.run()
+            with scheduled_stage('token_transfers', endpoint=provider_uri):
+                job.run()
 
         # # # receipts_and_logs # # #
 
@@ -159,15 +171,6 @@ def export_all_common(partitions, output_dir, provider_uri, max_workers, batch_s
         )
         os.makedirs(os.path.dirname(cache_output_dir), exist_ok=True)
 
-        transaction_hashes_file = '{cache_output_dir}/transaction_hashes_{file_name_suffix}.csv'.format(
-            cache_output_dir=cache_output_dir,
-            file_name_suffix=file_name_suffix,
-        )
-        logger.info('Extracting hash column from transaction file {transactions_file}'.format(
-            transactions_file=transactions_file,
-        ))
-        extract_csv_column_unique(transactions_file, transaction_hashes_file, 'hash')
-
         receipts_output_dir = '{output_dir}/receipts{partition_dir}'.format(
             output_dir=output_dir,
             partition_dir=partition_dir,
@@ -194,15 +197,17 @@ def export_all_common(partitions, output_dir, provider_uri, max_workers, batch_s
             logs_file=logs_file,
         ))
 
-        with smart_open(transaction_hashes_file, 'r') as transaction_hashes:
-            job = ExportReceiptsJob(
-                transaction_hashes_iterable=(transaction_hash.strip() for transaction_hash in transaction_hashes),
-                batch_size=batch_size,
-                batch_web3_provider=ThreadLocalProxy(lambda: get_provider_from_uri(provider_uri, batch=True)),
-                max_workers=max_workers,
-                item_exporter=receipts_and_logs_item_exporter(receipts_file, logs_file),
-                export_receipts=receipts_file is not None,
-                export_logs=logs_file is not None)
+        job = ExportReceiptsJob(
+            transaction_hashes_iterable=None,
+            start_block=batch_start_block,
+            end_block=batch_end_block,
+            batch_size=batch_size,
+            batch_web3_provider=batch_web3_provider,
+            max_workers=max_workers,
+            item_exporter=receipts_and_logs_item_exporter(receipts_file, logs_file),
+            export_receipts=receipts_file is not None,
+            export_logs=logs_file is not None)
+        with scheduled_stage('receipts_and_logs', endpoint=provider_uri):
             job.run()
 
         # # # contracts # # #
@@ -237,10 +242,11 @@ def export_all_common(partitions, output_dir, provider_uri, max_workers, batch_s
             job = ExportContractsJob(
                 contract_addresses_iterable=contract_addresses,
                 batch_size=batch_size,
-                batch_web3_provider=ThreadLocalProxy(lambda: get_provider_from_uri(provider_uri, batch=True)),
+                batch_web3_provider=uncached_batch_web3_provider,
                 item_exporter=contracts_item_exporter(contracts_file),
                 max_workers=max_workers)
-            job.run()
+            with scheduled_stage('contracts', endpoint=provider_uri):
+                job.run()
 
         # # # tokens # # #
 
@@ -272,10 +278,12 @@ def export_all_common(partitions, output_dir, provider_uri, max_workers, batch_s
             with smart_open(token_addresses_file, 'r') as token_addresses:
                 job = ExportTokensJob(
                     token_addresses_iterable=(token_address.strip() for token_address in token_addresses),
-                    web3=ThreadLocalProxy(lambda: build_web3(get_provider_from_uri(provider_uri))),
+                    web3=web3,
                     item_exporter=tokens_item_exporter(tokens_file),
-                    max_workers=max_workers)
-                job.run()
+                    max_workers=max_workers,
+                    token_cache=token_cache)
+                with scheduled_stage('tokens', endpoint=provider_uri):
+                    job.run()
 
         # # # finish # # #
         shutil.rmtree(os.path.dirname(cache_output_dir))
@@ -21,13 +21,13 @@
 # SOFTWARE.
 
 
-import json
-
+from ethereumetl.executors.async_batch_work_executor import AsyncBatchWorkExecutor
 from ethereumetl.executors.batch_work_executor import BatchWorkExecutor
 from blockchainetl.jobs.base_job import BaseJob
 from ethereumetl.json_rpc_requests import generate_get_block_by_number_json_rpc
 from ethereumetl.mappers.block_mapper import EthBlockMapper
 from ethereumetl.mappers.transaction_mapper import EthTransactionMapper
+from ethereumetl.providers.batch_request import make_batch_request, make_batch_request_async
 from ethereumetl.utils import rpc_response_batch_to_results, validate_range
 
 
@@ -42,50 +42,75 @@ class ExportBlocksJob(BaseJob):
             max_workers,
             item_exporter,
             export_blocks=True,
-            export_transactions=True):
+            export_transactions=True,
+            use_async=False,
+            cpu_workers=None,
+            ordered=False,
+            progress_ledger=None,
+            block_weights=None):
         validate_range(start_block, end_block)
         self.start_block = start_block
         self.end_block = end_block
 
         self.batch_web3_provider = batch_web3_provider
 
-        self.batch_work_executor = BatchWorkExecutor(batch_size, max_workers)
-        self.item_exporter = item_exporter
+        # With use_async batch_web3_provider must be an async provider e.g. AsyncBatchHTTPProvider
+        self.use_async = use_async
+        # With cpu_workers blocks are mapped in worker processes, with ordered they are exported sorted by number,
+        # with progress_ledger blocks completed by an earlier run are skipped, with block_weights batches are packed
+        # by transaction count
+        executor_class = AsyncBatchWorkExecutor if use_async else BatchWorkExecutor
+        self.batch_work_executor = executor_class(
+            batch_size, max_workers, cpu_workers=cpu_workers, ordered=ordered, progress_ledger=progress_ledger,
+            item_weights=block_weights)
+        self.item_exporter = self.batch_work_executor.wrap_item_exporter(item_exporter)
 
         self.export_blocks = export_blocks
         self.export_transactions = export_transactions
         if not self.export_blocks and not self.export_transactions:
             raise ValueError('At least one of export_blocks or export_transactions must be True')
 
-        self.block_mapper = EthBlockMapper()
-        self.transaction_mapper = EthTransactionMapper()
-
     def _start(self):
         self.item_exporter.open()
 
     def _export(self):
         self.batch_work_executor.execute(
             range(self.start_block, self.end_block + 1),
-            self._export_batch,
+            self._export_batch_async if self.use_async else self._export_batch,
             total_items=self.end_block - self.start_block + 1
         )
 
     def _export_batch(self, block_number_batch):
         blocks_rpc = list(generate_get_block_by_number_json_rpc(block_number_batch, self.export_transactions))
-        response = self.batch_web3_provider.make_batch_request(json.dumps(blocks_rpc))
-        results = rpc_response_batch_to_results(response)
-        blocks = [self.block_mapper.json_dict_to_block(result) for result in results]
+        response = make_batch_request(self.batch_web3_provider, blocks_rpc)
+        self.batch_work_executor.track_response_size(len(block_number_batch), response)
+        self._export_items(self.batch_work_executor.map_in_cpu_stage(
+            map_blocks_response, response, self.export_blocks, self.export_transactions))
 
-        for block in blocks:
-            self._export_block(block)
+    async def _export_batch_async(self, block_number_batch):
+        blocks_rpc = list(generate_get_block_by_number_json_rpc(block_number_batch, self.export_transactions))
+        response = await make_batch_request_async(self.batch_web3_provider, blocks_rpc)
+        self.batch_work_executor.track_response_size(len(block_number_batch), response)
+        self._export_items(await self.batch_work_executor.map_in_cpu_stage_async(
+            map_blocks_response, response, self.export_blocks, self.export_transactions))
 
-    def _export_block(self, block):
-        if self.export_blocks:
-            self.item_exporter.export_item(self.block_mapper.block_to_dict(block))
-        if self.export_transactions:
-            for tx in block.transactions:
-                self.item_exporter.export_item(self.transaction_mapper.transaction_to_dict(tx))
+    def _export_items(self, items):
+        for item in items:
+            self.item_exporter.export_item(item)
 
     def _end(self):
         self.batch_work_executor.shutdown()
         self.item_exporter.close()
+
+
+def map_blocks_response(response, export_blocks, export_transactions):
+    block_mapper = EthBlockMapper()
+    transaction_mapper = EthTransactionMapper()
+    items = []
+    for result in rpc_response_batch_to_results(response):
+        block = block_mapper.json_dict_to_block(result)
+        if export_blocks:
+            items.append(block_mapper.block_to_dict(block))
+        if export_transactions:
+            items.extend(transaction_mapper.transaction_to_dict(tx) for tx in block.transactions)
+    return items
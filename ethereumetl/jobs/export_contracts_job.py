@@ -21,13 +21,13 @@
 # SOFTWARE.
 
 
-import json
-
+from ethereumetl.executors.async_batch_work_executor import AsyncBatchWorkExecutor
 from ethereumetl.executors.batch_work_executor import BatchWorkExecutor
 from blockchainetl.jobs.base_job import BaseJob
 from ethereumetl.json_rpc_requests import generate_get_code_json_rpc
 from ethereumetl.mappers.contract_mapper import EthContractMapper
-
+from ethereumetl.providers.batch_request import make_batch_request, make_batch_request_async
+from ethereumetl.service.bytecode_memo import get_bytecode_memo
 from ethereumetl.service.eth_contract_service import EthContractService
 from ethereumetl.utils import rpc_response_to_result
 
@@ -40,50 +40,65 @@ class ExportContractsJob(BaseJob):
             batch_size,
             batch_web3_provider,
             max_workers,
-            item_exporter):
+            item_exporter,
+            use_async=False,
+            cpu_workers=None,
+            bytecode_memo_path=None):
         self.batch_web3_provider = batch_web3_provider
         self.contract_addresses_iterable = contract_addresses_iterable
 
-        self.batch_work_executor = BatchWorkExecutor(batch_size, max_workers)
-        self.item_exporter = item_exporter
-
-        self.contract_service = EthContractService()
-        self.contract_mapper = EthContractMapper()
+        # With use_async batch_web3_provider must be an async provider e.g. AsyncBatchHTTPProvider
+        self.use_async = use_async
+        # With cpu_workers bytecode is classified in worker processes
+        self.batch_work_executor = AsyncBatchWorkExecutor(batch_size, max_workers, cpu_workers=cpu_workers) \
+            if use_async else BatchWorkExecutor(batch_size, max_workers, cpu_workers=cpu_workers)
+        self.item_exporter = self.batch_work_executor.wrap_item_exporter(item_exporter)
+        # Contracts are classified once per unique bytecode, with bytecode_memo_path also across runs
+        self.bytecode_memo_path = bytecode_memo_path
 
     def _start(self):
         self.item_exporter.open()
 
     def _export(self):
-        self.batch_work_executor.execute(self.contract_addresses_iterable, self._export_contracts)
+        self.batch_work_executor.execute(
+            self.contract_addresses_iterable,
+            self._export_contracts_async if self.use_async else self._export_contracts
+        )
 
     def _export_contracts(self, contract_addresses):
         contracts_code_rpc = list(generate_get_code_json_rpc(contract_addresses))
-        response_batch = self.batch_web3_provider.make_batch_request(json.dumps(contracts_code_rpc))
-
-        contracts = []
-        for response in response_batch:
-            # request id is the index of the contract address in contract_addresses list
-            request_id = response['id']
-            result = rpc_response_to_result(response)
-
-            contract_address = contract_addresses[request_id]
-            contract = self._get_contract(contract_address, result)
-            contracts.append(contract)
+        response_batch = make_batch_request(self.batch_web3_provider, contracts_code_rpc)
+        self.batch_work_executor.track_response_size(len(contract_addresses), response_batch)
+        self._export_items(self.batch_work_executor.map_in_cpu_stage(
+            map_contracts_response, response_batch, contract_addresses, self.bytecode_memo_path))
 
-        for contract in contracts:
-            self.item_exporter.export_item(self.contract_mapper.contract_to_dict(contract))
-
-    def _get_contract(self, contract_address, rpc_result):
-        contract = self.contract_mapper.rpc_result_to_contract(contract_address, rpc_result)
-        bytecode = contract.bytecode
-        function_sighashes = self.contract_service.get_function_sighashes(bytecode)
-
-        contract.function_sighashes = function_sighashes
-        contract.is_erc20 = self.contract_service.is_erc20_contract(function_sighashes)
-        contract.is_erc721 = self.contract_service.is_erc721_contract(function_sighashes)
+    async def _export_contracts_async(self, contract_addresses):
+        contracts_code_rpc = list(generate_get_code_json_rpc(contract_addresses))
+        response_batch = await make_batch_request_async(self.batch_web3_provider, contracts_code_rpc)
+        self.batch_work_executor.track_response_size(len(contract_addresses), response_batch)
+        self._export_items(await self.batch_work_executor.map_in_cpu_stage_async(
+            map_contracts_response, response_batch, contract_addresses, self.bytecode_memo_path))
 
-        return contract
+    def _export_items(self, items):
+        for item in items:
+            self.item_exporter.export_item(item)
 
     def _end(self):
         self.batch_work_executor.shutdown()
         self.item_exporter.close()
+
+
+def map_contracts_response(response_batch, contract_addresses, bytecode_memo_path=None):
+    contract_service = EthContractService(get_bytecode_memo(bytecode_memo_path))
+    contract_mapper = EthContractMapper()
+    items = []
+    for response in response_batch:
+        # request id is the index of the contract address in contract_addresses list
+        request_id = response['id']
+        result = rpc_response_to_result(response)
+
+        contract = contract_mapper.rpc_result_to_contract(contract_addresses[request_id], result)
+        contract.function_sighashes, contract.is_erc20, contract.is_erc721 = \
+            contract_service.classify_contract(contract.bytecode)
+        items.append(contract_mapper.contract_to_dict(contract))
+    return items
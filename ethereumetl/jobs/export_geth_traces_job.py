@@ -20,12 +20,13 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
-import json
 
+from ethereumetl.executors.async_batch_work_executor import AsyncBatchWorkExecutor
 from ethereumetl.executors.batch_work_executor import BatchWorkExecutor
 from ethereumetl.json_rpc_requests import generate_trace_block_by_number_json_rpc
 from blockchainetl.jobs.base_job import BaseJob
 from ethereumetl.mappers.geth_trace_mapper import EthGethTraceMapper
+from ethereumetl.providers.batch_request import make_batch_request, make_batch_request_async
 from ethereumetl.utils import validate_range, rpc_response_to_result
 
 
@@ -38,17 +39,22 @@ class ExportGethTracesJob(BaseJob):
             batch_size,
             batch_web3_provider,
             max_workers,
-            item_exporter):
+            item_exporter,
+            use_async=False,
+            cpu_workers=None,
+            ordered=False):
         validate_range(start_block, end_block)
         self.start_block = start_block
         self.end_block = end_block
 
         self.batch_web3_provider = batch_web3_provider
 
-        self.batch_work_executor = BatchWorkExecutor(batch_size, max_workers)
-        self.item_exporter = item_exporter
-
-        self.geth_trace_mapper = EthGethTraceMapper()
+        # With use_async batch_web3_provider must be an async provider e.g. AsyncBatchHTTPProvider
+        self.use_async = use_async
+        # With cpu_workers traces are mapped in worker processes, with ordered they are exported sorted by block
+        executor_class = AsyncBatchWorkExecutor if use_async else BatchWorkExecutor
+        self.batch_work_executor = executor_class(batch_size, max_workers, cpu_workers=cpu_workers, ordered=ordered)
+        self.item_exporter = self.batch_work_executor.wrap_item_exporter(item_exporter)
 
     def _start(self):
         self.item_exporter.open()
@@ -56,25 +62,41 @@ class ExportGethTracesJob(BaseJob):
     def _export(self):
         self.batch_work_executor.execute(
             range(self.start_block, self.end_block + 1),
-            self._export_batch,
+            self._export_batch_async if self.use_async else self._export_batch,
             total_items=self.end_block - self.start_block + 1
         )
 
     def _export_batch(self, block_number_batch):
         trace_block_rpc = list(generate_trace_block_by_number_json_rpc(block_number_batch))
-        response = self.batch_web3_provider.make_batch_request(json.dumps(trace_block_rpc))
-
-        for response_item in response:
-            block_number = response_item.get('id')
-            result = rpc_response_to_result(response_item)
+        response = make_batch_request(self.batch_web3_provider, trace_block_rpc)
+        self.batch_work_executor.track_response_size(len(block_number_batch), response)
+        self._export_items(self.batch_work_executor.map_in_cpu_stage(map_geth_traces_response, response))
 
-            geth_trace = self.geth_trace_mapper.json_dict_to_geth_trace({
-                'block_number': block_number,
-                'transaction_traces': [tx_trace.get('result') for tx_trace in result],
-            })
+    async def _export_batch_async(self, block_number_batch):
+        trace_block_rpc = list(generate_trace_block_by_number_json_rpc(block_number_batch))
+        response = await make_batch_request_async(self.batch_web3_provider, trace_block_rpc)
+        self.batch_work_executor.track_response_size(len(block_number_batch), response)
+        self._export_items(await self.batch_work_executor.map_in_cpu_stage_async(map_geth_traces_response, response))
 
-            self.item_exporter.export_item(self.geth_trace_mapper.geth_trace_to_dict(geth_trace))
+    def _export_items(self, items):
+        for item in items:
+            self.item_exporter.export_item(item)
 
     def _end(self):
         self.batch_work_executor.shutdown()
         self.item_exporter.close()
+
+
+def map_geth_traces_response(response):
+    geth_trace_mapper = EthGethTraceMapper()
+    items = []
+    for response_item in response:
+        block_number = response_item.get('id')
+        result = rpc_response_to_result(response_item)
+
+        geth_trace = geth_trace_mapper.json_dict_to_geth_trace({
+            'block_number': block_number,
+            'transaction_traces': [tx_trace.get('result') for tx_trace in result],
+        })
+        items.append(geth_trace_mapper.geth_trace_to_dict(geth_trace))
+    return items
@@ -33,10 +33,9 @@ class ExportOriginJob(BaseJob):
 
         self.web3 = web3
 
-        self.marketplace_listing_exporter = marketplace_listing_exporter
-        self.shop_product_exporter = shop_product_exporter
-
         self.batch_work_executor = BatchWorkExecutor(batch_size, max_workers)
+        self.marketplace_listing_exporter = self.batch_work_executor.wrap_item_exporter(marketplace_listing_exporter)
+        self.shop_product_exporter = self.batch_work_executor.wrap_item_exporter(shop_product_exporter)
 
         self.event_extractor = OriginEventExtractor(ipfs_client)
 
@@ -21,14 +21,21 @@
 # SOFTWARE.
 
 
-import json
+import logging
 
 from blockchainetl.jobs.base_job import BaseJob
+from ethereumetl.executors.async_batch_work_executor import AsyncBatchWorkExecutor
 from ethereumetl.executors.batch_work_executor import BatchWorkExecutor
-from ethereumetl.json_rpc_requests import generate_get_receipt_json_rpc
+from ethereumetl.json_rpc_requests import generate_get_receipt_json_rpc, generate_get_block_receipts_json_rpc, \
+    generate_get_block_by_number_json_rpc
 from ethereumetl.mappers.receipt_log_mapper import EthReceiptLogMapper
 from ethereumetl.mappers.receipt_mapper import EthReceiptMapper
-from ethereumetl.utils import rpc_response_batch_to_results
+from ethereumetl.providers.batch_request import make_batch_request, make_batch_request_async
+from ethereumetl.providers.sized_response import get_byte_size, with_byte_size
+from ethereumetl.utils import rpc_response_batch_to_results, validate_range, is_method_not_found_error, \
+    split_to_batches
+
+logger = logging.getLogger('ExportReceiptsJob')
 
 
 # Exports receipts and logs
@@ -41,12 +48,36 @@ class ExportReceiptsJob(BaseJob):
             max_workers,
             item_exporter,
             export_receipts=True,
-            export_logs=True):
+            export_logs=True,
+            start_block=None,
+            end_block=None,
+            use_async=False,
+            ordered=False,
+            block_weights=None):
         self.batch_web3_provider = batch_web3_provider
         self.transaction_hashes_iterable = transaction_hashes_iterable
 
-        self.batch_work_executor = BatchWorkExecutor(batch_size, max_workers)
-        self.item_exporter = item_exporter
+        # When start_block and end_block are given receipts are fetched for whole blocks with eth_getBlockReceipts
+        # instead of one eth_getTransactionReceipt per transaction hash
+        self.export_by_block = start_block is not None or end_block is not None
+        if self.export_by_block:
+            validate_range(start_block, end_block)
+        elif transaction_hashes_iterable is None:
+            raise ValueError('Either transaction_hashes_iterable or start_block and end_block must be provided')
+        self.start_block = start_block
+        self.end_block = end_block
+        # None means unknown, it's detected on the first batch
+        self.block_receipts_supported = None
+
+        self.batch_size = batch_size
+        # With use_async batch_web3_provider must be an async provider e.g. AsyncBatchHTTPProvider
+        self.use_async = use_async
+        # With ordered receipts and logs are exported in the order of the blocks or transaction hashes,
+        # with block_weights batches of blocks are packed by transaction count
+        executor_class = AsyncBatchWorkExecutor if use_async else BatchWorkExecutor
+        self.batch_work_executor = executor_class(
+            batch_size, max_workers, ordered=ordered, item_weights=block_weights if self.export_by_block else None)
+        self.item_exporter = self.batch_work_executor.wrap_item_exporter(item_exporter)
 
         self.export_receipts = export_receipts
         self.export_logs = export_logs
@@ -60,16 +91,95 @@ class ExportReceiptsJob(BaseJob):
         self.item_exporter.open()
 
     def _export(self):
-        self.batch_work_executor.execute(self.transaction_hashes_iterable, self._export_receipts)
+        if self.export_by_block:
+            self.batch_work_executor.execute(
+                range(self.start_block, self.end_block + 1),
+                self._export_block_receipts_async if self.use_async else self._export_block_receipts,
+                total_items=self.end_block - self.start_block + 1
+            )
+        else:
+            self.batch_work_executor.execute(
+                self.transaction_hashes_iterable,
+                self._export_receipts_async if self.use_async else self._export_receipts
+            )
 
     def _export_receipts(self, transaction_hashes):
         receipts_rpc = list(generate_get_receipt_json_rpc(transaction_hashes))
-        response = self.batch_web3_provider.make_batch_request(json.dumps(receipts_rpc))
+        response = make_batch_request(self.batch_web3_provider, receipts_rpc)
+        if not self.export_by_block:
+            self.batch_work_executor.track_response_size(len(transaction_hashes), response)
+        self._export_receipts_response(response)
+        return response
+
+    async def _export_receipts_async(self, transaction_hashes):
+        receipts_rpc = list(generate_get_receipt_json_rpc(transaction_hashes))
+        response = await make_batch_request_async(self.batch_web3_provider, receipts_rpc)
+        if not self.export_by_block:
+            self.batch_work_executor.track_response_size(len(transaction_hashes), response)
+        self._export_receipts_response(response)
+        return response
+
+    def _export_receipts_response(self, response):
         results = rpc_response_batch_to_results(response)
         receipts = [self.receipt_mapper.json_dict_to_receipt(result) for result in results]
         for receipt in receipts:
             self._export_receipt(receipt)
 
+    def _export_block_receipts(self, block_numbers):
+        if self.block_receipts_supported is not False:
+            block_receipts_rpc = list(generate_get_block_receipts_json_rpc(block_numbers))
+            response = make_batch_request(self.batch_web3_provider, block_receipts_rpc)
+            if self._export_block_receipts_response(response):
+                self.batch_work_executor.track_response_size(len(block_numbers), response)
+                return
+
+        blocks_rpc = list(generate_get_block_by_number_json_rpc(block_numbers, False))
+        response = make_batch_request(self.batch_web3_provider, blocks_rpc)
+        receipts_responses = [self._export_receipts(transaction_hashes)
+                              for transaction_hashes in self._get_transaction_hash_batches(response)]
+        self._track_blocks_response_size(block_numbers, [response] + receipts_responses)
+
+    async def _export_block_receipts_async(self, block_numbers):
+        if self.block_receipts_supported is not False:
+            block_receipts_rpc = list(generate_get_block_receipts_json_rpc(block_numbers))
+            response = await make_batch_request_async(self.batch_web3_provider, block_receipts_rpc)
+            if self._export_block_receipts_response(response):
+                self.batch_work_executor.track_response_size(len(block_numbers), response)
+                return
+
+        blocks_rpc = list(generate_get_block_by_number_json_rpc(block_numbers, False))
+        response = await make_batch_request_async(self.batch_web3_provider, blocks_rpc)
+        receipts_responses = [await self._export_receipts_async(transaction_hashes)
+                              for transaction_hashes in self._get_transaction_hash_batches(response)]
+        self._track_blocks_response_size(block_numbers, [response] + receipts_responses)
+
+    def _track_blocks_response_size(self, block_numbers, responses):
+        # Without eth_getBlockReceipts the size of a block is the size of the block and of its receipts
+        byte_sizes = [get_byte_size(response) for response in responses]
+        if None not in byte_sizes:
+            self.batch_work_executor.track_response_size(len(block_numbers), with_byte_size([], sum(byte_sizes)))
+
+    def _export_block_receipts_response(self, response):
+        """Returns False if the node doesn't support eth_getBlockReceipts and the batch has to be re-requested."""
+        if any(is_method_not_found_error(response_item.get('error')) for response_item in response):
+            logger.info('eth_getBlockReceipts is not supported by the node. '
+                        'Falling back to eth_getTransactionReceipt.')
+            self.block_receipts_supported = False
+            return False
+
+        self.block_receipts_supported = True
+        for block_receipts in rpc_response_batch_to_results(response):
+            for result in block_receipts:
+                self._export_receipt(self.receipt_mapper.json_dict_to_receipt(result))
+        return True
+
+    def _get_transaction_hash_batches(self, blocks_response):
+        transaction_hashes = [transaction_hash
+                              for block in rpc_response_batch_to_results(blocks_response)
+                              for transaction_hash in block['transactions']]
+        for batch_start, batch_end in split_to_batches(0, len(transaction_hashes) - 1, self.batch_size):
+            yield transaction_hashes[batch_start:batch_end + 1]
+
     def _export_receipt(self, receipt):
         if self.export_receipts:
             self.item_exporter.export_item(self.receipt_mapper.receipt_to_dict(receipt))
@@ -20,12 +20,22 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import logging
+
 from ethereumetl.executors.batch_work_executor import BatchWorkExecutor
 from blockchainetl.jobs.base_job import BaseJob
 from ethereumetl.mappers.token_transfer_mapper import EthTokenTransferMapper
 from ethereumetl.mappers.receipt_log_mapper import EthReceiptLogMapper
+from ethereumetl.misc.retriable_value_error import RetriableValueError
+from ethereumetl.service.log_density import LogDensity, DEFAULT_MAX_LOGS_PER_REQUEST
 from ethereumetl.service.token_transfer_extractor import EthTokenTransferExtractor, TRANSFER_EVENT_TOPIC
-from ethereumetl.utils import validate_range
+from ethereumetl.utils import validate_range, is_log_limit_error, is_rate_limit_error
+
+logger = logging.getLogger('ExportTokenTransfersJob')
+
+# In sparse eras a batch, and so an eth_getLogs range, can have up to this many times the batch size blocks.
+# A batch that fails is retried one block at a time, which bounds the number of retries
+MAX_RANGE_SIZE_RATIO = 20
 
 
 class ExportTokenTransfersJob(BaseJob):
@@ -37,21 +47,24 @@ class ExportTokenTransfersJob(BaseJob):
             web3,
             item_exporter,
             max_workers,
-            tokens=None):
+            tokens=None,
+            max_logs_per_request=DEFAULT_MAX_LOGS_PER_REQUEST):
         validate_range(start_block, end_block)
         self.start_block = start_block
         self.end_block = end_block
 
         self.web3 = web3
         self.tokens = tokens
-        self.item_exporter = item_exporter
 
-        self.batch_work_executor = BatchWorkExecutor(batch_size, max_workers)
+        # Block ranges are sized by the learned log density, ranges exceeding the provider limits are bisected
+        self.log_density = LogDensity(max_logs_per_request, default_range_size=batch_size)
+        self.batch_work_executor = BatchWorkExecutor(
+            batch_size, max_workers, item_weights=self.log_density, max_weighted_batch_size_ratio=MAX_RANGE_SIZE_RATIO)
+        self.item_exporter = self.batch_work_executor.wrap_item_exporter(item_exporter)
 
         self.receipt_log_mapper = EthReceiptLogMapper()
         self.token_transfer_mapper = EthTokenTransferMapper()
         self.token_transfer_extractor = EthTokenTransferExtractor()
-        self._supports_eth_newFilter = True
 
     def _start(self):
         self.item_exporter.open()
@@ -65,10 +78,30 @@ class ExportTokenTransfersJob(BaseJob):
 
     def _export_batch(self, block_number_batch):
         assert len(block_number_batch) > 0
-        # https://github.com/ethereum/wiki/wiki/JSON-RPC#eth_getfilterlogs
+        events = self._get_logs(block_number_batch[0], block_number_batch[-1])
+
+        for event in events:
+            log = self.receipt_log_mapper.web3_dict_to_receipt_log(event)
+            token_transfer = self.token_transfer_extractor.extract_transfer_from_log(log)
+            if token_transfer is not None:
+                self.item_exporter.export_item(self.token_transfer_mapper.token_transfer_to_dict(token_transfer))
+
+    def _get_logs(self, start_block, end_block):
+        """Returns the transfer logs in the range, requested in ranges sized by the log density of their era."""
+        events = []
+        range_start = start_block
+        while range_start <= end_block:
+            range_size = self.log_density.get_range_size(range_start)
+            range_end = end_block if range_size is None else min(end_block, range_start + range_size - 1)
+            events.extend(self._get_range_logs(range_start, range_end))
+            range_start = range_end + 1
+        return events
+
+    def _get_range_logs(self, start_block, end_block):
+        # https://ethereum.org/en/developers/docs/apis/json-rpc/#eth_getlogs
         filter_params = {
-            'fromBlock': block_number_batch[0],
-            'toBlock': block_number_batch[-1],
+            'fromBlock': start_block,
+            'toBlock': end_block,
             'topics': [TRANSFER_EVENT_TOPIC]
         }
 
@@ -76,23 +109,30 @@ class ExportTokenTransfersJob(BaseJob):
             filter_params['address'] = self.tokens
 
         try:
-            event_filter = self.web3.eth.filter(filter_params)
-            events = event_filter.get_all_entries()
+            events = self.web3.eth.getLogs(filter_params)
         except ValueError as e:
-            if str(e) == "{'code': -32000, 'message': 'the method is currently not implemented: eth_newFilter'}":
-                self._supports_eth_newFilter = False
-                events = self.web3.eth.getLogs(filter_params)
-            else:
-                raise(e)
-        for event in events:
-            log = self.receipt_log_mapper.web3_dict_to_receipt_log(event)
-            token_transfer = self.token_transfer_extractor.extract_transfer_from_log(log)
-            if token_transfer is not None:
-                self.item_exporter.export_item(self.token_transfer_mapper.token_transfer_to_dict(token_transfer))
+            error = get_json_rpc_error(e)
+            if is_rate_limit_error(error):
+                # Retried by the batch work executor, after a backoff
+                raise RetriableValueError(str(e)) from e
+            if start_block == end_block or not is_log_limit_error(error):
+                raise
+            logger.info('eth_getLogs for blocks {}-{} exceeded the provider limits, splitting the range. {}'.format(
+                start_block, end_block, e))
+            self.log_density.record_limit_exceeded(start_block, end_block)
+            middle_block = (start_block + end_block) // 2
+            return self._get_logs(start_block, middle_block) + self._get_logs(middle_block + 1, end_block)
 
-        if self._supports_eth_newFilter:
-            self.web3.eth.uninstallFilter(event_filter.filter_id)
+        self.log_density.record_logs(start_block, end_block, len(events))
+        return events
 
     def _end(self):
         self.batch_work_executor.shutdown()
         self.item_exporter.close()
+
+
+def get_json_rpc_error(value_error):
+    # web3 raises ValueError with the JSON-RPC error object as its argument
+    if value_error.args and isinstance(value_error.args[0], dict):
+        return value_error.args[0]
+    return {'message': str(value_error)}
@@ -26,14 +26,19 @@ from blockchainetl.jobs.base_job import BaseJob
 from ethereumetl.mappers.token_mapper import EthTokenMapper
 from ethereumetl.service.eth_token_service import EthTokenService
 
+DEFAULT_TOKEN_BATCH_SIZE = 100
+
 
 class ExportTokensJob(BaseJob):
-    def __init__(self, web3, item_exporter, token_addresses_iterable, max_workers):
-        self.item_exporter = item_exporter
+    def __init__(self, web3, item_exporter, token_addresses_iterable, max_workers, ordered=False,
+                 batch_size=DEFAULT_TOKEN_BATCH_SIZE, token_cache=None):
         self.token_addresses_iterable = token_addresses_iterable
-        self.batch_work_executor = BatchWorkExecutor(1, max_workers)
+        # With ordered tokens are exported in the order of the addresses
+        self.batch_work_executor = BatchWorkExecutor(batch_size, max_workers, ordered=ordered)
+        self.item_exporter = self.batch_work_executor.wrap_item_exporter(item_exporter)
 
-        self.token_service = EthTokenService(web3, clean_user_provided_content)
+        # With token_cache tokens already in the cache aren't requested from the node
+        self.token_service = EthTokenService(web3, clean_user_provided_content, token_cache=token_cache)
         self.token_mapper = EthTokenMapper()
 
     def _start(self):
@@ -42,15 +47,13 @@ class ExportTokensJob(BaseJob):
     def _export(self):
         self.batch_work_executor.execute(self.token_addresses_iterable, self._export_tokens)
 
-    def _export_tokens(self, token_addresses):
-        for token_address in token_addresses:
-            self._export_token(token_address)
-
-    def _export_token(self, token_address, block_number=None):
-        token = self.token_service.get_token(token_address)
-        token.block_number = block_number
-        token_dict = self.token_mapper.token_to_dict(token)
-        self.item_exporter.export_item(token_dict)
+    def _export_tokens(self, token_addresses, block_numbers=None):
+        # The metadata calls for the whole batch are aggregated into a few requests
+        tokens = self.token_service.get_tokens(token_addresses)
+        for ind, token in enumerate(tokens):
+            token.block_number = block_numbers[ind] if block_numbers is not None else None
+            token_dict = self.token_mapper.token_to_dict(token)
+            self.item_exporter.export_item(token_dict)
 
     def _end(self):
         self.batch_work_executor.shutdown()
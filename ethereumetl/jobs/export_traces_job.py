@@ -20,16 +20,24 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 import logging
+from itertools import groupby
 
 from ethereumetl.executors.batch_work_executor import BatchWorkExecutor
 from blockchainetl.jobs.base_job import BaseJob
+from ethereumetl.json_rpc_requests import generate_trace_block_json_rpc, generate_trace_filter_json_rpc
 from ethereumetl.mainnet_daofork_state_changes import DAOFORK_BLOCK_NUMBER
 from ethereumetl.mappers.trace_mapper import EthTraceMapper
+from ethereumetl.providers.batch_request import make_batch_request
 from ethereumetl.service.eth_special_trace_service import EthSpecialTraceService
 
 from ethereumetl.service.trace_id_calculator import calculate_trace_ids
 from ethereumetl.service.trace_status_calculator import calculate_trace_statuses
-from ethereumetl.utils import validate_range
+from ethereumetl.utils import validate_range, rpc_response_to_result, is_method_not_found_error
+
+logger = logging.getLogger('ExportTracesJob')
+
+TRACE_BLOCK_NONE_MESSAGE = 'Response from the node is None. Is the node fully synced? ' \
+                           'Is the node started with tracing enabled? Is trace_block API enabled?'
 
 
 class ExportTracesJob(BaseJob):
@@ -42,16 +50,31 @@ class ExportTracesJob(BaseJob):
             item_exporter,
             max_workers,
             include_genesis_traces=False,
-            include_daofork_traces=False):
+            include_daofork_traces=False,
+            ordered=False,
+            progress_ledger=None,
+            batch_web3_provider=None,
+            use_trace_filter=False):
         validate_range(start_block, end_block)
         self.start_block = start_block
         self.end_block = end_block
 
         self.web3 = web3
-
-        # TODO: use batch_size when this issue is fixed https://github.com/paritytech/parity-ethereum/issues/9822
-        self.batch_work_executor = BatchWorkExecutor(1, max_workers)
-        self.item_exporter = item_exporter
+        # With batch_web3_provider the trace_block calls for a batch of blocks are sent in one JSON-RPC batch.
+        # Without it blocks are traced one at a time through web3
+        self.batch_web3_provider = batch_web3_provider
+        # With use_trace_filter a batch of blocks is traced with one trace_filter call per contiguous block range.
+        # None means unknown, it's detected on the first batch and trace_block is used if the node doesn't support it
+        self.trace_filter_supported = None if use_trace_filter else False
+        if use_trace_filter and batch_web3_provider is None:
+            raise ValueError('batch_web3_provider must be provided with use_trace_filter')
+
+        # With ordered traces are exported sorted by block, with progress_ledger blocks completed by an earlier run
+        # are skipped
+        self.batch_work_executor = BatchWorkExecutor(
+            batch_size if batch_web3_provider is not None else 1, max_workers, ordered=ordered,
+            progress_ledger=progress_ledger)
+        self.item_exporter = self.batch_work_executor.wrap_item_exporter(item_exporter)
 
         self.trace_mapper = EthTraceMapper()
 
@@ -70,28 +93,77 @@ class ExportTracesJob(BaseJob):
         )
 
     def _export_batch(self, block_number_batch):
-        # TODO: Change to len(block_number_batch) > 0 when this issue is fixed
-        # https://github.com/paritytech/parity-ethereum/issues/9822
-        assert len(block_number_batch) == 1
-        block_number = block_number_batch[0]
+        if self.batch_web3_provider is None:
+            json_traces_by_block = {block_number: self._trace_block(block_number) for block_number in block_number_batch}
+        else:
+            json_traces_by_block = None
+            if self.trace_filter_supported is not False:
+                json_traces_by_block = self._trace_filter(block_number_batch)
+            if json_traces_by_block is None:
+                json_traces_by_block = self._trace_blocks(block_number_batch)
+
+        for block_number in block_number_batch:
+            self._export_block_traces(block_number, json_traces_by_block.get(block_number, []))
+
+    def _trace_block(self, block_number):
+        json_traces = self.web3.parity.traceBlock(block_number)
 
+        if json_traces is None:
+            raise ValueError(TRACE_BLOCK_NONE_MESSAGE)
+        return json_traces
+
+    def _trace_blocks(self, block_numbers):
+        trace_block_rpc = list(generate_trace_block_json_rpc(block_numbers))
+        response = make_batch_request(self.batch_web3_provider, trace_block_rpc)
+        self.batch_work_executor.track_response_size(len(block_numbers), response)
+
+        json_traces_by_block = {}
+        for response_item in response:
+            if response_item.get('result') is None and response_item.get('error') is None:
+                raise ValueError(TRACE_BLOCK_NONE_MESSAGE)
+            # the request ID is the index of the block in the batch, responses in a batch can come in any order
+            json_traces_by_block[block_numbers[response_item.get('id')]] = rpc_response_to_result(response_item)
+        return json_traces_by_block
+
+    def _trace_filter(self, block_numbers):
+        """Returns None if the node doesn't support trace_filter and the batch has to be traced with trace_block."""
+        block_ranges = list(get_contiguous_ranges(block_numbers))
+        trace_filter_rpc = list(generate_trace_filter_json_rpc(block_ranges))
+        response = make_batch_request(self.batch_web3_provider, trace_filter_rpc)
+        if any(is_method_not_found_error(response_item.get('error')) for response_item in response):
+            logger.info('trace_filter is not supported by the node. Falling back to trace_block.')
+            self.trace_filter_supported = False
+            return None
+
+        self.trace_filter_supported = True
+        self.batch_work_executor.track_response_size(len(block_numbers), response)
+
+        json_traces_by_block = {}
+        for response_item in response:
+            json_traces = rpc_response_to_result(response_item)
+            # Restore the trace_block order https://github.com/paritytech/parity-ethereum/issues/9822
+            # Within a block transaction traces are depth-first per transaction, followed by block and uncle rewards
+            json_traces = sorted(json_traces, key=lambda json_trace: (
+                json_trace.get('blockNumber'),
+                json_trace.get('transactionPosition') is None,
+                json_trace.get('transactionPosition') or 0,
+                json_trace.get('traceAddress') or [],
+            ))
+            for block_number, block_json_traces in groupby(json_traces, key=lambda trace: trace.get('blockNumber')):
+                json_traces_by_block.setdefault(block_number, []).extend(block_json_traces)
+        return json_traces_by_block
+
+    def _export_block_traces(self, block_number, json_traces):
         all_traces = []
 
-        if self.include_genesis_traces and 0 in block_number_batch:
+        if self.include_genesis_traces and block_number == 0:
             genesis_traces = self.special_trace_service.get_genesis_traces()
             all_traces.extend(genesis_traces)
 
-        if self.include_daofork_traces and DAOFORK_BLOCK_NUMBER in block_number_batch:
+        if self.include_daofork_traces and block_number == DAOFORK_BLOCK_NUMBER:
             daofork_traces = self.special_trace_service.get_daofork_traces()
             all_traces.extend(daofork_traces)
 
-        # TODO: Change to traceFilter when this issue is fixed
-        # https://github.com/paritytech/parity-ethereum/issues/9822
-        json_traces = self.web3.parity.traceBlock(block_number)
-
-        if json_traces is None:
-            raise ValueError('Response from the node is None. Is the node fully synced? Is the node started with tracing enabled? Is trace_block API enabled?')
-
         traces = [self.trace_mapper.json_dict_to_trace(json_trace) for json_trace in json_traces]
         all_traces.extend(traces)
 
@@ -111,3 +183,17 @@ def calculate_trace_indexes(traces):
     # Only works if traces were originally ordered correctly which is the case for Parity traces
     for ind, trace in enumerate(traces):
         trace.trace_index = ind
+
+
+def get_contiguous_ranges(block_numbers):
+    """Yields inclusive (start, end) ranges covering the block numbers, e.g. [1, 2, 3, 7] gives (1, 3) and (7, 7)."""
+    block_numbers = sorted(block_numbers)
+    if not block_numbers:
+        return
+    range_start = range_end = block_numbers[0]
+    for block_number in block_numbers[1:]:
+        if block_number != range_end + 1:
+            yield range_start, range_end
+            range_start = block_number
+        range_end = block_number
+    yield range_start, range_end
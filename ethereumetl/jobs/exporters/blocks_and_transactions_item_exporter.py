@@ -66,7 +66,7 @@ TRANSACTION_FIELDS_TO_EXPORT = [
 ]
 
 
-def blocks_and_transactions_item_exporter(blocks_output=None, transactions_output=None):
+def blocks_and_transactions_item_exporter(blocks_output=None, transactions_output=None, file_offsets=None):
     return CompositeItemExporter(
         filename_mapping={
             'block': blocks_output,
@@ -75,5 +75,6 @@ def blocks_and_transactions_item_exporter(blocks_output=None, transactions_outpu
         field_mapping={
             'block': BLOCK_FIELDS_TO_EXPORT,
             'transaction': TRANSACTION_FIELDS_TO_EXPORT
-        }
+        },
+        file_offsets=file_offsets
     )
@@ -45,12 +45,13 @@ FIELDS_TO_EXPORT = [
 ]
 
 
-def traces_item_exporter(traces_output):
+def traces_item_exporter(traces_output, file_offsets=None):
     return CompositeItemExporter(
         filename_mapping={
             'trace': traces_output
         },
         field_mapping={
             'trace': FIELDS_TO_EXPORT
-        }
+        },
+        file_offsets=file_offsets
     )
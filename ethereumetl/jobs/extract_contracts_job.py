@@ -26,6 +26,7 @@ from ethereumetl.executors.batch_work_executor import BatchWorkExecutor
 from blockchainetl.jobs.base_job import BaseJob
 from ethereumetl.mappers.contract_mapper import EthContractMapper
 
+from ethereumetl.service.bytecode_memo import get_bytecode_memo
 from ethereumetl.service.eth_contract_service import EthContractService
 from ethereumetl.utils import to_int_or_none
 
@@ -37,14 +38,18 @@ class ExtractContractsJob(BaseJob):
             traces_iterable,
             batch_size,
             max_workers,
-            item_exporter):
+            item_exporter,
+            cpu_workers=None,
+            ordered=False,
+            bytecode_memo_path=None):
         self.traces_iterable = traces_iterable
 
-        self.batch_work_executor = BatchWorkExecutor(batch_size, max_workers)
-        self.item_exporter = item_exporter
-
-        self.contract_service = EthContractService()
-        self.contract_mapper = EthContractMapper()
+        # With cpu_workers bytecode is classified in worker processes, with ordered contracts are exported
+        # in the order of the traces
+        self.batch_work_executor = BatchWorkExecutor(batch_size, max_workers, cpu_workers=cpu_workers, ordered=ordered)
+        self.item_exporter = self.batch_work_executor.wrap_item_exporter(item_exporter)
+        # Contracts are classified once per unique bytecode, with bytecode_memo_path also across runs
+        self.bytecode_memo_path = bytecode_memo_path
 
     def _start(self):
         self.item_exporter.open()
@@ -53,33 +58,37 @@ class ExtractContractsJob(BaseJob):
         self.batch_work_executor.execute(self.traces_iterable, self._extract_contracts)
 
     def _extract_contracts(self, traces):
-        for trace in traces:
-            trace['status'] = to_int_or_none(trace.get('status'))
-            trace['block_number'] = to_int_or_none(trace.get('block_number'))
+        for item in self.batch_work_executor.map_in_cpu_stage(
+                map_contract_creation_traces, traces, self.bytecode_memo_path):
+            self.item_exporter.export_item(item)
+
+    def _end(self):
+        self.batch_work_executor.shutdown()
+        self.item_exporter.close()
 
-        contract_creation_traces = [trace for trace in traces
-                                    if trace.get('trace_type') == 'create' and trace.get('to_address') is not None
-                                    and len(trace.get('to_address')) > 0 and trace.get('status') == 1]
 
-        contracts = []
-        for trace in contract_creation_traces:
-            contract = EthContract()
-            contract.address = trace.get('to_address')
-            bytecode = trace.get('output')
-            contract.bytecode = bytecode
-            contract.block_number = trace.get('block_number')
+def map_contract_creation_traces(traces, bytecode_memo_path=None):
+    contract_service = EthContractService(get_bytecode_memo(bytecode_memo_path))
+    contract_mapper = EthContractMapper()
 
-            function_sighashes = self.contract_service.get_function_sighashes(bytecode)
+    for trace in traces:
+        trace['status'] = to_int_or_none(trace.get('status'))
+        trace['block_number'] = to_int_or_none(trace.get('block_number'))
 
-            contract.function_sighashes = function_sighashes
-            contract.is_erc20 = self.contract_service.is_erc20_contract(function_sighashes)
-            contract.is_erc721 = self.contract_service.is_erc721_contract(function_sighashes)
+    contract_creation_traces = [trace for trace in traces
+                                if trace.get('trace_type') == 'create' and trace.get('to_address') is not None
+                                and len(trace.get('to_address')) > 0 and trace.get('status') == 1]
 
-            contracts.append(contract)
+    items = []
+    for trace in contract_creation_traces:
+        contract = EthContract()
+        contract.address = trace.get('to_address')
+        bytecode = trace.get('output')
+        contract.bytecode = bytecode
+        contract.block_number = trace.get('block_number')
 
-        for contract in contracts:
-            self.item_exporter.export_item(self.contract_mapper.contract_to_dict(contract))
+        contract.function_sighashes, contract.is_erc20, contract.is_erc721 = \
+            contract_service.classify_contract(bytecode)
 
-    def _end(self):
-        self.batch_work_executor.shutdown()
-        self.item_exporter.close()
+        items.append(contract_mapper.contract_to_dict(contract))
+    return items
@@ -32,14 +32,13 @@ class ExtractGethTracesJob(BaseJob):
             traces_iterable,
             batch_size,
             max_workers,
-            item_exporter):
+            item_exporter,
+            cpu_workers=None):
         self.traces_iterable = traces_iterable
 
-        self.batch_work_executor = BatchWorkExecutor(batch_size, max_workers)
-        self.item_exporter = item_exporter
-
-        self.trace_mapper = EthTraceMapper()
-        self.geth_trace_mapper = EthGethTraceMapper()
+        # With cpu_workers traces are flattened in worker processes
+        self.batch_work_executor = BatchWorkExecutor(batch_size, max_workers, cpu_workers=cpu_workers)
+        self.item_exporter = self.batch_work_executor.wrap_item_exporter(item_exporter)
 
     def _start(self):
         self.item_exporter.open()
@@ -48,12 +47,19 @@ class ExtractGethTracesJob(BaseJob):
         self.batch_work_executor.execute(self.traces_iterable, self._extract_geth_traces)
 
     def _extract_geth_traces(self, geth_traces):
-        for geth_trace_dict in geth_traces:
-            geth_trace = self.geth_trace_mapper.json_dict_to_geth_trace(geth_trace_dict)
-            traces = self.trace_mapper.geth_trace_to_traces(geth_trace)
-            for trace in traces:
-                self.item_exporter.export_item(self.trace_mapper.trace_to_dict(trace))
-              
+        for item in self.batch_work_executor.map_in_cpu_stage(map_geth_traces, geth_traces):
+            self.item_exporter.export_item(item)
+
     def _end(self):
         self.batch_work_executor.shutdown()
         self.item_exporter.close()
+
+
+def map_geth_traces(geth_traces):
+    trace_mapper = EthTraceMapper()
+    geth_trace_mapper = EthGethTraceMapper()
+    items = []
+    for geth_trace_dict in geth_traces:
+        geth_trace = geth_trace_mapper.json_dict_to_geth_trace(geth_trace_dict)
+        items.extend(trace_mapper.trace_to_dict(trace) for trace in trace_mapper.geth_trace_to_traces(geth_trace))
+    return items
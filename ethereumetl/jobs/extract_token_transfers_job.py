@@ -33,11 +33,13 @@ class ExtractTokenTransfersJob(BaseJob):
             logs_iterable,
             batch_size,
             max_workers,
-            item_exporter):
+            item_exporter,
+            ordered=False):
         self.logs_iterable = logs_iterable
 
-        self.batch_work_executor = BatchWorkExecutor(batch_size, max_workers)
-        self.item_exporter = item_exporter
+        # With ordered token transfers are exported in the order of the logs
+        self.batch_work_executor = BatchWorkExecutor(batch_size, max_workers, ordered=ordered)
+        self.item_exporter = self.batch_work_executor.wrap_item_exporter(item_exporter)
 
         self.receipt_log_mapper = EthReceiptLogMapper()
         self.token_transfer_mapper = EthTokenTransferMapper()
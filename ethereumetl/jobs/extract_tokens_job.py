@@ -21,12 +21,14 @@
 # SOFTWARE.
 
 
-from ethereumetl.jobs.export_tokens_job import ExportTokensJob
+from ethereumetl.jobs.export_tokens_job import ExportTokensJob, DEFAULT_TOKEN_BATCH_SIZE
 
 
 class ExtractTokensJob(ExportTokensJob):
-    def __init__(self, web3, item_exporter, contracts_iterable, max_workers):
-        super().__init__(web3, item_exporter, [], max_workers)
+    def __init__(self, web3, item_exporter, contracts_iterable, max_workers, ordered=False,
+                 batch_size=DEFAULT_TOKEN_BATCH_SIZE, token_cache=None):
+        super().__init__(web3, item_exporter, [], max_workers, ordered=ordered, batch_size=batch_size,
+                         token_cache=token_cache)
         self.contracts_iterable = contracts_iterable
 
     def _export(self):
@@ -35,8 +37,9 @@ class ExtractTokensJob(ExportTokensJob):
     def _export_tokens_from_contracts(self, contracts):
         tokens = [contract for contract in contracts if contract.get('is_erc20') or contract.get('is_erc721')]
 
-        for token in tokens:
-            self._export_token(token_address=token['address'], block_number=token['block_number'])
+        self._export_tokens(
+            token_addresses=[token['address'] for token in tokens],
+            block_numbers=[token['block_number'] for token in tokens])
 
 
 
@@ -40,6 +40,24 @@ def generate_trace_block_by_number_json_rpc(block_numbers):
         )
 
 
+def generate_trace_block_json_rpc(block_numbers):
+    for idx, block_number in enumerate(block_numbers):
+        yield generate_json_rpc(
+            method='trace_block',
+            params=[hex(block_number)],
+            request_id=idx
+        )
+
+
+def generate_trace_filter_json_rpc(block_ranges):
+    for idx, (start_block, end_block) in enumerate(block_ranges):
+        yield generate_json_rpc(
+            method='trace_filter',
+            params=[{'fromBlock': hex(start_block), 'toBlock': hex(end_block)}],
+            request_id=idx
+        )
+
+
 def generate_get_receipt_json_rpc(transaction_hashes):
     for idx, transaction_hash in enumerate(transaction_hashes):
         yield generate_json_rpc(
@@ -49,6 +67,15 @@ def generate_get_receipt_json_rpc(transaction_hashes):
         )
 
 
+def generate_get_block_receipts_json_rpc(block_numbers):
+    for idx, block_number in enumerate(block_numbers):
+        yield generate_json_rpc(
+            method='eth_getBlockReceipts',
+            params=[hex(block_number)],
+            request_id=idx
+        )
+
+
 def generate_get_code_json_rpc(contract_addresses, block='latest'):
     for idx, contract_address in enumerate(contract_addresses):
         yield generate_json_rpc(
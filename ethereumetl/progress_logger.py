@@ -28,8 +28,10 @@ from ethereumetl.atomic_counter import AtomicCounter
 
 # Thread safe progress logger.
 class ProgressLogger:
-    def __init__(self, name='work', logger=None, log_percentage_step=10, log_item_step=5000):
+    def __init__(self, name='work', logger=None, log_percentage_step=10, log_item_step=5000, status_getter=None):
         self.name = name
+        # Returns a message appended to progress messages, e.g. the current batch size
+        self.status_getter = status_getter
         self.total_items = None
 
         self.start_time = None
@@ -67,6 +69,8 @@ class ProgressLogger:
                                 ('!!!' if int(percentage) > 100 else '.')
 
         if track_message is not None:
+            if self.status_getter is not None:
+                track_message = track_message + ' ' + self.status_getter()
             self.logger.info(track_message)
 
     def finish(self):
@@ -0,0 +1,77 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import asyncio
+
+from aiohttp import ClientSession
+from web3.providers.async_rpc import AsyncHTTPProvider
+
+from blockchainetl import json_codec
+from ethereumetl.executors.retry_policy import get_retry_policy, get_retry_after
+from ethereumetl.providers.sized_response import with_byte_size
+
+# Sessions are bound to the event loop they were created in, so they are cached per loop
+_sessions_by_loop = {}
+
+
+class AsyncBatchHTTPProvider(AsyncHTTPProvider):
+
+    async def make_batch_request(self, text):
+        self.logger.debug("Making request HTTP. URI: %s, Request: %s",
+                          self.endpoint_uri, text)
+        request_data = text.encode('utf-8')
+        session = get_async_session(self.endpoint_uri)
+        circuit_breaker = get_retry_policy().get_circuit_breaker(self.endpoint_uri)
+        try:
+            async with session.post(self.endpoint_uri, data=request_data, **self.get_request_kwargs()) as response:
+                response.raise_for_status()
+                raw_response = await response.read()
+        except Exception as e:
+            circuit_breaker.record_failure(get_retry_after(e))
+            raise
+        circuit_breaker.record_success()
+        response = with_byte_size(self.decode_rpc_response(raw_response), len(raw_response), raw_response)
+        self.logger.debug("Getting response HTTP. URI: %s, "
+                          "Request: %s, Response: %s",
+                          self.endpoint_uri, text, response)
+        return response
+
+    def decode_rpc_response(self, raw_response):
+        return json_codec.loads(raw_response)
+
+
+def get_async_session(endpoint_uri):
+    loop = asyncio.get_running_loop()
+    sessions = _sessions_by_loop.setdefault(loop, {})
+    session = sessions.get(endpoint_uri)
+    if session is None or session.closed:
+        session = ClientSession()
+        sessions[endpoint_uri] = session
+    return session
+
+
+async def close_async_sessions():
+    """Closes the sessions created in the running event loop. Must be called before the loop is closed."""
+    sessions = _sessions_by_loop.pop(asyncio.get_running_loop(), {})
+    for session in sessions.values():
+        await session.close()
@@ -21,17 +21,52 @@
 # SOFTWARE.
 
 
-from urllib.parse import urlparse
+from urllib.parse import urlparse, parse_qs
 
+from aiohttp import ClientTimeout
 from web3 import IPCProvider, HTTPProvider
 
+from ethereumetl.providers.async_rpc import AsyncBatchHTTPProvider
+from ethereumetl.providers.cache import CachingBatchProvider, AsyncCachingBatchProvider
 from ethereumetl.providers.ipc import BatchIPCProvider
+from ethereumetl.providers.pool import BatchProviderPool
+from ethereumetl.providers.replay import RpcArchiveWriter, RecordingProvider, AsyncRecordingProvider, \
+    ReplayProvider, AsyncReplayProvider, load_rpc_archive
 from ethereumetl.providers.rpc import BatchHTTPProvider
 
 DEFAULT_TIMEOUT = 60
 
+# Providers created while it's set record their requests and responses to it, see record_rpc_requests
+_rpc_archive_writer = None
+
+
+def record_rpc_requests(path):
+    """Makes providers created afterwards record every request and response to an archive at path.
+
+    The archive can be replayed without a node with a replay:// provider URI.
+    """
+    global _rpc_archive_writer
+    _rpc_archive_writer = RpcArchiveWriter(path)
+    return _rpc_archive_writer
+
+
+def get_provider_from_uri(uri_string, timeout=DEFAULT_TIMEOUT, batch=False, rpc_cache=None):
+    if rpc_cache is not None:
+        return CachingBatchProvider(get_provider_from_uri(uri_string, timeout=timeout, batch=batch), rpc_cache)
+
+    provider = _get_provider_from_uri(uri_string, timeout, batch)
+    if _rpc_archive_writer is not None:
+        return RecordingProvider(provider, _rpc_archive_writer)
+    return provider
+
+
+def _get_provider_from_uri(uri_string, timeout, batch):
+    uri_strings = [uri.strip() for uri in uri_string.split(',') if uri.strip()]
+    if len(uri_strings) > 1:
+        return BatchProviderPool({
+            uri: _get_provider_from_uri(uri, timeout, batch) for uri in uri_strings
+        })
 
-def get_provider_from_uri(uri_string, timeout=DEFAULT_TIMEOUT, batch=False):
     uri = urlparse(uri_string)
     if uri.scheme == 'file':
         if batch:
@@ -44,6 +79,38 @@ def get_provider_from_uri(uri_string, timeout=DEFAULT_TIMEOUT, batch=False):
             return BatchHTTPProvider(uri_string, request_kwargs=request_kwargs)
         else:
             return HTTPProvider(uri_string, request_kwargs=request_kwargs)
+    elif uri.scheme == 'ws' or uri.scheme == 'wss':
+        # Imported here, so the websockets package is only needed for ws URIs
+        from ethereumetl.providers.websocket import BatchWebsocketProvider
+        # Handles both single requests and batches over connections shared by all threads
+        return BatchWebsocketProvider(uri_string, timeout=timeout)
+    elif uri.scheme == 'replay':
+        return ReplayProvider(load_rpc_archive(uri.netloc + uri.path), emulate_latency=_emulate_latency(uri))
     else:
         raise ValueError('Unknown uri scheme {}'.format(uri_string))
 
+
+def get_async_provider_from_uri(uri_string, timeout=DEFAULT_TIMEOUT, rpc_cache=None):
+    if rpc_cache is not None:
+        return AsyncCachingBatchProvider(get_async_provider_from_uri(uri_string, timeout=timeout), rpc_cache)
+
+    provider = _get_async_provider_from_uri(uri_string, timeout)
+    if _rpc_archive_writer is not None:
+        return AsyncRecordingProvider(provider, _rpc_archive_writer)
+    return provider
+
+
+def _get_async_provider_from_uri(uri_string, timeout):
+    uri = urlparse(uri_string)
+    if uri.scheme == 'http' or uri.scheme == 'https':
+        request_kwargs = {'timeout': ClientTimeout(total=timeout)}
+        return AsyncBatchHTTPProvider(uri_string, request_kwargs=request_kwargs)
+    elif uri.scheme == 'replay':
+        return AsyncReplayProvider(load_rpc_archive(uri.netloc + uri.path), emulate_latency=_emulate_latency(uri))
+    else:
+        raise ValueError('Unsupported uri scheme for async provider {}'.format(uri_string))
+
+
+def _emulate_latency(uri):
+    values = parse_qs(uri.query).get('emulate_latency', ['false'])
+    return values[-1].lower() in ['1', 'true', 'yes']
@@ -0,0 +1,156 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import asyncio
+import logging
+import time
+
+from blockchainetl import json_codec
+from ethereumetl.executors.retry_policy import get_retry_policy, RETRIES
+from ethereumetl.providers.rpc_metrics import measure_rpc_request, get_batch_method
+from ethereumetl.providers.sized_response import get_byte_size, with_byte_size
+from ethereumetl.utils import is_retriable_error, is_method_not_found_error, is_revert_error
+
+DEFAULT_MAX_RETRIES = 5
+
+logger = logging.getLogger('BatchRequest')
+
+
+def make_batch_request(batch_web3_provider, requests, max_retries=DEFAULT_MAX_RETRIES, retry_policy=None):
+    """Sends the requests in a batch. Requests that failed with a retriable error are re-sent in a smaller batch.
+
+    Successful responses are kept, so one failed entry doesn't cost a round trip per request in the batch.
+    Requests still failing after max_retries, or once the retry budget is exhausted, are returned with their last
+    response, for the caller to handle. The responses are returned in the order of the requests, nodes can answer
+    a batch in any order.
+    """
+    retry_policy = retry_policy if retry_policy is not None else get_retry_policy()
+    backoff = retry_policy.create_backoff()
+    response = _send_batch(batch_web3_provider, requests)
+    for retry in range(max_retries):
+        retry_requests = _get_requests_to_retry(requests, response)
+        delay = retry_policy.get_retry_delay(backoff) if retry_requests else None
+        if delay is None:
+            break
+        logger.info('Retrying {} of {} requests in the batch after {:.1f} seconds. Retry #{}'.format(
+            len(retry_requests), len(requests), delay, retry))
+        RETRIES.inc(len(retry_requests))
+        time.sleep(delay)
+        retry_response = _send_batch(batch_web3_provider, retry_requests)
+        response = _merge_responses(requests, response, retry_response)
+    return _order_responses(requests, response)
+
+
+async def make_batch_request_async(batch_web3_provider, requests, max_retries=DEFAULT_MAX_RETRIES,
+                                   retry_policy=None):
+    retry_policy = retry_policy if retry_policy is not None else get_retry_policy()
+    backoff = retry_policy.create_backoff()
+    response = await _send_batch_async(batch_web3_provider, requests)
+    for retry in range(max_retries):
+        retry_requests = _get_requests_to_retry(requests, response)
+        delay = retry_policy.get_retry_delay(backoff) if retry_requests else None
+        if delay is None:
+            break
+        logger.info('Retrying {} of {} requests in the batch after {:.1f} seconds. Retry #{}'.format(
+            len(retry_requests), len(requests), delay, retry))
+        RETRIES.inc(len(retry_requests))
+        await asyncio.sleep(delay)
+        retry_response = await _send_batch_async(batch_web3_provider, retry_requests)
+        response = _merge_responses(requests, response, retry_response)
+    return _order_responses(requests, response)
+
+
+def _send_batch(batch_web3_provider, requests):
+    with measure_rpc_request(get_batch_method(requests)):
+        return batch_web3_provider.make_batch_request(json_codec.dumps(requests))
+
+
+async def _send_batch_async(batch_web3_provider, requests):
+    with measure_rpc_request(get_batch_method(requests)):
+        return await batch_web3_provider.make_batch_request(json_codec.dumps(requests))
+
+
+def is_retriable_response(response_item):
+    """Same conditions as rpc_response_to_result raising RetriableValueError.
+
+    Unsupported methods and reverted calls are not retried, even if the node reports them with a generic error code.
+    """
+    if response_item.get('result') is not None:
+        return False
+    error = response_item.get('error')
+    if error is None:
+        return True
+    return is_retriable_error(error.get('code')) and not is_method_not_found_error(error) \
+        and not is_revert_error(error)
+
+
+def _get_requests_to_retry(requests, response):
+    responses_by_id = _index_by_id(requests, response)
+    if responses_by_id is None:
+        return []
+    return [request for request in requests
+            if request['id'] not in responses_by_id or is_retriable_response(responses_by_id[request['id']])]
+
+
+def _merge_responses(requests, response, retry_response):
+    responses_by_id = _index_by_id(requests, response)
+    retry_responses_by_id = _index_by_id(requests, retry_response)
+    if retry_responses_by_id is None:
+        # E.g. an error for the whole retry batch
+        return response
+    responses_by_id.update(retry_responses_by_id)
+    merged_response = [responses_by_id[request['id']] for request in requests if request['id'] in responses_by_id]
+
+    byte_size = get_byte_size(response)
+    retry_byte_size = get_byte_size(retry_response)
+    if byte_size is not None and retry_byte_size is not None:
+        return with_byte_size(merged_response, byte_size + retry_byte_size)
+    return merged_response
+
+
+def _order_responses(requests, response):
+    responses_by_id = _index_by_id(requests, response)
+    if responses_by_id is None:
+        return response
+    ordered_response = [responses_by_id[request['id']] for request in requests if request['id'] in responses_by_id]
+    if all(response_item is ordered_item for response_item, ordered_item in zip(response, ordered_response)):
+        # Keeps the raw response, it's passed to the CPU workers as is
+        return response
+
+    # The raw response has the node's order, it's not kept
+    byte_size = get_byte_size(response)
+    if byte_size is not None:
+        return with_byte_size(ordered_response, byte_size)
+    return ordered_response
+
+
+def _index_by_id(requests, response):
+    """Returns None if the responses can't be matched to the requests, e.g. the node returned an error for the batch."""
+    if not isinstance(response, list):
+        return None
+    request_ids = set(request.get('id') for request in requests)
+    responses_by_id = {response_item.get('id'): response_item for response_item in response}
+    if len(request_ids) != len(requests) or len(responses_by_id) != len(response) \
+            or not request_ids.issuperset(responses_by_id):
+        return None
+    return responses_by_id
@@ -0,0 +1,330 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+import zlib
+
+from web3.providers.base import BaseProvider
+
+from blockchainetl import json_codec
+
+DEFAULT_RPC_CACHE_MAX_SIZE_MB = 10 * 1024
+DEFAULT_FINALITY_DEPTH = 128
+# The chain head is refreshed at most this often, and only when a response could be too recent to cache
+HEAD_REFRESH_INTERVAL_SECONDS = 10
+COMPRESSION_LEVEL = 3
+# Evicting down to a fraction of the maximum size avoids running an eviction after every write
+EVICTION_TARGET_RATIO = 0.9
+SQLITE_MAX_VARIABLES = 500
+
+# Index of the block number parameter for methods whose response depends only on the block
+BLOCK_NUMBER_PARAM_INDEXES = {
+    'eth_getBlockByNumber': 0,
+    'eth_getBlockReceipts': 0,
+    'eth_getBlockTransactionCountByNumber': 0,
+    'eth_getUncleByBlockNumberAndIndex': 0,
+    'trace_block': 0,
+    'debug_traceBlockByNumber': 0,
+    'eth_getBalance': 1,
+    'eth_getCode': 1,
+    'eth_call': 1,
+    'eth_getStorageAt': 2,
+}
+# Methods addressed by hash whose result contains the block number
+RESULT_BLOCK_NUMBER_METHODS = {
+    'eth_getBlockByHash',
+    'eth_getTransactionByHash',
+    'eth_getTransactionReceipt',
+}
+
+logger = logging.getLogger('RpcResponseCache')
+
+
+class RpcResponseCache:
+    """Stores compressed JSON-RPC responses in SQLite, keyed on a hash of the method and params.
+
+    Only successful responses for blocks at least finality_depth blocks behind the chain head are admitted,
+    so reorgs can't leave stale data in the cache. The least recently used responses are evicted when the total
+    compressed size exceeds max_size_bytes. The cache can be shared by providers in different threads.
+    """
+
+    def __init__(self, path, max_size_bytes=DEFAULT_RPC_CACHE_MAX_SIZE_MB * 1024 * 1024,
+                 finality_depth=DEFAULT_FINALITY_DEPTH):
+        self.path = path
+        self.max_size_bytes = max_size_bytes
+        self.finality_depth = finality_depth
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS rpc_responses '
+            '(key BLOB PRIMARY KEY, response BLOB NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)')
+        self._connection.execute(
+            'CREATE INDEX IF NOT EXISTS rpc_responses_last_access ON rpc_responses (last_access)')
+        self.size_bytes = self._connection.execute('SELECT COALESCE(SUM(size), 0) FROM rpc_responses').fetchone()[0]
+
+    def get_many(self, keys):
+        """Returns a dict from key to response for the keys found in the cache."""
+        responses = {}
+        if not keys:
+            return responses
+        with self._lock:
+            for index in range(0, len(keys), SQLITE_MAX_VARIABLES):
+                key_batch = keys[index:index + SQLITE_MAX_VARIABLES]
+                rows = self._connection.execute(
+                    'SELECT key, response FROM rpc_responses WHERE key IN ({})'.format(','.join('?' * len(key_batch))),
+                    key_batch).fetchall()
+                for key, response in rows:
+                    responses[key] = json_codec.loads(zlib.decompress(response))
+            if responses:
+                now = time.time()
+                self._connection.executemany(
+                    'UPDATE rpc_responses SET last_access = ? WHERE key = ?', [(now, key) for key in responses])
+        return responses
+
+    def put_many(self, responses_by_key):
+        if not responses_by_key:
+            return
+        rows = []
+        now = time.time()
+        for key, response in responses_by_key.items():
+            compressed = zlib.compress(json_codec.dumps_bytes(response), COMPRESSION_LEVEL)
+            rows.append((key, compressed, len(compressed), now))
+        with self._lock:
+            self._connection.execute('BEGIN')
+            try:
+                for row in rows:
+                    # Keys are content addressed so an existing entry already has the same response
+                    cursor = self._connection.execute(
+                        'INSERT OR IGNORE INTO rpc_responses (key, response, size, last_access) VALUES (?, ?, ?, ?)',
+                        row)
+                    if cursor.rowcount > 0:
+                        self.size_bytes += row[2]
+                if self.size_bytes > self.max_size_bytes:
+                    self._evict()
+                self._connection.execute('COMMIT')
+            except Exception:
+                self._connection.execute('ROLLBACK')
+                raise
+
+    def _evict(self):
+        target_size = int(self.max_size_bytes * EVICTION_TARGET_RATIO)
+        evicted_count = 0
+        while self.size_bytes > target_size:
+            rows = self._connection.execute(
+                'SELECT key, size FROM rpc_responses ORDER BY last_access LIMIT ?', (SQLITE_MAX_VARIABLES,)).fetchall()
+            if not rows:
+                self.size_bytes = 0
+                break
+            keys = []
+            for key, size in rows:
+                keys.append((key,))
+                self.size_bytes -= size
+                if self.size_bytes <= target_size:
+                    break
+            self._connection.executemany('DELETE FROM rpc_responses WHERE key = ?', keys)
+            evicted_count += len(keys)
+        logger.debug('Evicted {} responses from RPC cache {}'.format(evicted_count, self.path))
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class CachingBatchProvider(BaseProvider):
+    """Serves JSON-RPC requests from an RpcResponseCache and forwards the rest to the wrapped provider."""
+
+    def __init__(self, provider, cache):
+        super().__init__()
+        self.provider = provider
+        self.cache = cache
+        self._head_block_number = None
+        self._head_refreshed_at = 0
+
+    def make_request(self, method, params):
+        request = {'jsonrpc': '2.0', 'method': method, 'params': params, 'id': 1}
+        cached_responses, missing_requests = self._lookup([request])
+        if not missing_requests:
+            return cached_responses[0]
+        response = self.provider.make_request(method, params)
+        self._update_head_if_needed(missing_requests, [response])
+        self._store(missing_requests, [response])
+        return response
+
+    def make_batch_request(self, text):
+        requests = json_codec.loads(text)
+        cached_responses, missing_requests = self._lookup(_as_list(requests))
+        response = None
+        if missing_requests:
+            response = self.provider.make_batch_request(json_codec.dumps(missing_requests))
+            if isinstance(response, list):
+                self._update_head_if_needed(missing_requests, response)
+                self._store(missing_requests, response)
+        return self._merge(requests, cached_responses, response)
+
+    def isConnected(self):
+        return self.provider.isConnected()
+
+    def _update_head_if_needed(self, requests, responses):
+        if self._should_refresh_head(requests, responses):
+            self._set_head(self.provider.make_request('eth_blockNumber', []))
+
+    def _lookup(self, requests):
+        keys = [get_request_key(request) for request in requests]
+        cached = self.cache.get_many([key for key in keys if key is not None])
+        cached_responses = []
+        missing_requests = []
+        for request, key in zip(requests, keys):
+            response = cached.get(key)
+            if response is None:
+                missing_requests.append(request)
+            else:
+                response['id'] = request.get('id')
+                cached_responses.append(response)
+        return cached_responses, missing_requests
+
+    def _store(self, requests, responses):
+        safe_block_number = self._safe_block_number()
+        if safe_block_number is None:
+            return
+        requests_by_id = {request.get('id'): request for request in requests}
+        responses_by_key = {}
+        for response in responses:
+            request = requests_by_id.get(response.get('id'))
+            if request is None or response.get('result') is None or response.get('error') is not None:
+                continue
+            block_number = get_block_number(request, response)
+            key = get_request_key(request)
+            if block_number is not None and block_number <= safe_block_number and key is not None:
+                responses_by_key[key] = {k: v for k, v in response.items() if k != 'id'}
+        self.cache.put_many(responses_by_key)
+
+    def _merge(self, requests, cached_responses, response):
+        if not cached_responses:
+            return response
+        if response is not None and not isinstance(response, list):
+            # An error for the whole batch
+            return response
+        responses = cached_responses + (response or [])
+        if isinstance(requests, list):
+            position_by_id = {request.get('id'): position for position, request in enumerate(requests)}
+            return sorted(responses, key=lambda r: position_by_id.get(r.get('id'), len(requests)))
+        else:
+            return responses[0]
+
+    def _should_refresh_head(self, requests, responses):
+        if time.time() - self._head_refreshed_at < HEAD_REFRESH_INTERVAL_SECONDS:
+            return False
+        safe_block_number = self._safe_block_number()
+        if safe_block_number is None:
+            return True
+        requests_by_id = {request.get('id'): request for request in requests}
+        for response in responses:
+            request = requests_by_id.get(response.get('id'))
+            if request is not None:
+                block_number = get_block_number(request, response)
+                if block_number is not None and block_number > safe_block_number:
+                    return True
+        return False
+
+    def _set_head(self, response):
+        self._head_refreshed_at = time.time()
+        if response.get('result') is not None:
+            self._head_block_number = int(response['result'], 16)
+
+    def _safe_block_number(self):
+        if self._head_block_number is None:
+            return None
+        return self._head_block_number - self.cache.finality_depth
+
+
+class AsyncCachingBatchProvider(CachingBatchProvider):
+    """CachingBatchProvider for providers with coroutine make_request and make_batch_request."""
+
+    async def make_request(self, method, params):
+        request = {'jsonrpc': '2.0', 'method': method, 'params': params, 'id': 1}
+        cached_responses, missing_requests = self._lookup([request])
+        if not missing_requests:
+            return cached_responses[0]
+        response = await self.provider.make_request(method, params)
+        await self._update_head_if_needed(missing_requests, [response])
+        self._store(missing_requests, [response])
+        return response
+
+    async def make_batch_request(self, text):
+        requests = json_codec.loads(text)
+        cached_responses, missing_requests = self._lookup(_as_list(requests))
+        response = None
+        if missing_requests:
+            response = await self.provider.make_batch_request(json_codec.dumps(missing_requests))
+            if isinstance(response, list):
+                await self._update_head_if_needed(missing_requests, response)
+                self._store(missing_requests, response)
+        return self._merge(requests, cached_responses, response)
+
+    async def _update_head_if_needed(self, requests, responses):
+        if self._should_refresh_head(requests, responses):
+            self._set_head(await self.provider.make_request('eth_blockNumber', []))
+
+
+def open_rpc_cache(path, max_size_mb=DEFAULT_RPC_CACHE_MAX_SIZE_MB, finality_depth=DEFAULT_FINALITY_DEPTH):
+    if path is None:
+        return None
+    return RpcResponseCache(path, max_size_bytes=max_size_mb * 1024 * 1024, finality_depth=finality_depth)
+
+
+def get_request_key(request):
+    method = request.get('method')
+    if method is None:
+        return None
+    return hashlib.sha256(json_codec.dumps_bytes([method, request.get('params') or []])).digest()
+
+
+def get_block_number(request, response):
+    """Returns the number of the block the response belongs to, or None if it isn't tied to a specific block."""
+    method = request.get('method')
+    param_index = BLOCK_NUMBER_PARAM_INDEXES.get(method)
+    if param_index is not None:
+        params = request.get('params') or []
+        block = params[param_index] if len(params) > param_index else None
+        return _parse_block_number(block)
+    if method in RESULT_BLOCK_NUMBER_METHODS:
+        result = response.get('result')
+        if isinstance(result, dict):
+            return _parse_block_number(result.get('blockNumber', result.get('number')))
+    return None
+
+
+def _parse_block_number(block):
+    if isinstance(block, str) and block.startswith('0x'):
+        return int(block, 16)
+    return None
+
+
+def _as_list(requests):
+    return requests if isinstance(requests, list) else [requests]
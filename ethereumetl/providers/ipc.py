@@ -21,7 +21,7 @@
 # SOFTWARE.
 
 
-import json
+import re
 import socket
 
 from web3.providers.ipc import IPCProvider
@@ -29,20 +29,37 @@ from web3._utils.threads import (
     Timeout,
 )
 
-try:
-    from json import JSONDecodeError
-except ImportError:
-    JSONDecodeError = ValueError
+from blockchainetl import json_codec
+from ethereumetl.providers.sized_response import with_byte_size
+
+INITIAL_READ_BUFFER_SIZE = 64 * 1024
+# Buffers grown for occasional huge responses are not kept around beyond this size
+MAX_RETAINED_READ_BUFFER_SIZE = 64 * 1024 * 1024
+
+# Matches JSON strings, including a string cut off at the end of the received data, and brackets outside of strings
+JSON_TOKEN_REGEX = re.compile(
+    rb'(?P<string>"[^"\\]*(?:\\.[^"\\]*)*")'
+    rb'|(?P<partial_string>"[^"\\]*(?:\\.[^"\\]*)*\\?\Z)'
+    rb'|(?P<open>[\[{])'
+    rb'|(?P<close>[\]}])'
+)
+CLOSING_BRACKETS = frozenset(b']}')
+WHITESPACE = frozenset(b' \t\r\n')
 
 
-# Mostly copied from web3.py/providers/ipc.py. Supports batch requests.
-# Will be removed once batch feature is added to web3.py https://github.com/ethereum/web3.py/issues/832
-# Also see this optimization https://github.com/ethereum/web3.py/pull/849
 class BatchIPCProvider(IPCProvider):
     _socket = None
+    _reader = None
+
+    def make_request(self, method, params):
+        return self._make_request(self.encode_rpc_request(method, params))
 
     def make_batch_request(self, text):
-        request = text.encode('utf-8')
+        return self._make_request(text.encode('utf-8'))
+
+    def _make_request(self, request):
+        if self._reader is None:
+            self._reader = JsonResponseReader()
         with self._lock, self._socket as sock:
             try:
                 sock.sendall(request)
@@ -51,33 +68,84 @@ class BatchIPCProvider(IPCProvider):
                 sock = self._socket.reset()
                 sock.sendall(request)
 
-            raw_response = b""
             with Timeout(self.timeout) as timeout:
-                while True:
-                    try:
-                        raw_response += sock.recv(4096)
-                    except socket.timeout:
-                        timeout.sleep(0)
-                        continue
-                    if raw_response == b"":
-                        timeout.sleep(0)
-                    elif has_valid_json_rpc_ending(raw_response):
-                        try:
-                            response = json.loads(raw_response.decode('utf-8'))
-                        except JSONDecodeError:
-                            timeout.sleep(0)
-                            continue
-                        else:
-                            return response
-                    else:
-                        timeout.sleep(0)
-                        continue
-
-
-# A valid JSON RPC response can only end in } or ] http://www.jsonrpc.org/specification
-def has_valid_json_rpc_ending(raw_response):
-    for valid_ending in [b"}\n", b"]\n"]:
-        if raw_response.endswith(valid_ending):
-            return True
-    else:
-        return False
+                return self._reader.read(sock, timeout)
+
+
+class JsonResponseReader:
+    """Reads one JSON document from a socket into a reusable buffer with recv_into.
+
+    Geth and Erigon write each response on one line, so a response is complete once the received data ends with
+    a closing bracket and a newline. It's decoded exactly once, without looking at the data in between. For servers
+    that don't end responses with a newline, the end of the document is found by tracking the bracket depth. That
+    scan only runs when the data received so far ends with a closing bracket, and never once the server was seen
+    to end responses with a newline. The buffer doubles when full and is reused for the next response.
+    """
+
+    def __init__(self, initial_buffer_size=INITIAL_READ_BUFFER_SIZE):
+        self.initial_buffer_size = initial_buffer_size
+        self.buffer = bytearray(initial_buffer_size)
+        self.newline_delimited = False
+
+    def read(self, sock, timeout):
+        buffer = self.buffer
+        filled = 0
+        scan_position = 0
+        depth = 0
+        while True:
+            if filled == len(buffer):
+                buffer.extend(bytes(len(buffer)))
+            with memoryview(buffer) as view:
+                try:
+                    received = sock.recv_into(view[filled:])
+                except socket.timeout:
+                    timeout.sleep(0)
+                    continue
+            if received == 0:
+                raise ConnectionError('IPC socket was closed before the response was received')
+            filled += received
+
+            end = filled
+            while end > 1 and buffer[end - 1] in WHITESPACE:
+                end -= 1
+            if buffer[end - 1] not in CLOSING_BRACKETS:
+                continue
+            if end < filled:
+                response = self._decode(end)
+                if response is not None:
+                    self.newline_delimited = True
+                    return response
+            if self.newline_delimited:
+                continue
+
+            for match in JSON_TOKEN_REGEX.finditer(buffer, scan_position, filled):
+                token_type = match.lastgroup
+                if token_type == 'partial_string':
+                    # The rest of the string hasn't been received yet, it will be scanned again from its start
+                    break
+                elif token_type == 'open':
+                    depth += 1
+                elif token_type == 'close':
+                    depth -= 1
+                    if depth == 0:
+                        return self._decode(match.end(), ignore_errors=False)
+                scan_position = match.end()
+            else:
+                scan_position = filled
+
+    def _decode(self, size, ignore_errors=True):
+        """Returns None if the data isn't a complete JSON document and ignore_errors is set."""
+        try:
+            with memoryview(self.buffer) as view:
+                response = with_byte_size(json_codec.loads(view[:size]), size)
+        except ValueError:
+            if ignore_errors:
+                return None
+            raise
+        self._release_buffer()
+        return response
+
+    def _release_buffer(self):
+        if len(self.buffer) > MAX_RETAINED_READ_BUFFER_SIZE:
+            self.buffer = bytearray(self.initial_buffer_size)
+
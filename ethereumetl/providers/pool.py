@@ -0,0 +1,146 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import logging
+import random
+import threading
+import time
+
+from web3.providers.base import BaseProvider
+
+from ethereumetl.executors.batch_work_executor import RETRY_EXCEPTIONS
+
+# An endpoint is ejected from the pool after this number of consecutive failures
+EJECT_AFTER_FAILURES = 3
+EJECTION_PERIOD_SECONDS = 10
+MAX_EJECTION_PERIOD_SECONDS = 5 * 60
+LATENCY_SMOOTHING_FACTOR = 0.3
+ERROR_RATE_SMOOTHING_FACTOR = 0.1
+MIN_WEIGHT = 0.01
+
+# Health is shared by all pools in the process, as pools are usually created per thread with ThreadLocalProxy
+_endpoint_health_registry = {}
+_endpoint_health_registry_lock = threading.Lock()
+
+
+class EndpointHealth:
+    def __init__(self, uri):
+        self.uri = uri
+        self.latency = None
+        self.error_rate = 0.0
+        self.consecutive_failures = 0
+        self.ejection_count = 0
+        self.ejected_until = 0
+        self._lock = threading.Lock()
+
+    def record_success(self, latency):
+        with self._lock:
+            if self.latency is None:
+                self.latency = latency
+            else:
+                self.latency = LATENCY_SMOOTHING_FACTOR * latency + (1 - LATENCY_SMOOTHING_FACTOR) * self.latency
+            self.error_rate = (1 - ERROR_RATE_SMOOTHING_FACTOR) * self.error_rate
+            self.consecutive_failures = 0
+            self.ejection_count = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.error_rate = ERROR_RATE_SMOOTHING_FACTOR + (1 - ERROR_RATE_SMOOTHING_FACTOR) * self.error_rate
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= EJECT_AFTER_FAILURES:
+                ejection_period = min(EJECTION_PERIOD_SECONDS * 2 ** self.ejection_count, MAX_EJECTION_PERIOD_SECONDS)
+                self.ejected_until = time.time() + ejection_period
+                self.ejection_count += 1
+                return ejection_period
+        return None
+
+    def is_ejected(self, now=None):
+        return self.ejected_until > (now if now is not None else time.time())
+
+    def weight(self, default_latency):
+        latency = self.latency if self.latency is not None else default_latency
+        return max((1 - self.error_rate) / max(latency, 1e-6), MIN_WEIGHT)
+
+
+def get_endpoint_health(uri):
+    with _endpoint_health_registry_lock:
+        health = _endpoint_health_registry.get(uri)
+        if health is None:
+            health = EndpointHealth(uri)
+            _endpoint_health_registry[uri] = health
+        return health
+
+
+# Spreads requests across multiple providers. Endpoints are picked randomly with probability proportional to
+# their weight, which is inversely proportional to the observed latency and decreases with the error rate.
+# Endpoints that keep failing are ejected for a period of time, failed requests are retried on other endpoints.
+class BatchProviderPool(BaseProvider):
+    def __init__(self, providers_by_uri, retry_exceptions=RETRY_EXCEPTIONS):
+        if len(providers_by_uri) == 0:
+            raise ValueError('At least one provider is required')
+        self.endpoints = [(provider, get_endpoint_health(uri)) for uri, provider in providers_by_uri.items()]
+        self.retry_exceptions = retry_exceptions
+        self.logger = logging.getLogger('BatchProviderPool')
+
+    def make_request(self, method, params):
+        return self._execute(lambda provider: provider.make_request(method, params))
+
+    def make_batch_request(self, text):
+        return self._execute(lambda provider: provider.make_batch_request(text))
+
+    def isConnected(self):
+        return any(provider.isConnected() for provider, _ in self.endpoints)
+
+    def _execute(self, func):
+        tried = set()
+        while True:
+            provider, health = self._pick_endpoint(exclude=tried)
+            start_time = time.time()
+            try:
+                result = func(provider)
+            except self.retry_exceptions:
+                tried.add(health.uri)
+                ejection_period = health.record_failure()
+                if ejection_period is not None:
+                    self.logger.warning('Ejecting {} for {} seconds after {} consecutive failures.'.format(
+                        health.uri, ejection_period, health.consecutive_failures))
+                if len(tried) >= len(self.endpoints):
+                    raise
+                self.logger.warning('Request to {} failed, retrying on another endpoint.'.format(health.uri), exc_info=True)
+                continue
+            health.record_success(time.time() - start_time)
+            return result
+
+    def _pick_endpoint(self, exclude):
+        candidates = [endpoint for endpoint in self.endpoints if endpoint[1].uri not in exclude]
+        now = time.time()
+        available = [endpoint for endpoint in candidates if not endpoint[1].is_ejected(now)]
+        if len(available) == 0:
+            # All endpoints are ejected, try the one that is going to be back soonest
+            return min(candidates, key=lambda endpoint: endpoint[1].ejected_until)
+
+        known_latencies = [health.latency for _, health in available if health.latency is not None]
+        # Endpoints without observations get the average latency so they receive a fair share of requests
+        default_latency = sum(known_latencies) / len(known_latencies) if len(known_latencies) > 0 else 1.0
+        weights = [health.weight(default_latency) for _, health in available]
+        return random.choices(available, weights=weights)[0]
@@ -0,0 +1,236 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import asyncio
+import collections
+import gzip
+import threading
+import time
+
+from web3.providers.base import BaseProvider
+
+from blockchainetl import json_codec
+
+ARCHIVE_FORMAT_VERSION = 1
+
+# Archives are loaded once and shared by the replay providers of all threads
+_archives = {}
+_archives_lock = threading.Lock()
+
+
+class ReplayMissError(LookupError):
+    pass
+
+
+class RpcArchiveWriter:
+    """Writes JSON-RPC requests and responses to a gzipped JSON lines archive, one line per batch.
+
+    Each line holds the [method, params] of the requests, the responses without ids, the time the batch
+    was sent relative to the start of the recording and its latency in seconds.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = gzip.open(path, 'wb')
+        self._lock = threading.Lock()
+        self._started_at = time.time()
+        self._write({'version': ARCHIVE_FORMAT_VERSION})
+
+    def write_batch(self, requests, responses, sent_at, latency):
+        record_requests = []
+        record_responses = []
+        for request, response in _pair_responses(requests, responses):
+            record_requests.append([request.get('method'), request.get('params') or []])
+            record_responses.append({k: v for k, v in response.items() if k != 'id'})
+        self._write({
+            'time': round(sent_at - self._started_at, 6),
+            'latency': round(latency, 6),
+            'requests': record_requests,
+            'responses': record_responses,
+        })
+
+    def _write(self, record):
+        line = json_codec.dumps_bytes(record) + b'\n'
+        with self._lock:
+            self._file.write(line)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class RecordingProvider(BaseProvider):
+    """Forwards requests to the wrapped provider and records them with their responses and latency."""
+
+    def __init__(self, provider, writer):
+        super().__init__()
+        self.provider = provider
+        self.writer = writer
+
+    def make_request(self, method, params):
+        sent_at = time.time()
+        response = self.provider.make_request(method, params)
+        self._record([{'method': method, 'params': params, 'id': response.get('id')}], [response], sent_at)
+        return response
+
+    def make_batch_request(self, text):
+        sent_at = time.time()
+        response = self.provider.make_batch_request(text)
+        self._record(json_codec.loads(text), response, sent_at)
+        return response
+
+    def isConnected(self):
+        return self.provider.isConnected()
+
+    def _record(self, requests, response, sent_at):
+        # Errors for the whole batch aren't recorded, they are retried by the jobs
+        if isinstance(requests, dict):
+            requests, response = [requests], [response]
+        if isinstance(response, list):
+            self.writer.write_batch(requests, response, sent_at, time.time() - sent_at)
+
+
+class AsyncRecordingProvider(RecordingProvider):
+
+    async def make_request(self, method, params):
+        sent_at = time.time()
+        response = await self.provider.make_request(method, params)
+        self._record([{'method': method, 'params': params, 'id': response.get('id')}], [response], sent_at)
+        return response
+
+    async def make_batch_request(self, text):
+        sent_at = time.time()
+        response = await self.provider.make_batch_request(text)
+        self._record(json_codec.loads(text), response, sent_at)
+        return response
+
+
+class RpcArchive:
+    """Recorded responses indexed by method and params.
+
+    Requests recorded several times with different responses, e.g. eth_blockNumber, get them in recorded order,
+    the last one is then repeated.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._responses = collections.defaultdict(collections.deque)
+        self._lock = threading.Lock()
+        with gzip.open(path, 'rb') as file:
+            header = json_codec.loads(file.readline())
+            if header.get('version') != ARCHIVE_FORMAT_VERSION:
+                raise ValueError('Unsupported RPC archive version {} in {}'.format(header.get('version'), path))
+            for line in file:
+                record = json_codec.loads(line)
+                for request, response in zip(record['requests'], record['responses']):
+                    self._responses[_get_key(*request)].append((response, record['latency']))
+
+    def get(self, method, params):
+        """Returns the recorded response and the latency of the batch it was recorded in."""
+        with self._lock:
+            responses = self._responses.get(_get_key(method, params or []))
+            if not responses:
+                raise ReplayMissError('Request {} {} not found in RPC archive {}'.format(method, params, self.path))
+            response, latency = responses[0] if len(responses) == 1 else responses.popleft()
+        return dict(response), latency
+
+
+class ReplayProvider(BaseProvider):
+    """Serves requests from an archive written by RecordingProvider, without a node.
+
+    With emulate_latency, each request or batch takes as long as the slowest recorded batch it has responses from.
+    """
+
+    def __init__(self, archive, emulate_latency=False):
+        super().__init__()
+        self.archive = archive
+        self.emulate_latency = emulate_latency
+
+    def make_request(self, method, params):
+        response, latency = self._replay_request({'method': method, 'params': params, 'id': 1})
+        if self.emulate_latency:
+            time.sleep(latency)
+        return response
+
+    def make_batch_request(self, text):
+        response, latency = self._replay(json_codec.loads(text))
+        if self.emulate_latency:
+            time.sleep(latency)
+        return response
+
+    def isConnected(self):
+        return True
+
+    def _replay(self, requests):
+        if isinstance(requests, dict):
+            return self._replay_request(requests)
+        responses = []
+        max_latency = 0
+        for request in requests:
+            response, latency = self._replay_request(request)
+            responses.append(response)
+            max_latency = max(max_latency, latency)
+        return responses, max_latency
+
+    def _replay_request(self, request):
+        response, latency = self.archive.get(request.get('method'), request.get('params'))
+        response['id'] = request.get('id')
+        return response, latency
+
+
+class AsyncReplayProvider(ReplayProvider):
+
+    async def make_request(self, method, params):
+        response, latency = self._replay_request({'method': method, 'params': params, 'id': 1})
+        if self.emulate_latency:
+            await asyncio.sleep(latency)
+        return response
+
+    async def make_batch_request(self, text):
+        response, latency = self._replay(json_codec.loads(text))
+        if self.emulate_latency:
+            await asyncio.sleep(latency)
+        return response
+
+
+def load_rpc_archive(path):
+    with _archives_lock:
+        archive = _archives.get(path)
+        if archive is None:
+            archive = RpcArchive(path)
+            _archives[path] = archive
+        return archive
+
+
+def _get_key(method, params):
+    return json_codec.dumps([method, params])
+
+
+def _pair_responses(requests, responses):
+    requests_by_id = {request.get('id'): request for request in requests}
+    response_ids = [response.get('id') for response in responses]
+    if len(requests_by_id) == len(requests) and len(set(response_ids)) == len(responses) \
+            and all(response_id in requests_by_id for response_id in response_ids):
+        return [(requests_by_id[response_id], response) for response_id, response in zip(response_ids, responses)]
+    # Responses without matching ids are assumed to be in request order, as the jobs do
+    return list(zip(requests, responses))
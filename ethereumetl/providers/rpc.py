@@ -24,6 +24,10 @@
 from web3 import HTTPProvider
 from web3._utils.request import make_post_request
 
+from blockchainetl import json_codec
+from ethereumetl.executors.retry_policy import get_retry_policy, get_retry_after
+from ethereumetl.providers.sized_response import with_byte_size
+
 
 # Mostly copied from web3.py/providers/rpc.py. Supports batch requests.
 # Will be removed once batch feature is added to web3.py https://github.com/ethereum/web3.py/issues/832
@@ -33,13 +37,22 @@ class BatchHTTPProvider(HTTPProvider):
         self.logger.debug("Making request HTTP. URI: %s, Request: %s",
                           self.endpoint_uri, text)
         request_data = text.encode('utf-8')
-        raw_response = make_post_request(
-            self.endpoint_uri,
-            request_data,
-            **self.get_request_kwargs()
-        )
-        response = self.decode_rpc_response(raw_response)
+        circuit_breaker = get_retry_policy().get_circuit_breaker(self.endpoint_uri)
+        try:
+            raw_response = make_post_request(
+                self.endpoint_uri,
+                request_data,
+                **self.get_request_kwargs()
+            )
+        except Exception as e:
+            circuit_breaker.record_failure(get_retry_after(e))
+            raise
+        circuit_breaker.record_success()
+        response = with_byte_size(self.decode_rpc_response(raw_response), len(raw_response), raw_response)
         self.logger.debug("Getting response HTTP. URI: %s, "
                           "Request: %s, Response: %s",
                           self.endpoint_uri, text, response)
         return response
+
+    def decode_rpc_response(self, raw_response):
+        return json_codec.loads(raw_response)
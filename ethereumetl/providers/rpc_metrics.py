@@ -0,0 +1,57 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import contextlib
+import time
+
+from blockchainetl.metrics import Counter, Histogram
+
+RPC_REQUEST_DURATION = Histogram(
+    'rpc_request_duration_seconds', 'The latency of JSON-RPC requests and batches by method.', ['method'])
+RPC_ERRORS = Counter(
+    'rpc_errors_total', 'The number of JSON-RPC requests and batches that failed with an exception by method.',
+    ['method'])
+
+
+@contextlib.contextmanager
+def measure_rpc_request(method):
+    start_time = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        RPC_ERRORS.labels(method).inc()
+        raise
+    finally:
+        RPC_REQUEST_DURATION.labels(method).observe(time.perf_counter() - start_time)
+
+
+def get_batch_method(requests):
+    """Batches are made of requests for the same method, so the first one names the batch."""
+    return requests[0].get('method', 'unknown') if requests else 'unknown'
+
+
+def rpc_metrics_middleware(make_request, w3):
+    """web3 middleware measuring the latency of each request, see build_web3."""
+    def middleware(method, params):
+        with measure_rpc_request(method):
+            return make_request(method, params)
+    return middleware
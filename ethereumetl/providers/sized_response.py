@@ -0,0 +1,55 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+from blockchainetl import json_codec
+
+
+class SizedBatchResponse(list):
+    """A decoded JSON-RPC batch response that keeps the size of the raw response in bytes.
+
+    raw_response is the raw response itself, if the provider has it as bytes anyway.
+    """
+
+    def __init__(self, responses, byte_size, raw_response=None):
+        super().__init__(responses)
+        self.byte_size = byte_size
+        self.raw_response = raw_response
+
+
+def with_byte_size(response, byte_size, raw_response=None):
+    if isinstance(response, list):
+        return SizedBatchResponse(response, byte_size, raw_response)
+    return response
+
+
+def get_byte_size(response):
+    """Returns the size of the raw response in bytes, or None if the provider didn't record it."""
+    return getattr(response, 'byte_size', None)
+
+
+def get_raw_response(response):
+    """Returns the response as JSON bytes, without encoding it again if the provider kept the raw response."""
+    raw_response = getattr(response, 'raw_response', None)
+    if raw_response is not None:
+        return raw_response
+    return json_codec.dumps_bytes(response)
@@ -0,0 +1,206 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import asyncio
+import concurrent.futures
+import itertools
+import logging
+import threading
+
+import websockets
+from web3.providers.base import JSONBaseProvider
+from web3.providers.websocket import _get_threaded_loop
+
+from blockchainetl import json_codec
+from ethereumetl.misc.retriable_value_error import RetriableValueError
+from ethereumetl.providers.sized_response import with_byte_size
+
+DEFAULT_WEBSOCKET_CONNECTIONS = 2
+
+logger = logging.getLogger('BatchWebsocketProvider')
+
+# All providers and connections share one event loop running in a background thread
+_loop = None
+_multiplexers = {}
+_lock = threading.Lock()
+
+
+class BatchWebsocketProvider(JSONBaseProvider):
+    """Sends JSON RPC requests and batches over a few persistent websocket connections shared by all instances
+    with the same endpoint, so it can be created per thread with ThreadLocalProxy."""
+
+    def __init__(self, endpoint_uri, timeout=60, connections=DEFAULT_WEBSOCKET_CONNECTIONS, websocket_kwargs=None):
+        self.endpoint_uri = endpoint_uri
+        self.timeout = timeout
+        self.multiplexer = get_websocket_multiplexer(endpoint_uri, connections, websocket_kwargs)
+        super().__init__()
+
+    def __str__(self):
+        return "WS connection {0}".format(self.endpoint_uri)
+
+    def make_request(self, method, params):
+        request = {
+            'jsonrpc': '2.0',
+            'method': method,
+            'params': params or [],
+            'id': next(self.request_counter),
+        }
+        return self.multiplexer.request(request, self.timeout)
+
+    def make_batch_request(self, text):
+        return self.multiplexer.request(json_codec.loads(text), self.timeout)
+
+    def isConnected(self):
+        try:
+            self.make_request('web3_clientVersion', [])
+            return True
+        except (OSError, websockets.exceptions.WebSocketException):
+            return False
+
+
+def get_websocket_multiplexer(endpoint_uri, connections, websocket_kwargs=None):
+    global _loop
+    with _lock:
+        if _loop is None:
+            _loop = _get_threaded_loop()
+        multiplexer = _multiplexers.get(endpoint_uri)
+        if multiplexer is None:
+            multiplexer = WebsocketMultiplexer(endpoint_uri, _loop, connections, websocket_kwargs)
+            _multiplexers[endpoint_uri] = multiplexer
+        return multiplexer
+
+
+class WebsocketMultiplexer:
+    """Request ids are rewritten to be unique across everything in flight on the connections,
+    responses are matched back to the waiting request by id and the original ids are restored."""
+
+    def __init__(self, endpoint_uri, loop, connections=DEFAULT_WEBSOCKET_CONNECTIONS, websocket_kwargs=None):
+        self.endpoint_uri = endpoint_uri
+        self.loop = loop
+        self.websocket_kwargs = dict(websocket_kwargs or {})
+        # Batch responses for receipts and traces are often larger than the default 1 MB message limit
+        self.websocket_kwargs.setdefault('max_size', None)
+        self._connections = [None] * connections
+        self._connect_locks = None
+        self._connection_counter = itertools.count()
+        self._request_ids = itertools.count(1)
+        # request id -> PendingRequest, only accessed on the loop thread
+        self._pending = {}
+
+    def request(self, payload, timeout):
+        if isinstance(payload, list) and len(payload) == 0:
+            return []
+        future = asyncio.run_coroutine_threadsafe(self._request(payload), self.loop)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError as e:
+            future.cancel()
+            raise TimeoutError('Websocket request to {} timed out after {} seconds'.format(
+                self.endpoint_uri, timeout)) from e
+
+    async def _request(self, payload):
+        websocket = await self._get_connection()
+        requests = payload if isinstance(payload, list) else [payload]
+
+        pending = PendingRequest(websocket, self.loop.create_future())
+        for request in requests:
+            request_id = next(self._request_ids)
+            pending.original_ids[request_id] = request.get('id')
+            request['id'] = request_id
+            self._pending[request_id] = pending
+
+        try:
+            await websocket.send(json_codec.dumps(payload))
+            response, byte_size = await pending.future
+        finally:
+            for request_id in pending.original_ids:
+                self._pending.pop(request_id, None)
+
+        # A batch gets a single response object if the node failed the whole batch
+        for response_item in (response if isinstance(response, list) else [response]):
+            response_item['id'] = pending.original_ids.get(response_item.get('id'))
+        return with_byte_size(response, byte_size)
+
+    async def _get_connection(self):
+        if self._connect_locks is None:
+            self._connect_locks = [asyncio.Lock() for _ in self._connections]
+        index = next(self._connection_counter) % len(self._connections)
+        async with self._connect_locks[index]:
+            websocket = self._connections[index]
+            if websocket is None or websocket.closed:
+                websocket = await websockets.connect(self.endpoint_uri, **self.websocket_kwargs)
+                self._connections[index] = websocket
+                self.loop.create_task(self._receive(websocket))
+            return websocket
+
+    async def _receive(self, websocket):
+        try:
+            async for message in websocket:
+                # Text messages are str, the byte size is the size of the UTF-8 encoded message
+                byte_size = len(message.encode('utf-8')) if isinstance(message, str) else len(message)
+                self._dispatch(websocket, json_codec.loads(message), byte_size)
+        except websockets.exceptions.ConnectionClosed:
+            logger.warning('Websocket connection to {} closed.'.format(self.endpoint_uri))
+        finally:
+            for pending in set(self._pending.values()):
+                if pending.websocket is websocket and not pending.future.done():
+                    pending.future.set_exception(
+                        ConnectionError('Websocket connection to {} closed'.format(self.endpoint_uri)))
+
+    def _dispatch(self, websocket, response, byte_size):
+        response_items = response if isinstance(response, list) else [response]
+        pending = None
+        for response_item in response_items:
+            pending = self._pending.get(response_item.get('id'))
+            if pending is not None:
+                break
+
+        if pending is None and all(response_item.get('id') is None for response_item in response_items):
+            self._dispatch_unmatched(websocket, response, byte_size)
+        elif pending is None:
+            # E.g. a late response to a request that timed out
+            logger.warning('Received a response that does not match any request: {}'.format(response))
+        elif not pending.future.done():
+            pending.future.set_result((response, byte_size))
+
+    def _dispatch_unmatched(self, websocket, response, byte_size):
+        # E.g. an error for the whole batch. With a null id it's for one of the requests waiting on this connection
+        waiting = set(pending for pending in self._pending.values()
+                      if pending.websocket is websocket and not pending.future.done())
+        logger.warning('Received a response that does not match any request, {} requests are waiting on the '
+                       'connection: {}'.format(len(waiting), response))
+        if len(waiting) == 1:
+            # Returned like an HTTP provider returns an error for the whole batch
+            waiting.pop().future.set_result((response, byte_size))
+        else:
+            # It's not known which request failed, the requests are retried instead of waiting for the timeout
+            for pending in waiting:
+                pending.future.set_exception(RetriableValueError(
+                    'Received a response that does not match any request: {}'.format(response)))
+
+
+class PendingRequest:
+    def __init__(self, websocket, future):
+        self.websocket = websocket
+        self.future = future
+        self.original_ids = {}
@@ -0,0 +1,118 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from blockchainetl import json_codec
+
+DEFAULT_BYTECODE_MEMO_SIZE = 10000
+# Worker processes write to the same file, a writer waits this long for another writer's lock
+SQLITE_TIMEOUT_SECONDS = 30
+
+
+class BytecodeMemo:
+    """Memoizes contract classifications, (function_sighashes, is_erc20, is_erc721), by the keccak hash of the bytecode.
+
+    Minimal proxies, clones and factory deployments share the same bytecode, so far fewer bytecodes than contracts
+    have to be disassembled. The max_size most recently used classifications are kept in memory. With path they are
+    also stored in SQLite, shared by worker processes and across runs.
+    """
+
+    def __init__(self, max_size=DEFAULT_BYTECODE_MEMO_SIZE, path=None):
+        self.max_size = max_size
+        self.path = path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._connection = None
+        if path is not None:
+            self._connection = sqlite3.connect(
+                path, check_same_thread=False, isolation_level=None, timeout=SQLITE_TIMEOUT_SECONDS)
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('PRAGMA synchronous=NORMAL')
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS contract_classifications '
+                '(bytecode_hash BLOB PRIMARY KEY, function_sighashes TEXT NOT NULL, '
+                'is_erc20 INTEGER NOT NULL, is_erc721 INTEGER NOT NULL)')
+
+    def get(self, bytecode_hash):
+        """Returns the classification for the bytecode hash or None if it isn't memoized."""
+        with self._lock:
+            classification = self._entries.get(bytecode_hash)
+            if classification is not None:
+                self._entries.move_to_end(bytecode_hash)
+                return classification
+            if self._connection is None:
+                return None
+            row = self._connection.execute(
+                'SELECT function_sighashes, is_erc20, is_erc721 FROM contract_classifications WHERE bytecode_hash = ?',
+                (bytecode_hash,)).fetchone()
+            if row is None:
+                return None
+            classification = (json_codec.loads(row[0]), bool(row[1]), bool(row[2]))
+            self._add_entry(bytecode_hash, classification)
+            return classification
+
+    def put(self, bytecode_hash, classification):
+        function_sighashes, is_erc20, is_erc721 = classification
+        with self._lock:
+            self._add_entry(bytecode_hash, classification)
+            if self._connection is not None:
+                # Classifications are content addressed so an existing row already has the same values
+                self._connection.execute(
+                    'INSERT OR IGNORE INTO contract_classifications '
+                    '(bytecode_hash, function_sighashes, is_erc20, is_erc721) VALUES (?, ?, ?, ?)',
+                    (bytecode_hash, json_codec.dumps(function_sighashes), int(is_erc20), int(is_erc721)))
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _add_entry(self, bytecode_hash, classification):
+        self._entries[bytecode_hash] = classification
+        self._entries.move_to_end(bytecode_hash)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+_bytecode_memos = {}
+_bytecode_memos_lock = threading.Lock()
+
+
+def get_bytecode_memo(path=None):
+    """Returns the memo of this process for the path, so it's reused by all batches mapped in the process.
+
+    Memos are per process, a SQLite connection can't be used by a forked child process.
+    """
+    key = (os.getpid(), path)
+    with _bytecode_memos_lock:
+        bytecode_memo = _bytecode_memos.get(key)
+        if bytecode_memo is None:
+            bytecode_memo = BytecodeMemo(path=path)
+            _bytecode_memos[key] = bytecode_memo
+        return bytecode_memo
@@ -19,12 +19,31 @@
 # LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
-from eth_utils import function_signature_to_4byte_selector
+from eth_utils import function_signature_to_4byte_selector, keccak
 
 from ethereum_dasm.evmdasm import EvmCode, Contract
 
 
 class EthContractService:
+    def __init__(self, bytecode_memo=None):
+        self.bytecode_memo = bytecode_memo
+
+    def classify_contract(self, bytecode):
+        """Returns (function_sighashes, is_erc20, is_erc721), memoized by the keccak hash of the bytecode."""
+        bytecode_hash = get_bytecode_hash(bytecode) if self.bytecode_memo is not None else None
+        if bytecode_hash is not None:
+            classification = self.bytecode_memo.get(bytecode_hash)
+            if classification is not None:
+                function_sighashes, is_erc20, is_erc721 = classification
+                # A copy, so changes to the exported item don't change the memo
+                return list(function_sighashes), is_erc20, is_erc721
+
+        function_sighashes = self.get_function_sighashes(bytecode)
+        classification = (
+            function_sighashes, self.is_erc20_contract(function_sighashes), self.is_erc721_contract(function_sighashes))
+        if bytecode_hash is not None:
+            self.bytecode_memo.put(bytecode_hash, (list(function_sighashes),) + classification[1:])
+        return classification
 
     def get_function_sighashes(self, bytecode):
         bytecode = clean_bytecode(bytecode)
@@ -79,6 +98,17 @@ def clean_bytecode(bytecode):
         return bytecode
 
 
+def get_bytecode_hash(bytecode):
+    bytecode = clean_bytecode(bytecode)
+    if bytecode is None:
+        return None
+    try:
+        return keccak(hexstr=bytecode)
+    except ValueError:
+        # Not valid hex, the bytecode is still classified but not memoized
+        return None
+
+
 def get_function_sighash(signature):
     return '0x' + function_signature_to_4byte_selector(signature).hex()
 
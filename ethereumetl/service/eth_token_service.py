@@ -19,20 +19,56 @@
 # LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
+import copy
 import logging
+import time
 
+from eth_abi.exceptions import DecodingError
+from eth_utils import function_signature_to_4byte_selector, to_checksum_address
 from web3.exceptions import BadFunctionCallOutput, ContractLogicError
 
 from ethereumetl.domain.token import EthToken
 from ethereumetl.erc20_abi import ERC20_ABI, ERC20_ABI_ALTERNATIVE_1
+from ethereumetl.json_rpc_requests import generate_json_rpc
+from ethereumetl.misc.retriable_value_error import RetriableValueError
+from ethereumetl.providers.batch_request import make_batch_request
+from ethereumetl.utils import is_revert_error
 
 logger = logging.getLogger('eth_token_service')
 
+# https://github.com/mds1/multicall, deployed at the same address on most EVM chains
+MULTICALL3_ADDRESS = '0xca11bde05977b3631167028862be2a173976ca11'
+AGGREGATE3_SELECTOR = function_signature_to_4byte_selector('aggregate3((address,bool,bytes)[])')
+# The number of calls in one aggregate3 call, keeps each eth_call well under the node's gas cap
+MAX_CALLS_PER_MULTICALL = 250
+# Nodes limit the number of requests in a JSON-RPC batch, e.g. erigon to 100 by default
+MAX_CALLS_PER_BATCH = 100
+
+# The functions called for each token metadata field, (signature, return type) in the order they are tried.
+# These are the functions of ERC20_ABI and ERC20_ABI_ALTERNATIVE_1 used by get_token
+SYMBOL_FUNCTIONS = [('symbol()', 'string'), ('SYMBOL()', 'string'), ('symbol()', 'bytes32'), ('SYMBOL()', 'bytes32')]
+NAME_FUNCTIONS = [('name()', 'string'), ('NAME()', 'string'), ('name()', 'bytes32'), ('NAME()', 'bytes32')]
+DECIMALS_FUNCTIONS = [('decimals()', 'uint8'), ('DECIMALS()', 'uint8')]
+TOTAL_SUPPLY_FUNCTIONS = [('totalSupply()', 'uint256')]
+TOKEN_FIELD_FUNCTIONS = [SYMBOL_FUNCTIONS, NAME_FUNCTIONS, DECIMALS_FUNCTIONS, TOTAL_SUPPLY_FUNCTIONS]
+TOKEN_FUNCTION_SIGNATURES = sorted({signature for signature, _ in
+                                    SYMBOL_FUNCTIONS + NAME_FUNCTIONS + DECIMALS_FUNCTIONS + TOTAL_SUPPLY_FUNCTIONS})
+# With a token cache the chain head is read at most this often
+HEAD_REFRESH_INTERVAL_SECONDS = 10
+
 
 class EthTokenService(object):
-    def __init__(self, web3, function_call_result_transformer=None):
+    def __init__(self, web3, function_call_result_transformer=None, token_cache=None):
         self._web3 = web3
         self._function_call_result_transformer = function_call_result_transformer
+        # A TokenMetadataCache, shared across jobs and runs
+        self._token_cache = token_cache
+        self._head_block_number = None
+        self._head_refreshed_at = 0
+        # None means unknown, it's detected on the first get_tokens call
+        self._multicall_available = None
+        # Lowered when the node fails a whole batch, e.g. because it allows smaller batches
+        self._max_calls_per_batch = MAX_CALLS_PER_BATCH
 
     def get_token(self, token_address):
         checksum_address = self._web3.toChecksumAddress(token_address)
@@ -69,6 +105,253 @@ class EthTokenService(object):
 
         return token
 
+    def get_tokens(self, token_addresses):
+        """Returns the tokens for the addresses, with the same values get_token returns.
+
+        The calls for all tokens are packed into Multicall3 aggregate3 calls, or sent as plain eth_calls in one
+        JSON-RPC batch if there is no Multicall3 contract on the chain. Falls back to get_token for each address if
+        the provider doesn't support batch requests. With a token cache only the tokens missing from the cache are
+        requested, and total_supply of cached tokens is re-read once it's outdated.
+        """
+        if len(token_addresses) == 0:
+            return []
+        if self._token_cache is None:
+            return self._fetch_tokens(token_addresses)
+
+        block_number = self._get_head_block_number()
+        cached_tokens = self._token_cache.get_many(set(token_addresses))
+        tokens_by_address = {address: token for address, (token, _) in cached_tokens.items()}
+
+        # Tokens with calls that failed for reasons other than a revert, e.g. rate limits or timeouts, are returned
+        # but not cached
+        failed_addresses = set()
+        missing_addresses = list(dict.fromkeys(
+            address for address in token_addresses if address not in tokens_by_address))
+        fetched_tokens = self._fetch_tokens(missing_addresses, failed_addresses)
+        tokens_by_address.update(zip(missing_addresses, fetched_tokens))
+
+        outdated_tokens = [token for token, total_supply_block_number in cached_tokens.values()
+                           if not self._token_cache.is_total_supply_fresh(total_supply_block_number, block_number)]
+        total_supplies = self._fetch_total_supplies([token.address for token in outdated_tokens], failed_addresses)
+        refreshed_tokens = []
+        for token, total_supply in zip(outdated_tokens, total_supplies):
+            # The cached total supply is kept if reading it failed
+            if token.address not in failed_addresses:
+                token.total_supply = total_supply
+                refreshed_tokens.append(token)
+
+        # Contracts none of the functions succeeded for are not cached, it can be a failure on the node
+        fetched_tokens = [token for token in fetched_tokens
+                          if not is_empty_token(token) and token.address not in failed_addresses]
+        self._token_cache.put_many(fetched_tokens + refreshed_tokens, block_number)
+
+        return [copy.copy(tokens_by_address[address]) for address in token_addresses]
+
+    def _fetch_tokens(self, token_addresses, failed_addresses=None):
+        if len(token_addresses) == 0:
+            return []
+        if not hasattr(self._web3.provider, 'make_batch_request'):
+            return [self.get_token(token_address) for token_address in token_addresses]
+
+        calls = [(token_address, signature)
+                 for token_address in token_addresses for signature in TOKEN_FUNCTION_SIGNATURES]
+        call_results = dict(zip(calls, self._call_functions(calls, failed_addresses)))
+
+        return [self._build_token(token_address, call_results) for token_address in token_addresses]
+
+    def _fetch_total_supplies(self, token_addresses, failed_addresses=None):
+        if len(token_addresses) == 0:
+            return []
+        if not hasattr(self._web3.provider, 'make_batch_request'):
+            return [self._get_first_result(self._web3.eth.contract(
+                address=self._web3.toChecksumAddress(token_address), abi=ERC20_ABI).functions.totalSupply())
+                for token_address in token_addresses]
+
+        calls = [(token_address, signature)
+                 for token_address in token_addresses for signature, _ in TOTAL_SUPPLY_FUNCTIONS]
+        return [self._decode_result(return_data, TOTAL_SUPPLY_FUNCTIONS[0][1])
+                for return_data in self._call_functions(calls, failed_addresses)]
+
+    def _call_functions(self, calls, failed_addresses=None):
+        """Returns the return data of each (token_address, function signature) call, None for failed calls.
+
+        The token addresses of calls that failed with an error other than a revert are added to failed_addresses.
+        """
+        if failed_addresses is None:
+            failed_addresses = set()
+        if self._is_multicall_available():
+            return self._call_with_multicall(calls, failed_addresses)
+        else:
+            return self._call_in_batch(calls, failed_addresses)
+
+    def _get_head_block_number(self):
+        if time.time() - self._head_refreshed_at >= HEAD_REFRESH_INTERVAL_SECONDS:
+            self._head_block_number = self._web3.eth.block_number
+            self._head_refreshed_at = time.time()
+        return self._head_block_number
+
+    def _build_token(self, token_address, call_results):
+        def get_first_result(functions):
+            for signature, return_type in functions:
+                result = self._decode_result(call_results[(token_address, signature)], return_type)
+                if result is not None:
+                    return result
+            return None
+
+        symbol = get_first_result(SYMBOL_FUNCTIONS)
+        if isinstance(symbol, bytes):
+            symbol = self._bytes_to_string(symbol)
+
+        name = get_first_result(NAME_FUNCTIONS)
+        if isinstance(name, bytes):
+            name = self._bytes_to_string(name)
+
+        token = EthToken()
+        token.address = token_address
+        token.symbol = symbol
+        token.name = name
+        token.decimals = get_first_result(DECIMALS_FUNCTIONS)
+        token.total_supply = get_first_result(TOTAL_SUPPLY_FUNCTIONS)
+
+        return token
+
+    def _decode_result(self, return_data, return_type):
+        # Like in _call_contract_function failed calls, empty return data and values not matching the return type
+        # give None
+        if not return_data:
+            return None
+        try:
+            result = self._web3.codec.decode_abi([return_type], return_data)[0]
+        except (DecodingError, OverflowError, ValueError):
+            logger.debug('Failed to decode the return data as {}. This can be safely ignored.'.format(return_type),
+                         exc_info=True)
+            result = None
+
+        if self._function_call_result_transformer is not None:
+            return self._function_call_result_transformer(result)
+        else:
+            return result
+
+    def _is_multicall_available(self):
+        if self._multicall_available is None:
+            code = self._web3.eth.get_code(to_checksum_address(MULTICALL3_ADDRESS))
+            self._multicall_available = code is not None and len(code) > 0
+            if not self._multicall_available:
+                logger.info('Multicall3 is not deployed on the chain. Token metadata calls are sent in batches.')
+        return self._multicall_available
+
+    def _call_with_multicall(self, calls, failed_addresses):
+        """Returns the return data of each call, None for failed calls.
+
+        A failed call in aggregate3 can be a revert or e.g. running out of gas, the two can't be told apart. The failed
+        calls of the token fields without a result are sent again as plain eth_calls.
+        """
+        call_chunks = [calls[start:start + MAX_CALLS_PER_MULTICALL]
+                       for start in range(0, len(calls), MAX_CALLS_PER_MULTICALL)]
+        multicall_rpc = [
+            generate_json_rpc(
+                method='eth_call',
+                params=[{'to': MULTICALL3_ADDRESS, 'data': self._encode_aggregate3(call_chunk)}, 'latest'],
+                request_id=idx)
+            for idx, call_chunk in enumerate(call_chunks)]
+        responses_by_id = index_responses_by_id(make_batch_request(self._web3.provider, multicall_rpc))
+
+        return_data = []
+        failed_call_idxs = []
+        for idx, call_chunk in enumerate(call_chunks):
+            result = responses_by_id.get(idx, {}).get('result')
+            try:
+                chunk_return_data = self._decode_aggregate3(result) if result is not None else None
+            except DecodingError:
+                chunk_return_data = None
+            if chunk_return_data is None or len(chunk_return_data) != len(call_chunk):
+                # E.g. the aggregate3 call ran out of gas
+                logger.info('The aggregate3 call for {} calls failed. Sending them in a batch.'.format(len(call_chunk)))
+                chunk_return_data = self._call_in_batch(call_chunk, failed_addresses)
+            else:
+                failed_call_idxs.extend(len(return_data) + call_idx
+                                        for call_idx, call_return_data in enumerate(chunk_return_data)
+                                        if call_return_data is None)
+            return_data.extend(chunk_return_data)
+
+        call_results = dict(zip(calls, return_data))
+        retry_call_idxs = [idx for idx in failed_call_idxs if not self._has_field_result(calls[idx], call_results)]
+        if retry_call_idxs:
+            logger.info('{} calls failed in aggregate3. Sending them in a batch.'.format(len(retry_call_idxs)))
+            retry_return_data = self._call_in_batch([calls[idx] for idx in retry_call_idxs], failed_addresses)
+            for idx, call_return_data in zip(retry_call_idxs, retry_return_data):
+                return_data[idx] = call_return_data
+        return return_data
+
+    def _has_field_result(self, call, call_results):
+        """Returns True if another function of the token field of the call gave a result."""
+        token_address, signature = call
+        for functions in TOKEN_FIELD_FUNCTIONS:
+            if signature not in [field_signature for field_signature, _ in functions]:
+                continue
+            for field_signature, return_type in functions:
+                return_data = call_results.get((token_address, field_signature))
+                if self._decode_result(return_data, return_type) is not None:
+                    return True
+        return False
+
+    def _encode_aggregate3(self, calls):
+        encoded_calls = self._web3.codec.encode_abi(['(address,bool,bytes)[]'], [[
+            (to_checksum_address(token_address), True, function_signature_to_4byte_selector(signature))
+            for token_address, signature in calls]])
+        return '0x' + (AGGREGATE3_SELECTOR + encoded_calls).hex()
+
+    def _decode_aggregate3(self, result):
+        call_results = self._web3.codec.decode_abi(['(bool,bytes)[]'], bytes.fromhex(result[2:]))[0]
+        return [return_data if success else None for success, return_data in call_results]
+
+    def _call_in_batch(self, calls, failed_addresses):
+        """Returns the return data of each call, None for failed calls. The calls are sent in several batches."""
+        return_data = []
+        start = 0
+        while start < len(calls):
+            batch_calls = calls[start:start + self._max_calls_per_batch]
+            return_data.extend(self._call_batch(batch_calls, failed_addresses))
+            start += len(batch_calls)
+        return return_data
+
+    def _call_batch(self, calls, failed_addresses):
+        calls_rpc = [
+            generate_json_rpc(
+                method='eth_call',
+                params=[{'to': token_address, 'data': '0x' + function_signature_to_4byte_selector(signature).hex()},
+                        'latest'],
+                request_id=idx)
+            for idx, (token_address, signature) in enumerate(calls)]
+        response = make_batch_request(self._web3.provider, calls_rpc)
+        if not isinstance(response, list):
+            # An error for the whole batch, e.g. the batch has more requests than the node allows
+            if len(calls) == 1:
+                raise RetriableValueError('The eth_call batch failed with {}.'.format(response))
+            self._max_calls_per_batch = min(self._max_calls_per_batch, len(calls) // 2)
+            logger.info('The batch of {} calls failed with {}. Sending at most {} calls in a batch.'.format(
+                len(calls), response, self._max_calls_per_batch))
+            return self._call_in_batch(calls, failed_addresses)
+
+        responses_by_id = index_responses_by_id(response)
+        missing_ids = [idx for idx in range(len(calls)) if idx not in responses_by_id]
+        if missing_ids:
+            raise RetriableValueError('Expected {} responses in the batch, {} are missing.'.format(
+                len(calls), len(missing_ids)))
+
+        return_data = []
+        for idx, (token_address, signature) in enumerate(calls):
+            response_item = responses_by_id[idx]
+            result = response_item.get('result')
+            # A revert means the token doesn't implement the function, like in _call_contract_function.
+            # Other errors were already retried in make_batch_request
+            error = response_item.get('error')
+            if result is None and not is_revert_error(error):
+                logger.warning('The call to {} of {} failed with {}.'.format(signature, token_address, error))
+                failed_addresses.add(token_address)
+            return_data.append(bytes.fromhex(result[2:]) if result is not None else None)
+        return return_data
+
     def _get_first_result(self, *funcs):
         for func in funcs:
             result = self._call_contract_function(func)
@@ -108,6 +391,18 @@ class EthTokenService(object):
         return b
 
 
+def index_responses_by_id(response):
+    # Responses in a batch can come in any order
+    if not isinstance(response, list):
+        # An error for the whole batch
+        return {}
+    return {response_item.get('id'): response_item for response_item in response}
+
+
+def is_empty_token(token):
+    return token.symbol is None and token.name is None and token.decimals is None and token.total_supply is None
+
+
 def call_contract_function(func, ignore_errors, default_value=None):
     try:
         result = func.call()
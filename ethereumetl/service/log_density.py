@@ -0,0 +1,79 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import threading
+
+# Infura, Alchemy and most other providers cap eth_getLogs responses at 10,000 logs
+DEFAULT_MAX_LOGS_PER_REQUEST = 10000
+# Ranges are sized to this fraction of the limit, so a range denser than its era still fits
+TARGET_FILL_RATIO = 0.8
+DEFAULT_ERA_SIZE = 100000
+DENSITY_SMOOTHING_FACTOR = 0.5
+
+
+# Learns the number of logs per block in each era of era_size blocks, so eth_getLogs block ranges can be sized
+# close to the provider's limit on the number of results. Shared by the workers of a job.
+# It's also the item weights of the job's BatchWorkExecutor, the weight of a block is its expected number of logs.
+# Batches are then packed to about one full eth_getLogs range, so they grow past the batch size in sparse eras.
+# Eras without an estimate get the density that makes a range of default_range_size blocks.
+class LogDensity:
+    def __init__(self, max_logs_per_request=DEFAULT_MAX_LOGS_PER_REQUEST, era_size=DEFAULT_ERA_SIZE,
+                 default_range_size=None):
+        self.max_logs_per_request = max_logs_per_request
+        self.era_size = era_size
+        self.mean_weight = self.max_logs_per_request * TARGET_FILL_RATIO / default_range_size \
+            if default_range_size else None
+        self.densities = {}
+        self.lock = threading.Lock()
+
+    def get_density(self, block_number):
+        with self.lock:
+            return self.densities.get(self._get_era(block_number))
+
+    def get_range_size(self, block_number):
+        """Returns the number of blocks to request starting at block_number, None if there is no estimate yet."""
+        density = self.get_density(block_number)
+        if not density:
+            return None
+        return max(1, int(self.max_logs_per_request * TARGET_FILL_RATIO / density))
+
+    def get_weight(self, block_number):
+        density = self.get_density(block_number)
+        return self.mean_weight if density is None else density
+
+    def record_logs(self, start_block, end_block, log_count):
+        density = log_count / (end_block - start_block + 1)
+        with self.lock:
+            era = self._get_era(start_block)
+            previous_density = self.densities.get(era)
+            if previous_density is not None:
+                density = DENSITY_SMOOTHING_FACTOR * density + (1 - DENSITY_SMOOTHING_FACTOR) * previous_density
+            self.densities[era] = density
+
+    def record_limit_exceeded(self, start_block, end_block):
+        # The range has more logs than the limit, so the era is at least this dense
+        density = self.max_logs_per_request / (end_block - start_block + 1)
+        with self.lock:
+            era = self._get_era(start_block)
+            self.densities[era] = max(self.densities.get(era) or 0, density)
+
+    def _get_era(self, block_number):
+        return block_number // self.era_size
@@ -0,0 +1,106 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+import sqlite3
+import threading
+import time
+
+from ethereumetl.domain.token import EthToken
+
+# About a day of mainnet blocks
+DEFAULT_TOTAL_SUPPLY_REFRESH_BLOCKS = 7200
+SQLITE_MAX_VARIABLES = 500
+
+
+class TokenMetadataCache:
+    """Stores token metadata in SQLite, keyed on the token address, so it's read from the node only once.
+
+    Symbol, name and decimals are kept indefinitely. total_supply changes with mints and burns, so it's stored with
+    the number of the chain head it was read at and re-read once the head is total_supply_refresh_blocks blocks
+    further. The cache can be shared by services in different threads and outlives the process.
+    """
+
+    def __init__(self, path, total_supply_refresh_blocks=DEFAULT_TOTAL_SUPPLY_REFRESH_BLOCKS):
+        self.path = path
+        self.total_supply_refresh_blocks = total_supply_refresh_blocks
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        # total_supply is stored as text as it doesn't fit in a SQLite integer
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS tokens '
+            '(address TEXT PRIMARY KEY, symbol TEXT, name TEXT, decimals INTEGER, total_supply TEXT, '
+            'total_supply_block_number INTEGER NOT NULL, updated_at REAL NOT NULL)')
+
+    def get_many(self, token_addresses):
+        """Returns a dict from address to (token, total_supply_block_number) for the addresses found in the cache."""
+        tokens = {}
+        token_addresses = list(token_addresses)
+        with self._lock:
+            for index in range(0, len(token_addresses), SQLITE_MAX_VARIABLES):
+                address_batch = token_addresses[index:index + SQLITE_MAX_VARIABLES]
+                rows = self._connection.execute(
+                    'SELECT address, symbol, name, decimals, total_supply, total_supply_block_number FROM tokens '
+                    'WHERE address IN ({})'.format(','.join('?' * len(address_batch))),
+                    address_batch).fetchall()
+                for address, symbol, name, decimals, total_supply, total_supply_block_number in rows:
+                    token = EthToken()
+                    token.address = address
+                    token.symbol = symbol
+                    token.name = name
+                    token.decimals = decimals
+                    token.total_supply = int(total_supply) if total_supply is not None else None
+                    tokens[address] = (token, total_supply_block_number)
+        return tokens
+
+    def put_many(self, tokens, block_number):
+        """Stores the tokens, with their total_supply read at block_number."""
+        if not tokens:
+            return
+        now = time.time()
+        rows = [(token.address, token.symbol, token.name, token.decimals,
+                 str(token.total_supply) if token.total_supply is not None else None, block_number, now)
+                for token in tokens]
+        with self._lock:
+            self._connection.execute('BEGIN')
+            try:
+                self._connection.executemany(
+                    'INSERT OR REPLACE INTO tokens '
+                    '(address, symbol, name, decimals, total_supply, total_supply_block_number, updated_at) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+                self._connection.execute('COMMIT')
+            except Exception:
+                self._connection.execute('ROLLBACK')
+                raise
+
+    def is_total_supply_fresh(self, total_supply_block_number, block_number):
+        return block_number - total_supply_block_number < self.total_supply_refresh_blocks
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+def open_token_cache(path, total_supply_refresh_blocks=DEFAULT_TOTAL_SUPPLY_REFRESH_BLOCKS):
+    if path is None:
+        return None
+    return TokenMetadataCache(path, total_supply_refresh_blocks=total_supply_refresh_blocks)
@@ -1,8 +1,11 @@
 import logging
+import time
 
 from blockchainetl.jobs.exporters.console_item_exporter import ConsoleItemExporter
 from blockchainetl.jobs.exporters.in_memory_item_exporter import InMemoryItemExporter
+from blockchainetl.streaming.streamer import STREAMER_LAG_SECONDS
 from ethereumetl.enumeration.entity_type import EntityType
+from ethereumetl.executors.scheduler import get_or_create_scheduler, scheduled_stage
 from ethereumetl.jobs.export_blocks_job import ExportBlocksJob
 from ethereumetl.jobs.export_receipts_job import ExportReceiptsJob
 from ethereumetl.jobs.export_traces_job import ExportTracesJob
@@ -24,16 +27,23 @@ class EthStreamerAdapter:
             item_exporter=ConsoleItemExporter(),
             batch_size=100,
             max_workers=5,
-            entity_types=tuple(EntityType.ALL_FOR_STREAMING)):
+            entity_types=tuple(EntityType.ALL_FOR_STREAMING),
+            token_cache=None):
         self.batch_web3_provider = batch_web3_provider
         self.item_exporter = item_exporter
         self.batch_size = batch_size
         self.max_workers = max_workers
         self.entity_types = entity_types
+        # Token metadata is read from the node once and kept across sync cycles
+        self.token_cache = token_cache
+        # Created once, so the web3 clients of the scheduler threads are reused across sync cycles
+        self.web3 = ThreadLocalProxy(lambda: build_web3(self.batch_web3_provider))
         self.item_id_calculator = EthItemIdCalculator()
         self.item_timestamp_calculator = EthItemTimestampCalculator()
 
     def open(self):
+        # The jobs of every sync cycle run on the threads of the shared scheduler
+        get_or_create_scheduler(self.max_workers)
         self.item_exporter.open()
 
     def get_current_block_number(self):
@@ -45,11 +55,13 @@ class EthStreamerAdapter:
         blocks, transactions = [], []
         if self._should_export(EntityType.BLOCK) or self._should_export(EntityType.TRANSACTION):
             blocks, transactions = self._export_blocks_and_transactions(start_block, end_block)
+            if blocks:
+                STREAMER_LAG_SECONDS.set(time.time() - max(block['timestamp'] for block in blocks))
 
         # Export receipts and logs
         receipts, logs = [], []
         if self._should_export(EntityType.RECEIPT) or self._should_export(EntityType.LOG):
-            receipts, logs = self._export_receipts_and_logs(transactions)
+            receipts, logs = self._export_receipts_and_logs(start_block, end_block)
 
         # Extract token transfers
         token_transfers = []
@@ -88,14 +100,15 @@ class EthStreamerAdapter:
 
         logging.info('Exporting with ' + type(self.item_exporter).__name__)
 
+        # The jobs run in ordered mode, and enrichment keeps the order, so the items are already sorted by block
         all_items = \
-            sort_by(enriched_blocks, 'number') + \
-            sort_by(enriched_transactions, ('block_number', 'transaction_index')) + \
-            sort_by(enriched_logs, ('block_number', 'log_index')) + \
-            sort_by(enriched_token_transfers, ('block_number', 'log_index')) + \
-            sort_by(enriched_traces, ('block_number', 'trace_index')) + \
-            sort_by(enriched_contracts, ('block_number',)) + \
-            sort_by(enriched_tokens, ('block_number',))
+            enriched_blocks + \
+            enriched_transactions + \
+            enriched_logs + \
+            enriched_token_transfers + \
+            enriched_traces + \
+            enriched_contracts + \
+            enriched_tokens
 
         self.calculate_item_ids(all_items)
         self.calculate_item_timestamps(all_items)
@@ -112,25 +125,31 @@ class EthStreamerAdapter:
             max_workers=self.max_workers,
             item_exporter=blocks_and_transactions_item_exporter,
             export_blocks=self._should_export(EntityType.BLOCK),
-            export_transactions=self._should_export(EntityType.TRANSACTION)
+            export_transactions=self._should_export(EntityType.TRANSACTION),
+            ordered=True
         )
-        blocks_and_transactions_job.run()
+        with scheduled_stage('blocks_and_transactions'):
+            blocks_and_transactions_job.run()
         blocks = blocks_and_transactions_item_exporter.get_items('block')
         transactions = blocks_and_transactions_item_exporter.get_items('transaction')
         return blocks, transactions
 
-    def _export_receipts_and_logs(self, transactions):
+    def _export_receipts_and_logs(self, start_block, end_block):
         exporter = InMemoryItemExporter(item_types=['receipt', 'log'])
         job = ExportReceiptsJob(
-            transaction_hashes_iterable=(transaction['hash'] for transaction in transactions),
+            transaction_hashes_iterable=None,
+            start_block=start_block,
+            end_block=end_block,
             batch_size=self.batch_size,
             batch_web3_provider=self.batch_web3_provider,
             max_workers=self.max_workers,
             item_exporter=exporter,
             export_receipts=self._should_export(EntityType.RECEIPT),
-            export_logs=self._should_export(EntityType.LOG)
+            export_logs=self._should_export(EntityType.LOG),
+            ordered=True
         )
-        job.run()
+        with scheduled_stage('receipts_and_logs'):
+            job.run()
         receipts = exporter.get_items('receipt')
         logs = exporter.get_items('log')
         return receipts, logs
@@ -141,8 +160,10 @@ class EthStreamerAdapter:
             logs_iterable=logs,
             batch_size=self.batch_size,
             max_workers=self.max_workers,
-            item_exporter=exporter)
-        job.run()
+            item_exporter=exporter,
+            ordered=True)
+        with scheduled_stage('token_transfers'):
+            job.run()
         token_transfers = exporter.get_items('token_transfer')
         return token_transfers
 
@@ -152,11 +173,14 @@ class EthStreamerAdapter:
             start_block=start_block,
             end_block=end_block,
             batch_size=self.batch_size,
-            web3=ThreadLocalProxy(lambda: build_web3(self.batch_web3_provider)),
+            web3=self.web3,
             max_workers=self.max_workers,
-            item_exporter=exporter
+            item_exporter=exporter,
+            ordered=True,
+            batch_web3_provider=self.batch_web3_provider
         )
-        job.run()
+        with scheduled_stage('traces'):
+            job.run()
         traces = exporter.get_items('trace')
         return traces
 
@@ -166,9 +190,11 @@ class EthStreamerAdapter:
             traces_iterable=traces,
             batch_size=self.batch_size,
             max_workers=self.max_workers,
-            item_exporter=exporter
+            item_exporter=exporter,
+            ordered=True
         )
-        job.run()
+        with scheduled_stage('contracts'):
+            job.run()
         contracts = exporter.get_items('contract')
         return contracts
 
@@ -176,11 +202,14 @@ class EthStreamerAdapter:
         exporter = InMemoryItemExporter(item_types=['token'])
         job = ExtractTokensJob(
             contracts_iterable=contracts,
-            web3=ThreadLocalProxy(lambda: build_web3(self.batch_web3_provider)),
+            web3=self.web3,
             max_workers=self.max_workers,
-            item_exporter=exporter
+            item_exporter=exporter,
+            ordered=True,
+            token_cache=self.token_cache
         )
-        job.run()
+        with scheduled_stage('tokens'):
+            job.run()
         tokens = exporter.get_items('token')
         return tokens
 
@@ -221,9 +250,6 @@ class EthStreamerAdapter:
 
     def close(self):
         self.item_exporter.close()
+        if self.token_cache is not None:
+            self.token_cache.close()
 
-
-def sort_by(arr, fields):
-    if isinstance(fields, tuple):
-        fields = tuple(fields)
-    return sorted(arr, key=lambda item: tuple(item.get(f) for f in fields))
@@ -110,6 +110,65 @@ def is_retriable_error(error_code):
     return False
 
 
+def is_method_not_found_error(error):
+    if error is None:
+        return False
+
+    # https://www.jsonrpc.org/specification#error_object
+    if error.get('code') == -32601:
+        return True
+
+    # Some clients and proxies return a generic error code for unsupported methods
+    message = str(error.get('message', '')).lower()
+    return 'method' in message and any(
+        phrase in message for phrase in ('not found', 'does not exist', 'not supported', 'not available'))
+
+
+def is_revert_error(error):
+    """Returns True if an eth_call failed because the contract reverted, resending the call gives the same error."""
+    if error is None:
+        return False
+
+    # https://github.com/ethereum/go-ethereum/pull/21083 reports reverts with code 3, older nodes with -32000
+    if error.get('code') == 3:
+        return True
+
+    message = str(error.get('message', '')).lower()
+    return 'execution reverted' in message or 'vm execution error' in message
+
+
+# Infura "query returned more than 10000 results", Alchemy "Log response size exceeded", Besu "exceeds max results",
+# QuickNode "eth_getLogs is limited to a 10,000 range", Ankr "block range is too wide",
+# BSC "exceed maximum block range: 5000"
+LOG_LIMIT_ERROR_PHRASES = (
+    'query returned more than', 'response size exceeded', 'exceeds max results', 'too many results',
+    'limited to a', 'range is too wide', 'range is too large', 'range too large', 'maximum block range',
+    'block range limit')
+
+# Infura reports rate limits with the same -32005 code as the result limit
+RATE_LIMIT_ERROR_PHRASES = ('rate limit', 'rate exceeded', 'request count exceeded', 'too many requests')
+
+
+def is_log_limit_error(error):
+    """Returns True if eth_getLogs failed because the block range or the number of results exceeded a limit.
+
+    Rate limit errors are not limit errors, splitting the block range only makes more requests.
+    """
+    if error is None or is_rate_limit_error(error):
+        return False
+
+    message = str(error.get('message', '')).lower()
+    return any(phrase in message for phrase in LOG_LIMIT_ERROR_PHRASES)
+
+
+def is_rate_limit_error(error):
+    if error is None:
+        return False
+
+    message = str(error.get('message', '')).lower()
+    return any(phrase in message for phrase in RATE_LIMIT_ERROR_PHRASES)
+
+
 def split_to_batches(start_incl, end_incl, batch_size):
     """start_incl and end_incl are inclusive, the returned batch ranges are also inclusive"""
     for batch_start in range(start_incl, end_incl + 1, batch_size):
@@ -130,6 +189,28 @@ def dynamic_batch_iterator(iterable, batch_size_getter):
         yield batch
 
 
+def weighted_batch_iterator(iterable, target_weight_getter, weight_getter, max_batch_size_getter):
+    """Like dynamic_batch_iterator, but a batch ends once the weights of its items add up to the target weight.
+
+    A batch also ends at max_batch_size items, so a run of light items doesn't make a huge batch.
+    """
+    batch = []
+    batch_weight = 0
+    target_weight = target_weight_getter()
+    max_batch_size = max_batch_size_getter()
+    for item in iterable:
+        batch.append(item)
+        batch_weight += weight_getter(item)
+        if batch_weight >= target_weight or len(batch) >= max_batch_size:
+            yield batch
+            batch = []
+            batch_weight = 0
+            target_weight = target_weight_getter()
+            max_batch_size = max_batch_size_getter()
+    if len(batch) > 0:
+        yield batch
+
+
 def pairwise(iterable):
     """s -> (s0,s1), (s1,s2), (s2, s3), ..."""
     a, b = itertools.tee(iterable)
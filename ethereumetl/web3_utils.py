@@ -23,8 +23,13 @@
 from web3 import Web3
 from web3.middleware import geth_poa_middleware
 
+from blockchainetl.metrics import is_metrics_enabled
+from ethereumetl.providers.rpc_metrics import rpc_metrics_middleware
+
 
 def build_web3(provider):
     w3 = Web3(provider)
     w3.middleware_onion.inject(geth_poa_middleware, layer=0)
+    if is_metrics_enabled():
+        w3.middleware_onion.add(rpc_metrics_middleware)
     return w3
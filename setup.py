@@ -40,7 +40,11 @@ setup(
         'ethereum-dasm==0.1.4',
         'urllib3<2',
         'base58',
-        'requests'
+        'requests',
+        # Also required by web3, the async providers and executors use them directly
+        'aiohttp>=3.7.4,<4',
+        # web3 5 pins websockets<10, the ws provider is tested with 10.4 as well
+        'websockets>=9.1,<11'
     ],
     extras_require={
         'streaming': [
@@ -60,6 +64,9 @@ setup(
             'boto3==1.24.11',
             'botocore==1.27.11',
         ],
+        'fast-json': [
+            'orjson>=3.6,<4',
+        ],
         'dev': [
             'pytest~=4.3.0'
         ]
@@ -0,0 +1,139 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import decimal
+import glob
+import io
+import json
+import os
+import timeit
+
+import pytest
+
+from blockchainetl import json_codec
+from blockchainetl.exporters import JsonLinesItemExporter
+from tests.helpers import run_slow_tests
+
+RESOURCES_PATH = os.path.join(os.path.dirname(__file__), '..', 'resources')
+
+INSTALLED_CODECS = []
+for codec_name in json_codec.JSON_CODECS:
+    try:
+        json_codec.create_json_codec(codec_name)
+        INSTALLED_CODECS.append(codec_name)
+    except ImportError:
+        pass
+
+ITEMS = [
+    {'type': 'block', 'number': 1755634, 'hash': '0x0b9d', 'transaction_count': 2, 'uncles': []},
+    {'type': 'token_transfer', 'value': 2 ** 255 + 1, 'token_address': None},
+    {'type': 'token', 'name': 'Tökën ✓', 'symbol': '"\\', 'decimals': decimal.Decimal('18.123456789')},
+]
+
+
+def read_rpc_responses():
+    responses = []
+    for path in sorted(glob.glob(os.path.join(RESOURCES_PATH, '**', 'web3_response.*.json'), recursive=True)):
+        with open(path, 'rb') as file:
+            responses.append(file.read())
+    return responses
+
+
+@pytest.mark.parametrize('codec_name', INSTALLED_CODECS)
+def test_json_codec_encodes_like_stdlib(codec_name):
+    codec = json_codec.create_json_codec(codec_name)
+    stdlib_codec = json_codec.StdlibJsonCodec()
+    for item in ITEMS:
+        assert codec.dumps_bytes(item) == stdlib_codec.dumps_bytes(item)
+        assert codec.dumps(item) == stdlib_codec.dumps(item)
+        assert json.loads(codec.dumps(item))['type'] == item['type']
+
+
+@pytest.mark.parametrize('codec_name', INSTALLED_CODECS)
+def test_json_codec_decodes_like_stdlib(codec_name):
+    codec = json_codec.create_json_codec(codec_name)
+    for response in read_rpc_responses():
+        expected = json.loads(response)
+        assert codec.loads(response) == expected
+        assert codec.loads(bytearray(response)) == expected
+        assert codec.loads(memoryview(response)) == expected
+        assert codec.loads(response.decode('utf-8')) == expected
+
+
+def test_dumps_item_keeps_json_dumps_format():
+    for item in ITEMS:
+        assert json_codec.dumps_item(item) == json.dumps(item, default=json_codec.encode_default)
+        assert json_codec.dumps_item_bytes(item) == json.dumps(item, default=json_codec.encode_default).encode('utf-8')
+
+
+def test_json_lines_item_exporter_compact_items_are_opt_in():
+    item = {'type': 'token', 'name': 'Tökën', 'decimals': 18}
+
+    file = io.BytesIO()
+    JsonLinesItemExporter(file).export_item(item)
+    assert file.getvalue() == b'{"type": "token", "name": "T\\u00f6k\\u00ebn", "decimals": 18}\n'
+
+    json_codec.set_compact_items(True)
+    try:
+        file = io.BytesIO()
+        JsonLinesItemExporter(file).export_item(item)
+        assert file.getvalue() == '{"type":"token","name":"Tökën","decimals":18}\n'.encode('utf-8')
+        assert json_codec.dumps_item(item) == json_codec.dumps(item)
+    finally:
+        json_codec.set_compact_items(False)
+
+
+def test_loads_item_keeps_big_integers():
+    item = {'type': 'block', 'total_difficulty': 58750003716598352816469}
+    for codec_name in INSTALLED_CODECS:
+        json_codec.set_json_codec(codec_name)
+        try:
+            assert json_codec.loads_item(json_codec.dumps_item(item)) == item
+            assert json_codec.loads_item(memoryview(json_codec.dumps_item_bytes(item))) == item
+        finally:
+            json_codec.set_json_codec()
+
+
+def test_create_json_codec_unknown():
+    with pytest.raises(ValueError):
+        json_codec.create_json_codec('simplejson')
+
+
+@pytest.mark.skipif(not run_slow_tests, reason='Skipping slow running tests')
+def test_json_codec_benchmark():
+    responses = read_rpc_responses()
+    decoded_responses = [json.loads(response) for response in responses]
+
+    timings = {}
+    for codec_name in INSTALLED_CODECS:
+        codec = json_codec.create_json_codec(codec_name)
+        decode_time = min(timeit.repeat(lambda: [codec.loads(response) for response in responses], number=20, repeat=5))
+        encode_time = min(timeit.repeat(
+            lambda: [codec.dumps_bytes(response) for response in decoded_responses], number=20, repeat=5))
+        timings[codec_name] = (decode_time, encode_time)
+
+    # Only reports the numbers, timings on shared CI machines are too noisy to assert on
+    stdlib_decode_time, stdlib_encode_time = timings['json']
+    for codec_name, (decode_time, encode_time) in timings.items():
+        print('{}: decode {:.3f}s ({:.1f}x faster than json), encode {:.3f}s ({:.1f}x faster than json)'.format(
+            codec_name, decode_time, stdlib_decode_time / decode_time, encode_time, stdlib_encode_time / encode_time))
@@ -0,0 +1,100 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import urllib.error
+import urllib.request
+
+import pytest
+
+from blockchainetl.jobs.exporters.in_memory_item_exporter import InMemoryItemExporter
+from blockchainetl.jobs.exporters.measured_item_exporter import MeasuredItemExporter
+from blockchainetl.metrics import MetricsRegistry, Counter, Gauge, Histogram, start_metrics_server, REGISTRY
+
+
+def test_metrics_text_format():
+    registry = MetricsRegistry()
+    counter = Counter('requests_total', 'Requests.', ['method'], registry=registry)
+    gauge = Gauge('batch_size', 'Batch size.', registry=registry)
+    histogram = Histogram('latency_seconds', 'Latency.', ['method'], buckets=[0.1, 1], registry=registry)
+
+    counter.labels('eth_getBlockByNumber').inc(3)
+    gauge.set(100)
+    histogram.labels('eth_call').observe(0.05)
+    histogram.labels('eth_call').observe(0.5)
+    histogram.labels('eth_call').observe(5)
+
+    assert registry.generate_text().splitlines() == [
+        '# HELP ethereum_etl_requests_total Requests.',
+        '# TYPE ethereum_etl_requests_total counter',
+        'ethereum_etl_requests_total{method="eth_getBlockByNumber"} 3',
+        '# HELP ethereum_etl_batch_size Batch size.',
+        '# TYPE ethereum_etl_batch_size gauge',
+        'ethereum_etl_batch_size 100',
+        '# HELP ethereum_etl_latency_seconds Latency.',
+        '# TYPE ethereum_etl_latency_seconds histogram',
+        'ethereum_etl_latency_seconds_bucket{method="eth_call",le="0.1"} 1',
+        'ethereum_etl_latency_seconds_bucket{method="eth_call",le="1"} 2',
+        'ethereum_etl_latency_seconds_bucket{method="eth_call",le="+Inf"} 3',
+        'ethereum_etl_latency_seconds_sum{method="eth_call"} 5.55',
+        'ethereum_etl_latency_seconds_count{method="eth_call"} 3',
+    ]
+
+
+def test_metrics_labels_are_checked_and_removable():
+    registry = MetricsRegistry()
+    gauge = Gauge('workers', 'Workers.', ['job'], registry=registry)
+    with pytest.raises(ValueError):
+        gauge.labels()
+    gauge.labels('ExportBlocksJob._export_batch').set(5)
+    gauge.remove('ExportBlocksJob._export_batch')
+    assert 'ExportBlocksJob' not in registry.generate_text()
+
+
+def test_measured_item_exporter_counts_items_by_type():
+    exporter = MeasuredItemExporter(InMemoryItemExporter(item_types=['block', 'transaction']))
+    exporter.open()
+    exporter.export_items([{'type': 'block'}, {'type': 'transaction'}, {'type': 'transaction'}])
+    exporter.export_item({'type': 'block'})
+    exporter.close()
+
+    assert len(exporter.get_items('transaction')) == 2
+    text = REGISTRY.generate_text()
+    assert 'ethereum_etl_items_exported_total{type="transaction",exporter="InMemoryItemExporter"}' in text
+    assert 'ethereum_etl_exporter_write_duration_seconds_count{exporter="InMemoryItemExporter"}' in text
+
+
+def test_metrics_server():
+    registry = MetricsRegistry()
+    Counter('dead_letters_total', 'Dead letters.', registry=registry).inc()
+    server = start_metrics_server(0, registry=registry)
+    try:
+        port = server.server_address[1]
+        with urllib.request.urlopen('http://127.0.0.1:{}/metrics'.format(port)) as response:
+            assert response.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+            assert 'ethereum_etl_dead_letters_total 1' in response.read().decode('utf-8')
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen('http://127.0.0.1:{}/other'.format(port))
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert registry.enabled
+    assert not REGISTRY.enabled
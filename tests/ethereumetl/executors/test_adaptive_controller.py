@@ -0,0 +1,78 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from ethereumetl.executors.adaptive_controller import AdaptiveController, CONTROL_INTERVAL_SECONDS
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def run_interval(controller, clock, batch_latency, batches=10):
+    for _ in range(batches):
+        clock.now += CONTROL_INTERVAL_SECONDS / batches
+        controller.on_success(controller.batch_size, batch_latency)
+
+
+def test_adaptive_controller_halves_once_per_round_trip_on_failure():
+    clock = FakeClock()
+    controller = AdaptiveController(100, 8, clock=clock)
+
+    controller.on_failure(100, 2.0)
+    clock.now += 1
+    controller.on_failure(100, 2.0)
+    assert (controller.batch_size, controller.concurrency) == (50, 4)
+
+    clock.now += 2
+    controller.on_failure(50, 2.0)
+    assert (controller.batch_size, controller.concurrency) == (25, 2)
+
+
+def test_adaptive_controller_increases_batch_size_then_concurrency_while_latency_is_stable():
+    clock = FakeClock()
+    controller = AdaptiveController(100, 8, clock=clock)
+    controller.on_failure(100, 1.0)
+    assert (controller.batch_size, controller.concurrency) == (50, 4)
+
+    for _ in range(5):
+        run_interval(controller, clock, batch_latency=controller.batch_size * 0.01)
+    assert (controller.batch_size, controller.concurrency) == (100, 4)
+
+    run_interval(controller, clock, batch_latency=1.0)
+    run_interval(controller, clock, batch_latency=1.0)
+    assert (controller.batch_size, controller.concurrency) == (100, 6)
+    assert controller.describe() == 'Batch size is 100, concurrency is 6, throughput is 200.0 items/s.'
+
+
+def test_adaptive_controller_decreases_concurrency_when_latency_grows():
+    clock = FakeClock()
+    controller = AdaptiveController(100, 8, clock=clock)
+
+    run_interval(controller, clock, batch_latency=1.0)
+    run_interval(controller, clock, batch_latency=2.0)
+    assert (controller.batch_size, controller.concurrency) == (100, 7)
+    run_interval(controller, clock, batch_latency=2.0)
+    assert (controller.batch_size, controller.concurrency) == (100, 6)
@@ -0,0 +1,97 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import json
+import threading
+
+from ethereumetl.executors.batch_weights import BlockWeights, read_block_weights, prefetch_block_weights
+from ethereumetl.executors.batch_work_executor import BatchWorkExecutor
+from ethereumetl.utils import weighted_batch_iterator
+
+
+def test_weighted_batch_iterator_packs_to_target_weight():
+    weights = {0: 1, 1: 1, 2: 8, 3: 1, 4: 1, 5: 1, 6: 1, 7: 1, 8: 1, 9: 1, 10: 1}
+    batches = list(weighted_batch_iterator(range(11), lambda: 4, weights.get, lambda: 3))
+    assert batches == [[0, 1, 2], [3, 4, 5], [6, 7, 8], [9, 10]]
+
+    batches = list(weighted_batch_iterator(range(11), lambda: 4, weights.get, lambda: 100))
+    assert batches == [[0, 1, 2], [3, 4, 5, 6], [7, 8, 9, 10]]
+
+
+def test_block_weights_default_to_mean_weight():
+    block_weights = BlockWeights({100: 9, 101: 19})
+    assert block_weights.get_weight(100) == 10
+    assert block_weights.get_weight(101) == 20
+    assert block_weights.get_weight(102) == 15
+    assert BlockWeights({}).get_weight(100) == 1
+
+
+def test_read_block_weights(tmpdir):
+    csv_file = tmpdir.join('blocks.csv')
+    csv_file.write('number,hash,transaction_count\n1,0x01,0\n2,0x02,5\n')
+    json_file = tmpdir.join('blocks.json')
+    json_file.write('{"number": 1, "transaction_count": 0}\n{"number": 2, "transaction_count": 5}\n')
+
+    for blocks_file in [csv_file, json_file]:
+        block_weights = read_block_weights(str(blocks_file))
+        assert block_weights.weights == {1: 1, 2: 6}
+
+
+class BlockHeaderNode:
+    def __init__(self, transaction_counts):
+        self.transaction_counts = transaction_counts
+        self.requests = []
+
+    def make_batch_request(self, text):
+        requests = json.loads(text)
+        self.requests.extend(requests)
+        return [{'jsonrpc': '2.0', 'id': request['id'], 'result': {
+            'number': request['params'][0],
+            'transactions': ['0x00'] * self.transaction_counts[int(request['params'][0], 16)],
+        }} for request in requests]
+
+
+def test_prefetch_block_weights_requests_headers_only():
+    node = BlockHeaderNode({block_number: block_number % 3 for block_number in range(10, 20)})
+    block_weights = prefetch_block_weights(node, 10, 19, max_workers=2, batch_size=4)
+
+    assert block_weights.weights == {block_number: 1 + block_number % 3 for block_number in range(10, 20)}
+    assert all(request['params'][1] is False for request in node.requests)
+
+
+def test_batch_work_executor_packs_batches_by_weight():
+    # Blocks 0-9 are empty and blocks 10-19 have 9 transactions each, the mean weight is 5.5
+    block_weights = BlockWeights({block_number: 0 if block_number < 10 else 9 for block_number in range(20)})
+    batches = []
+    lock = threading.Lock()
+
+    def work_handler(batch):
+        with lock:
+            batches.append(batch)
+
+    executor = BatchWorkExecutor(2, max_workers=1, item_weights=block_weights)
+    executor.execute(range(20), work_handler)
+    executor.shutdown()
+
+    assert sorted(block for batch in batches for block in batch) == list(range(20))
+    # Target weight is 11: light batches have up to 8 blocks, heavy ones 2
+    assert sorted(batches) == [[0, 1, 2, 3, 4, 5, 6, 7], [8, 9, 10], [11, 12], [13, 14], [15, 16], [17, 18], [19]]
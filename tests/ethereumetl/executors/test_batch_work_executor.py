@@ -0,0 +1,103 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import os
+import time
+
+import pytest
+
+from ethereumetl.executors import batch_work_executor
+from ethereumetl.executors.async_batch_work_executor import AsyncBatchWorkExecutor
+from ethereumetl.executors.batch_work_executor import BatchWorkExecutor
+from ethereumetl.providers.sized_response import SizedBatchResponse
+
+
+def test_batch_work_executor_limits_batch_bytes():
+    executor = BatchWorkExecutor(100, max_workers=1, max_batch_bytes=1000)
+    batch_sizes = []
+    executor.execute(range(100), lambda batch: batch_sizes.append(len(batch)))
+    executor.track_response_size(10, SizedBatchResponse([], byte_size=2000))
+    executor.execute(range(100), lambda batch: batch_sizes.append(len(batch)))
+    executor.shutdown()
+
+    assert batch_sizes == [100] + [5] * 20
+
+
+def test_batch_work_executor_ignores_responses_without_size():
+    executor = BatchWorkExecutor(100, max_workers=1, max_batch_bytes=1000)
+    executor.track_response_size(10, [{'jsonrpc': '2.0', 'id': 0, 'result': '0x'}] * 10)
+    assert executor.bytes_per_item is None
+    executor.shutdown()
+
+
+def count_items(items, multiplier):
+    return [len(items) * multiplier, os.getpid()]
+
+
+def test_batch_work_executor_maps_in_cpu_stage():
+    executor = BatchWorkExecutor(10, max_workers=2, cpu_workers=1)
+    results = []
+    executor.execute(range(20), lambda batch: results.append(executor.map_in_cpu_stage(count_items, batch, 2)))
+    executor.shutdown()
+
+    assert [count for count, _ in results] == [20, 20]
+    assert all(pid != os.getpid() for _, pid in results)
+
+
+def test_batch_work_executor_maps_in_calling_thread_without_cpu_workers():
+    executor = BatchWorkExecutor(10, max_workers=1)
+    response = SizedBatchResponse([1, 2, 3], byte_size=7)
+    assert executor.map_in_cpu_stage(count_items, response, 1) == [3, os.getpid()]
+    executor.shutdown()
+
+
+@pytest.mark.parametrize('ordered', [False, True])
+def test_batch_work_executor_fails_fast(ordered):
+    executor = BatchWorkExecutor(1, max_workers=2, ordered=ordered, reorder_buffer_size=2)
+    handled = []
+
+    def work_handler(batch):
+        if batch == [3]:
+            raise ValueError('Fatal error')
+        time.sleep(0.01)
+        handled.extend(batch)
+
+    with pytest.raises(ValueError):
+        executor.execute(range(1000), work_handler)
+        executor.shutdown()
+    assert len(handled) < 100
+
+
+def test_async_batch_work_executor_doesnt_create_thread_pool(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError('The thread pool is not used by AsyncBatchWorkExecutor')
+    monkeypatch.setattr(batch_work_executor, 'BoundedExecutor', fail)
+    executor = AsyncBatchWorkExecutor(10, max_workers=5)
+    handled = []
+
+    async def work_handler(batch):
+        handled.extend(batch)
+
+    executor.execute(range(100), work_handler)
+    executor.shutdown()
+    assert executor.executor is None
+    assert sorted(handled) == list(range(100))
@@ -0,0 +1,102 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import pytest
+
+from blockchainetl.jobs.exporters.in_memory_item_exporter import InMemoryItemExporter
+from ethereumetl.executors.async_batch_work_executor import AsyncBatchWorkExecutor
+from ethereumetl.executors.batch_work_executor import BatchWorkExecutor
+from ethereumetl.executors.dead_letter import DeadLetterSink, RedriveFilter, read_dead_letters, set_redrive_filter
+from ethereumetl.executors.retry_policy import RetryPolicy
+
+NO_DELAY = RetryPolicy(base_delay=0, max_delay=0)
+
+
+class BlockExporter:
+    def __init__(self, item_exporter, poison_items):
+        self.item_exporter = item_exporter
+        self.poison_items = poison_items
+
+    def export_batch(self, batch):
+        # Like the jobs, items are only exported once the whole batch succeeded
+        for block_number in batch:
+            error = self.poison_items.get(block_number)
+            if error is not None:
+                raise error
+        for block_number in batch:
+            self.item_exporter.export_item({'type': 'block', 'number': block_number})
+
+    async def export_batch_async(self, batch):
+        self.export_batch(batch)
+
+
+def export_blocks(executor, poison_items, use_async=False):
+    item_exporter = InMemoryItemExporter(item_types=['block'])
+    item_exporter.open()
+    block_exporter = BlockExporter(executor.wrap_item_exporter(item_exporter), poison_items)
+    executor.execute(range(20), block_exporter.export_batch_async if use_async else block_exporter.export_batch,
+                     total_items=20)
+    executor.shutdown()
+    return [item['number'] for item in item_exporter.get_items('block')]
+
+
+@pytest.mark.parametrize('executor_class, use_async', [
+    (BatchWorkExecutor, False),
+    (AsyncBatchWorkExecutor, True),
+])
+def test_batch_work_executor_dead_letters_failing_items(tmpdir, executor_class, use_async):
+    path = str(tmpdir.join('dead_letters.json'))
+    dead_letter_sink = DeadLetterSink(path)
+    executor = executor_class(5, max_workers=2, retry_policy=NO_DELAY, dead_letter_sink=dead_letter_sink)
+    poison_items = {3: ValueError('execution reverted'), 12: OSError('connection reset')}
+
+    exported = export_blocks(executor, poison_items, use_async)
+    dead_letter_sink.close()
+
+    assert sorted(exported) == [number for number in range(20) if number not in poison_items]
+    dead_letters = sorted(read_dead_letters(path), key=lambda dead_letter: dead_letter['item'])
+    assert [(dead_letter['item'], dead_letter['error_type'], dead_letter['error']) for dead_letter in dead_letters] == [
+        (3, 'ValueError', 'execution reverted'),
+        (12, 'OSError', 'connection reset'),
+    ]
+    assert {dead_letter['job'] for dead_letter in dead_letters} == {
+        'BlockExporter.export_batch_async' if use_async else 'BlockExporter.export_batch'}
+
+
+def test_batch_work_executor_fails_without_dead_letter_sink():
+    executor = BatchWorkExecutor(5, max_workers=2, retry_policy=NO_DELAY)
+    with pytest.raises(ValueError):
+        export_blocks(executor, {3: ValueError('execution reverted')})
+
+
+def test_redrive_filter_runs_dead_lettered_items_only(tmpdir):
+    path = str(tmpdir.join('dead_letters.json'))
+    dead_letter_sink = DeadLetterSink(path)
+    executor = BatchWorkExecutor(5, max_workers=2, retry_policy=NO_DELAY, dead_letter_sink=dead_letter_sink)
+    export_blocks(executor, {3: ValueError(), 12: ValueError()})
+    dead_letter_sink.close()
+
+    set_redrive_filter(RedriveFilter(read_dead_letters(path)))
+    try:
+        assert sorted(export_blocks(BatchWorkExecutor(5, max_workers=2), {})) == [3, 12]
+    finally:
+        set_redrive_filter(None)
@@ -0,0 +1,83 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from ethereumetl.executors.bounded_executor import BoundedExecutor
+from ethereumetl.executors.fail_safe_executor import FailSafeExecutor
+
+
+def test_fail_safe_executor_counts_queued_and_in_flight_tasks():
+    executor = FailSafeExecutor(ThreadPoolExecutor(max_workers=1))
+    started = threading.Event()
+    release = threading.Event()
+
+    def blocking_task():
+        started.set()
+        release.wait()
+
+    executor.submit(blocking_task)
+    started.wait()
+    executor.submit(lambda: None)
+    executor.submit(lambda: None)
+    assert executor.in_flight_count == 3
+    assert executor.queue_depth == 2
+
+    release.set()
+    executor.shutdown()
+    assert executor.in_flight_count == 0
+    assert executor.queue_depth == 0
+
+
+def test_fail_safe_executor_cancels_pending_tasks_on_first_error():
+    executor = FailSafeExecutor(ThreadPoolExecutor(max_workers=1))
+    release = threading.Event()
+    executed = []
+
+    def failing_task():
+        release.wait()
+        raise ValueError('Fatal error')
+
+    failing_future = executor.submit(failing_task)
+    pending_futures = [executor.submit(executed.append, i) for i in range(10)]
+    release.set()
+
+    with pytest.raises(ValueError):
+        failing_future.result()
+    with pytest.raises(ValueError):
+        executor.shutdown()
+    assert all(future.cancelled() for future in pending_futures)
+    assert executed == []
+    assert executor.queue_depth == 0
+    with pytest.raises(ValueError):
+        executor.submit(executed.append, 10)
+
+
+def test_fail_safe_executor_raises_on_shutdown():
+    executor = FailSafeExecutor(BoundedExecutor(1, 2))
+    executor.submit(lambda: None)
+    executor.submit(lambda: 1 / 0)
+    with pytest.raises(ZeroDivisionError):
+        executor.shutdown()
@@ -0,0 +1,147 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import json
+import os
+
+import pytest
+
+from blockchainetl.jobs.exporters.composite_item_exporter import CompositeItemExporter
+from ethereumetl.executors.batch_work_executor import BatchWorkExecutor
+from ethereumetl.executors.progress_ledger import IntervalSet, ProgressLedger, open_progress_ledger
+
+
+def test_interval_set_merges_adjacent_and_overlapping_intervals():
+    intervals = IntervalSet()
+    intervals.add(10, 19)
+    intervals.add(30, 39)
+    intervals.add(20, 24)
+    assert list(intervals) == [(10, 24), (30, 39)]
+
+    intervals.add(22, 31)
+    assert list(intervals) == [(10, 39)]
+
+    intervals.update([5, 3, 4, 50, 41])
+    assert list(intervals) == [(3, 5), (10, 39), (41, 41), (50, 50)]
+    assert len(intervals) == 3 + 30 + 1 + 1
+    assert 4 in intervals
+    assert 40 not in intervals
+    assert 9 not in intervals
+
+
+def test_progress_ledger_checkpoint_and_load(tmpdir):
+    path = str(tmpdir.join('progress.json'))
+    ledger = ProgressLedger(path, checkpoint_interval=0)
+    ledger.record([1, 2, 3], [])
+    ledger.record([5], [])
+
+    with open(path) as file:
+        assert json.load(file) == {'completed': [[1, 3], [5, 5]], 'files': {}}
+
+    loaded = ProgressLedger(path).load()
+    assert list(loaded.completed) == [(1, 3), (5, 5)]
+    assert list(loaded.skip_completed(range(7))) == [0, 4, 6]
+
+
+def test_open_progress_ledger_resets_ledger_without_resume(tmpdir):
+    output = str(tmpdir.join('blocks.json'))
+    progress_file = str(tmpdir.join('progress.json'))
+    ledger = open_progress_ledger(progress_file, ['-', output])
+    ledger.record([1, 2], [])
+    ledger.checkpoint()
+
+    assert list(open_progress_ledger(progress_file, [output], resume=True).completed) == [(1, 2)]
+    assert list(open_progress_ledger(progress_file, [output]).completed) == []
+    assert list(open_progress_ledger(progress_file, [output], resume=True).completed) == []
+    with pytest.raises(ValueError):
+        open_progress_ledger(None, ['-'], resume=True)
+
+
+def test_open_progress_ledger_only_with_resume_or_progress_file(tmpdir):
+    output = str(tmpdir.join('blocks.json'))
+    assert open_progress_ledger(None, [output]) is None
+    assert not os.path.exists(output + '.progress.json')
+
+    ledger = open_progress_ledger(None, ['-', output], resume=True)
+    assert ledger.path == output + '.progress.json'
+
+
+def test_open_progress_ledger_checks_work_range(tmpdir):
+    output = str(tmpdir.join('blocks.json'))
+    ledger = open_progress_ledger(None, [output], resume=True, work_range=(0, 99))
+    ledger.record([1, 2], [])
+    ledger.checkpoint()
+
+    assert list(open_progress_ledger(None, [output], resume=True, work_range=(0, 99)).completed) == [(1, 2)]
+    with pytest.raises(ValueError):
+        open_progress_ledger(None, [output], resume=True, work_range=(0, 199))
+
+
+class Crash(Exception):
+    pass
+
+
+def export_blocks(output, ledger, crash_at=None, file_offsets=None):
+    item_exporter = CompositeItemExporter(filename_mapping={'block': output}, field_mapping={'block': ['number']},
+                                          file_offsets=file_offsets)
+    executor = BatchWorkExecutor(2, max_workers=3, progress_ledger=ledger)
+    wrapped_exporter = executor.wrap_item_exporter(item_exporter)
+
+    def work_handler(batch):
+        for number in batch:
+            if number == crash_at:
+                raise Crash()
+            wrapped_exporter.export_item({'type': 'block', 'number': number})
+
+    item_exporter.open()
+    try:
+        executor.execute(range(100), work_handler, total_items=100)
+    finally:
+        executor.shutdown()
+        item_exporter.close()
+
+
+@pytest.mark.parametrize('file_name', ['blocks.csv', 'blocks.json'])
+def test_resume_exports_every_item_once(tmpdir, file_name):
+    output = str(tmpdir.join(file_name))
+    ledger = open_progress_ledger(None, [output], resume=True)
+    with pytest.raises(Crash):
+        export_blocks(output, ledger, crash_at=60)
+    assert 60 not in ledger.completed
+    assert 0 < len(ledger.completed) < 100
+
+    # Items written after the last checkpoint are dropped on resume
+    with open(output, 'a') as file:
+        file.write('garbage\n')
+
+    ledger = open_progress_ledger(None, [output], resume=True)
+    export_blocks(output, ledger, file_offsets=ledger.file_offsets)
+    assert list(ledger.completed) == [(0, 99)]
+
+    with open(output) as file:
+        lines = file.read().splitlines()
+    if file_name.endswith('.csv'):
+        assert lines[0] == 'number'
+        numbers = [int(line) for line in lines[1:]]
+    else:
+        numbers = [json.loads(line)['number'] for line in lines]
+    assert sorted(numbers) == list(range(100))
@@ -0,0 +1,129 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import asyncio
+import random
+import threading
+import time
+
+import pytest
+
+from blockchainetl.jobs.exporters.in_memory_item_exporter import InMemoryItemExporter
+from ethereumetl.executors.async_batch_work_executor import AsyncBatchWorkExecutor
+from ethereumetl.executors.batch_work_executor import BatchWorkExecutor
+from ethereumetl.executors.reorder_buffer import ReorderBuffer
+
+
+def test_reorder_buffer_releases_batches_in_order():
+    exporter = InMemoryItemExporter(item_types=['item'])
+    exporter.open()
+    reorder_buffer = ReorderBuffer(max_size=3)
+    sequences = [reorder_buffer.reserve() for _ in range(3)]
+    assert sequences == [0, 1, 2]
+    assert reorder_buffer.is_full()
+
+    reorder_buffer.complete(2, [(exporter, {'type': 'item', 'value': 2})])
+    reorder_buffer.complete(1, [(exporter, {'type': 'item', 'value': 1})])
+    assert exporter.get_items('item') == []
+    assert reorder_buffer.is_full()
+
+    reorder_buffer.complete(0, [(exporter, {'type': 'item', 'value': 0})])
+    assert [item['value'] for item in exporter.get_items('item')] == [0, 1, 2]
+    assert not reorder_buffer.is_full()
+
+
+def test_reorder_buffer_reserve_waits_while_full():
+    reorder_buffer = ReorderBuffer(max_size=1)
+    reorder_buffer.reserve()
+    threading.Timer(0.1, lambda: reorder_buffer.complete(0, [])).start()
+    start_time = time.time()
+    assert reorder_buffer.reserve() == 1
+    assert time.time() - start_time >= 0.05
+
+
+def export_with_random_delay(item_exporter):
+    def work_handler(batch):
+        time.sleep(random.uniform(0, 0.01))
+        for value in batch:
+            item_exporter.export_item({'type': 'item', 'value': value})
+    return work_handler
+
+
+def test_batch_work_executor_ordered():
+    exporter = InMemoryItemExporter(item_types=['item'])
+    exporter.open()
+    executor = BatchWorkExecutor(3, max_workers=5, ordered=True, reorder_buffer_size=4)
+    executor.execute(range(100), export_with_random_delay(executor.wrap_item_exporter(exporter)))
+    executor.shutdown()
+
+    assert [item['value'] for item in exporter.get_items('item')] == list(range(100))
+
+
+class FailingItemExporter:
+    def export_item(self, item):
+        raise IOError('Disk full')
+
+
+def test_batch_work_executor_ordered_fails_if_exporter_fails():
+    executor = BatchWorkExecutor(1, max_workers=2, ordered=True, reorder_buffer_size=1)
+    with pytest.raises(IOError):
+        executor.execute(range(10), export_with_random_delay(executor.wrap_item_exporter(FailingItemExporter())))
+        executor.shutdown()
+
+
+def test_batch_work_executor_ordered_drops_items_of_failed_attempts():
+    exporter = InMemoryItemExporter(item_types=['item'])
+    exporter.open()
+    executor = BatchWorkExecutor(4, max_workers=2, ordered=True)
+    ordered_exporter = executor.wrap_item_exporter(exporter)
+    failed = set()
+
+    def work_handler(batch):
+        for value in batch:
+            ordered_exporter.export_item({'type': 'item', 'value': value})
+            if value % 4 == 1 and value not in failed:
+                failed.add(value)
+                raise ConnectionError()
+
+    executor.retry_policy = type(executor.retry_policy)(base_delay=0, max_delay=0)
+    executor.execute(range(12), work_handler)
+    executor.shutdown()
+
+    assert [item['value'] for item in exporter.get_items('item')] == list(range(12))
+
+
+@pytest.mark.parametrize('reorder_buffer_size', [1, 10])
+def test_async_batch_work_executor_ordered(reorder_buffer_size):
+    exporter = InMemoryItemExporter(item_types=['item'])
+    exporter.open()
+    executor = AsyncBatchWorkExecutor(3, max_workers=20, ordered=True, reorder_buffer_size=reorder_buffer_size)
+    ordered_exporter = executor.wrap_item_exporter(exporter)
+
+    async def work_handler(batch):
+        await asyncio.sleep(random.uniform(0, 0.01))
+        for value in batch:
+            ordered_exporter.export_item({'type': 'item', 'value': value})
+
+    executor.execute(range(100), work_handler)
+    executor.shutdown()
+
+    assert [item['value'] for item in exporter.get_items('item')] == list(range(100))
@@ -0,0 +1,161 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import asyncio
+
+import pytest
+import requests
+
+from ethereumetl.executors.retry_policy import DecorrelatedJitterBackoff, RetryBudget, CircuitBreaker, \
+    RetryPolicy, get_retry_after, parse_retry_after
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def http_error(status_code, headers):
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers.update(headers)
+    return requests.HTTPError(response=response)
+
+
+def test_decorrelated_jitter_backoff_stays_between_base_and_three_times_previous_delay():
+    backoff = DecorrelatedJitterBackoff(base_delay=1, max_delay=20)
+    previous_delay = 1
+    for _ in range(100):
+        delay = backoff.next_delay()
+        assert 1 <= delay <= min(20, previous_delay * 3)
+        previous_delay = delay
+
+
+def test_decorrelated_jitter_backoff_is_capped():
+    backoff = DecorrelatedJitterBackoff(base_delay=1, max_delay=5, uniform=lambda low, high: high)
+    assert [backoff.next_delay() for _ in range(3)] == [3, 5, 5]
+
+
+def test_retry_budget():
+    clock = FakeClock()
+    budget = RetryBudget(ratio=0.5, min_retries_per_second=1, max_tokens=2, clock=clock)
+    assert budget.try_acquire()
+    assert budget.try_acquire()
+    assert not budget.try_acquire()
+
+    budget.record_request()
+    budget.record_request()
+    assert budget.try_acquire()
+    assert not budget.try_acquire()
+
+    clock.now += 1
+    assert budget.try_acquire()
+
+
+def test_circuit_breaker_opens_after_consecutive_failures():
+    clock = FakeClock()
+    circuit_breaker = CircuitBreaker('http://node', failure_threshold=3, reset_timeout=10, clock=clock)
+    circuit_breaker.record_failure()
+    circuit_breaker.record_failure()
+    assert circuit_breaker.get_wait_seconds() == 0
+    circuit_breaker.record_failure()
+    assert circuit_breaker.get_wait_seconds() == 10
+
+    clock.now += 10
+    assert circuit_breaker.get_wait_seconds() == 0
+    assert circuit_breaker.state == CircuitBreaker.HALF_OPEN
+    # A single failure in the half open state opens it again
+    circuit_breaker.record_failure()
+    assert circuit_breaker.get_wait_seconds() == 10
+
+    clock.now += 10
+    circuit_breaker.get_wait_seconds()
+    circuit_breaker.record_success()
+    circuit_breaker.record_failure()
+    assert circuit_breaker.state == CircuitBreaker.CLOSED
+
+
+def test_circuit_breaker_opens_for_retry_after():
+    clock = FakeClock()
+    circuit_breaker = CircuitBreaker('http://node', clock=clock)
+    circuit_breaker.record_failure(retry_after=30)
+    assert circuit_breaker.get_wait_seconds() == 30
+
+
+def test_retry_policy_waits_only_when_all_endpoints_are_open():
+    retry_policy = RetryPolicy()
+    assert retry_policy.get_wait_seconds() == 0
+    retry_policy.get_circuit_breaker('http://node1').record_failure(retry_after=30)
+    assert retry_policy.get_wait_seconds() == pytest.approx(30, abs=1)
+    retry_policy.get_circuit_breaker('http://node2')
+    assert retry_policy.get_wait_seconds() == 0
+
+
+def test_get_retry_after():
+    assert get_retry_after(http_error(429, {'Retry-After': '7'})) == 7
+    assert get_retry_after(http_error(500, {'Retry-After': '7'})) is None
+    assert get_retry_after(http_error(429, {})) is None
+    assert get_retry_after(ValueError()) is None
+    assert parse_retry_after('Wed, 21 Oct 2015 07:28:10 GMT', now=1445412480) == 10
+
+
+def test_retry_policy_retries_with_retry_after():
+    retry_policy = RetryPolicy(base_delay=0, max_delay=0)
+    backoff = retry_policy.create_backoff()
+    assert retry_policy.get_retry_delay(backoff, http_error(429, {'Retry-After': '2'})) == 2
+    assert retry_policy.get_retry_delay(backoff, ValueError()) == 0
+
+
+def test_execute_with_retries():
+    retry_policy = RetryPolicy(base_delay=0, max_delay=0)
+    calls = []
+
+    def flaky(value):
+        calls.append(value)
+        if len(calls) < 3:
+            raise ConnectionError()
+        return value
+
+    assert retry_policy.execute_with_retries(flaky, 1, max_retries=3, retry_exceptions=(ConnectionError,)) == 1
+    assert len(calls) == 3
+
+    calls.clear()
+    with pytest.raises(ConnectionError):
+        retry_policy.execute_with_retries(flaky, 1, max_retries=2, retry_exceptions=(ConnectionError,))
+
+
+def test_execute_with_retries_gives_up_when_budget_is_exhausted():
+    retry_policy = RetryPolicy(base_delay=0, max_delay=0,
+                               budget=RetryBudget(ratio=0, min_retries_per_second=0, max_tokens=1))
+    calls = []
+
+    async def failing():
+        calls.append(1)
+        raise ConnectionError()
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(retry_policy.execute_with_retries_async(
+            failing, max_retries=5, retry_exceptions=(ConnectionError,)))
+    assert len(calls) == 2
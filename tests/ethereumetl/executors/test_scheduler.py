@@ -0,0 +1,125 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import threading
+
+import pytest
+
+from ethereumetl.executors.batch_work_executor import BatchWorkExecutor
+from ethereumetl.executors.scheduler import Scheduler, ScheduledExecutor, scheduled_stage, set_scheduler
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = Scheduler(max_workers=1)
+    yield scheduler
+    scheduler.shutdown()
+
+
+def block_scheduler(scheduler, stage='blocker', endpoint=None):
+    started = threading.Event()
+    release = threading.Event()
+
+    def blocking_work():
+        started.set()
+        release.wait()
+
+    future = scheduler.submit(stage, endpoint, blocking_work)
+    started.wait()
+    return release, future
+
+
+def test_scheduler_takes_work_from_stages_in_turn(scheduler):
+    release, _ = block_scheduler(scheduler)
+    order = []
+    futures = [scheduler.submit('blocks', None, order.append, 'blocks-{}'.format(i)) for i in range(3)]
+    futures += [scheduler.submit('receipts', None, order.append, 'receipts-{}'.format(i)) for i in range(2)]
+    assert scheduler.queue_depth() == 5
+    assert scheduler.queue_depth('receipts') == 2
+
+    release.set()
+    for future in futures:
+        future.result()
+
+    assert order == ['blocks-0', 'receipts-0', 'blocks-1', 'receipts-1', 'blocks-2']
+    assert scheduler.queue_depth() == 0
+
+
+def test_scheduler_limits_requests_per_endpoint():
+    scheduler = Scheduler(max_workers=4, max_requests_per_endpoint=1)
+    try:
+        release, blocked = block_scheduler(scheduler, endpoint='http://node-a')
+        other = scheduler.submit('other', 'http://node-b', lambda: 'b')
+        assert other.result(timeout=5) == 'b'
+
+        same = scheduler.submit('other', 'http://node-a', lambda: 'a')
+        assert not same.done()
+        assert scheduler.running_count('http://node-a') == 1
+
+        release.set()
+        assert same.result(timeout=5) == 'a'
+        blocked.result()
+    finally:
+        scheduler.shutdown()
+
+
+def test_batch_work_executors_share_scheduler_threads(scheduler):
+    set_scheduler(scheduler)
+    try:
+        thread_names = []
+        for stage in ['blocks', 'receipts', 'blocks']:
+            executor = BatchWorkExecutor(1, 1)
+            with scheduled_stage(stage):
+                executor.execute(range(2), lambda batch: thread_names.append(threading.current_thread().name))
+            executor.shutdown()
+    finally:
+        set_scheduler(None)
+
+    assert thread_names == ['Scheduler-0'] * 6
+
+
+def test_scheduled_executor_shutdown_waits_only_for_own_work(scheduler):
+    release, blocked = block_scheduler(scheduler)
+    executor = ScheduledExecutor(scheduler)
+    executor.shutdown()
+    assert not blocked.done()
+    release.set()
+    blocked.result()
+
+
+def test_scheduler_skips_cancelled_work(scheduler):
+    release, _ = block_scheduler(scheduler)
+    calls = []
+    cancelled = scheduler.submit('blocks', None, calls.append, 'cancelled')
+    kept = scheduler.submit('blocks', None, calls.append, 'kept')
+    assert cancelled.cancel()
+
+    release.set()
+    kept.result()
+    assert calls == ['kept']
+
+
+def test_scheduler_rejects_work_after_shutdown():
+    scheduler = Scheduler(max_workers=1)
+    scheduler.shutdown()
+    with pytest.raises(RuntimeError):
+        scheduler.submit('blocks', None, print)
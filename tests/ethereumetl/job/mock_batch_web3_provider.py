@@ -40,5 +40,14 @@ class MockBatchWeb3Provider(MockWeb3Provider):
             params = req['params']
             file_name = build_file_name(method, params)
             file_content = self.read_resource(file_name)
-            web3_response.append(json.loads(file_content))
+            response_item = json.loads(file_content)
+            # Like a node, the response has the ID of the request
+            response_item['id'] = req['id']
+            web3_response.append(response_item)
         return web3_response
+
+
+class MockAsyncBatchWeb3Provider(MockBatchWeb3Provider):
+
+    async def make_batch_request(self, text):
+        return super().make_batch_request(text)
@@ -0,0 +1,111 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import asyncio
+import json
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import websockets
+
+from tests.ethereumetl.job.mock_batch_web3_provider import MockBatchWeb3Provider
+
+
+# Serves JSON RPC batches from test resources over HTTP on localhost
+class MockJsonRpcServer:
+    def __init__(self, read_resource):
+        mock_provider = MockBatchWeb3Provider(read_resource)
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                request_text = self.rfile.read(int(self.headers['Content-Length'])).decode('utf-8')
+                response = json.dumps(mock_provider.make_batch_request(request_text)).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(response)))
+                self.end_headers()
+                self.wfile.write(response)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def uri(self):
+        host, port = self._server.server_address
+        return 'http://{}:{}'.format(host, port)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+# Serves JSON RPC requests and batches from test resources over a websocket on localhost.
+# Responses are sent in random order to exercise demultiplexing by request id.
+class MockWebsocketJsonRpcServer:
+    def __init__(self, read_resource):
+        self._mock_provider = MockBatchWeb3Provider(read_resource)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._server = None
+
+    @property
+    def uri(self):
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return 'ws://{}:{}'.format(host, port)
+
+    async def _serve(self):
+        return await websockets.serve(self._handle, '127.0.0.1', 0)
+
+    async def _handle(self, websocket, path=None):
+        async for message in websocket:
+            self._loop.create_task(self._respond(websocket, message))
+
+    async def _respond(self, websocket, message):
+        await asyncio.sleep(random.random() * 0.01)
+        request = json.loads(message)
+        if isinstance(request, list):
+            response = self._mock_provider.make_batch_request(message)
+            for response_item, request_item in zip(response, request):
+                response_item['id'] = request_item['id']
+        else:
+            response = self._mock_provider.make_request(request['method'], request['params'])
+            response['id'] = request['id']
+        await websocket.send(json.dumps(response))
+
+    def __enter__(self):
+        self._thread.start()
+        self._server = asyncio.run_coroutine_threadsafe(self._serve(), self._loop).result()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._server.close()
+        asyncio.run_coroutine_threadsafe(self._server.wait_closed(), self._loop).result(timeout=5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
@@ -23,10 +23,14 @@
 import pytest
 
 import tests.resources
+from ethereumetl.executors.batch_weights import read_block_weights
 from ethereumetl.jobs.export_blocks_job import ExportBlocksJob
 from ethereumetl.jobs.exporters.blocks_and_transactions_item_exporter import blocks_and_transactions_item_exporter
+from ethereumetl.providers.auto import get_async_provider_from_uri, get_provider_from_uri
 from ethereumetl.thread_local_proxy import ThreadLocalProxy
 from tests.ethereumetl.job.helpers import get_web3_provider
+from tests.ethereumetl.job.mock_batch_web3_provider import MockAsyncBatchWeb3Provider
+from tests.ethereumetl.job.mock_json_rpc_server import MockJsonRpcServer, MockWebsocketJsonRpcServer
 from tests.helpers import compare_lines_ignore_order, read_file, skip_if_slow_tests_disabled
 
 RESOURCE_GROUP = 'test_export_blocks_job'
@@ -70,3 +74,139 @@ def test_export_blocks_job(tmpdir, start_block, end_block, batch_size, resource_
     compare_lines_ignore_order(
         read_resource(resource_group, f'expected_transactions.{format}'), read_file(transactions_output_file)
     )
+
+
+@pytest.mark.parametrize("start_block,end_block,batch_size,resource_group,format", [
+    (0, 0, 1, 'block_without_transactions', 'csv'),
+    (483920, 483920, 1, 'block_with_logs', 'csv'),
+    (47218, 47219, 1, 'blocks_with_transactions', 'csv'),
+    (47218, 47219, 2, 'blocks_with_transactions', 'csv'),
+])
+def test_export_blocks_job_async(tmpdir, start_block, end_block, batch_size, resource_group, format):
+    blocks_output_file = str(tmpdir.join(f'actual_blocks.{format}'))
+    transactions_output_file = str(tmpdir.join(f'actual_transactions.{format}'))
+
+    job = ExportBlocksJob(
+        start_block=start_block, end_block=end_block, batch_size=batch_size,
+        batch_web3_provider=MockAsyncBatchWeb3Provider(lambda file: read_resource(resource_group, file)),
+        max_workers=100,
+        item_exporter=blocks_and_transactions_item_exporter(blocks_output_file, transactions_output_file),
+        use_async=True
+    )
+    job.run()
+
+    compare_lines_ignore_order(
+        read_resource(resource_group, f'expected_blocks.{format}'), read_file(blocks_output_file)
+    )
+
+    compare_lines_ignore_order(
+        read_resource(resource_group, f'expected_transactions.{format}'), read_file(transactions_output_file)
+    )
+
+
+def test_export_blocks_job_async_http(tmpdir):
+    resource_group = 'blocks_with_transactions'
+    blocks_output_file = str(tmpdir.join('actual_blocks.csv'))
+    transactions_output_file = str(tmpdir.join('actual_transactions.csv'))
+
+    with MockJsonRpcServer(lambda file: read_resource(resource_group, file)) as server:
+        job = ExportBlocksJob(
+            start_block=47218, end_block=47219, batch_size=1,
+            batch_web3_provider=get_async_provider_from_uri(server.uri),
+            max_workers=100,
+            item_exporter=blocks_and_transactions_item_exporter(blocks_output_file, transactions_output_file),
+            use_async=True
+        )
+        job.run()
+
+    compare_lines_ignore_order(
+        read_resource(resource_group, 'expected_blocks.csv'), read_file(blocks_output_file)
+    )
+
+    compare_lines_ignore_order(
+        read_resource(resource_group, 'expected_transactions.csv'), read_file(transactions_output_file)
+    )
+
+
+@pytest.mark.parametrize("start_block,end_block,batch_size,resource_group", [
+    (483920, 483920, 1, 'block_with_logs'),
+    (47218, 47219, 1, 'blocks_with_transactions'),
+    (47218, 47219, 2, 'blocks_with_transactions'),
+])
+def test_export_blocks_job_websocket(tmpdir, start_block, end_block, batch_size, resource_group):
+    blocks_output_file = str(tmpdir.join('actual_blocks.csv'))
+    transactions_output_file = str(tmpdir.join('actual_transactions.csv'))
+
+    with MockWebsocketJsonRpcServer(lambda file: read_resource(resource_group, file)) as server:
+        job = ExportBlocksJob(
+            start_block=start_block, end_block=end_block, batch_size=batch_size,
+            batch_web3_provider=ThreadLocalProxy(lambda: get_provider_from_uri(server.uri, batch=True)),
+            max_workers=5,
+            item_exporter=blocks_and_transactions_item_exporter(blocks_output_file, transactions_output_file)
+        )
+        job.run()
+
+    compare_lines_ignore_order(
+        read_resource(resource_group, 'expected_blocks.csv'), read_file(blocks_output_file)
+    )
+
+    compare_lines_ignore_order(
+        read_resource(resource_group, 'expected_transactions.csv'), read_file(transactions_output_file)
+    )
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_export_blocks_job_cpu_workers(tmpdir, use_async):
+    resource_group = 'blocks_with_transactions'
+    blocks_output_file = str(tmpdir.join('actual_blocks.csv'))
+    transactions_output_file = str(tmpdir.join('actual_transactions.csv'))
+
+    with MockJsonRpcServer(lambda file: read_resource(resource_group, file)) as server:
+        batch_web3_provider = get_async_provider_from_uri(server.uri) if use_async \
+            else ThreadLocalProxy(lambda: get_provider_from_uri(server.uri, batch=True))
+        job = ExportBlocksJob(
+            start_block=47218, end_block=47219, batch_size=1,
+            batch_web3_provider=batch_web3_provider,
+            max_workers=5,
+            item_exporter=blocks_and_transactions_item_exporter(blocks_output_file, transactions_output_file),
+            use_async=use_async,
+            cpu_workers=2
+        )
+        job.run()
+
+    compare_lines_ignore_order(
+        read_resource(resource_group, 'expected_blocks.csv'), read_file(blocks_output_file)
+    )
+
+    compare_lines_ignore_order(
+        read_resource(resource_group, 'expected_transactions.csv'), read_file(transactions_output_file)
+    )
+
+
+@pytest.mark.parametrize("batch_size", [1, 2])
+def test_export_blocks_job_block_weights(tmpdir, batch_size):
+    resource_group = 'blocks_with_transactions'
+    blocks_output_file = str(tmpdir.join('actual_blocks.csv'))
+    transactions_output_file = str(tmpdir.join('actual_transactions.csv'))
+    # Weights from a blocks file exported before, e.g. by an earlier run
+    weights_file = tmpdir.join('blocks.csv')
+    weights_file.write(read_resource(resource_group, 'expected_blocks.csv'))
+
+    job = ExportBlocksJob(
+        start_block=47218, end_block=47219, batch_size=batch_size,
+        batch_web3_provider=ThreadLocalProxy(
+            lambda: get_web3_provider('mock', lambda file: read_resource(resource_group, file), batch=True)
+        ),
+        max_workers=5,
+        item_exporter=blocks_and_transactions_item_exporter(blocks_output_file, transactions_output_file),
+        block_weights=read_block_weights(str(weights_file))
+    )
+    job.run()
+
+    compare_lines_ignore_order(
+        read_resource(resource_group, 'expected_blocks.csv'), read_file(blocks_output_file)
+    )
+
+    compare_lines_ignore_order(
+        read_resource(resource_group, 'expected_transactions.csv'), read_file(transactions_output_file)
+    )
@@ -27,8 +27,10 @@ from ethereumetl.web3_utils import build_web3
 import tests.resources
 from ethereumetl.jobs.export_geth_traces_job import ExportGethTracesJob
 from ethereumetl.jobs.exporters.geth_traces_item_exporter import geth_traces_item_exporter
+from ethereumetl.providers.auto import get_provider_from_uri
 from ethereumetl.thread_local_proxy import ThreadLocalProxy
 from tests.ethereumetl.job.helpers import get_web3_provider
+from tests.ethereumetl.job.mock_json_rpc_server import MockWebsocketJsonRpcServer
 from tests.helpers import compare_lines_ignore_order, read_file
 
 # use same resources for testing export/extract jobs
@@ -62,3 +64,24 @@ def test_export_geth_traces_job(tmpdir, start_block, end_block, resource_group,
     compare_lines_ignore_order(
         read_resource(resource_group, 'geth_traces.json'), read_file(traces_output_file)
     )
+
+
+@pytest.mark.parametrize("start_block,end_block,resource_group", [
+    (1000690, 1000690, 'block_with_create'),
+    (1000000, 1000000, 'block_with_subtraces'),
+])
+def test_export_geth_traces_job_websocket(tmpdir, start_block, end_block, resource_group):
+    traces_output_file = str(tmpdir.join('actual_geth_traces.json'))
+
+    with MockWebsocketJsonRpcServer(lambda file: read_resource(resource_group, file)) as server:
+        job = ExportGethTracesJob(
+            start_block=start_block, end_block=end_block, batch_size=1,
+            batch_web3_provider=ThreadLocalProxy(lambda: get_provider_from_uri(server.uri, batch=True)),
+            max_workers=5,
+            item_exporter=geth_traces_item_exporter(traces_output_file),
+        )
+        job.run()
+
+    compare_lines_ignore_order(
+        read_resource(resource_group, 'geth_traces.json'), read_file(traces_output_file)
+    )
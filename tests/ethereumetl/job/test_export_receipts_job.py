@@ -26,8 +26,10 @@ import pytest
 import tests.resources
 from ethereumetl.jobs.export_receipts_job import ExportReceiptsJob
 from ethereumetl.jobs.exporters.receipts_and_logs_item_exporter import receipts_and_logs_item_exporter
+from ethereumetl.providers.sized_response import with_byte_size
 from ethereumetl.thread_local_proxy import ThreadLocalProxy
 from tests.ethereumetl.job.helpers import get_web3_provider
+from tests.ethereumetl.job.mock_batch_web3_provider import MockBatchWeb3Provider
 from tests.helpers import compare_lines_ignore_order, read_file, skip_if_slow_tests_disabled
 
 RESOURCE_GROUP = 'test_export_receipts_job'
@@ -74,3 +76,63 @@ def test_export_receipts_job(tmpdir, batch_size, transaction_hashes, output_form
     compare_lines_ignore_order(
         read_resource(resource_group, 'expected_logs.' + output_format), read_file(logs_output_file)
     )
+
+
+@pytest.mark.parametrize("batch_size,start_block,end_block,output_format,resource_group,web3_provider_type", [
+    (1, 483920, 483920, 'csv', 'block_receipts_with_logs', 'mock'),
+    (2, 483920, 483920, 'json', 'block_receipts_with_logs', 'mock'),
+    (1, 483920, 483920, 'csv', 'block_receipts_fallback', 'mock'),
+    (2, 483920, 483920, 'json', 'block_receipts_fallback', 'mock'),
+])
+def test_export_receipts_job_by_block_range(
+        tmpdir, batch_size, start_block, end_block, output_format, resource_group, web3_provider_type):
+    receipts_output_file = str(tmpdir.join('actual_receipts.' + output_format))
+    logs_output_file = str(tmpdir.join('actual_logs.' + output_format))
+
+    job = ExportReceiptsJob(
+        transaction_hashes_iterable=None,
+        start_block=start_block,
+        end_block=end_block,
+        batch_size=batch_size,
+        batch_web3_provider=ThreadLocalProxy(
+            lambda: get_web3_provider(web3_provider_type, lambda file: read_resource(resource_group, file), batch=True)
+        ),
+        max_workers=5,
+        item_exporter=receipts_and_logs_item_exporter(receipts_output_file, logs_output_file),
+        export_receipts=receipts_output_file is not None,
+        export_logs=logs_output_file is not None
+    )
+    job.run()
+
+    compare_lines_ignore_order(
+        read_resource(resource_group, 'expected_receipts.' + output_format), read_file(receipts_output_file)
+    )
+
+    compare_lines_ignore_order(
+        read_resource(resource_group, 'expected_logs.' + output_format), read_file(logs_output_file)
+    )
+
+
+class SizedMockBatchWeb3Provider(MockBatchWeb3Provider):
+    """Records a byte size of 1000 for each response in a batch, like the HTTP provider records the response size."""
+
+    def make_batch_request(self, text):
+        response = super().make_batch_request(text)
+        return with_byte_size(response, 1000 * len(response))
+
+
+def test_export_receipts_job_by_block_range_fallback_tracks_response_size(tmpdir):
+    resource_group = 'block_receipts_fallback'
+    job = ExportReceiptsJob(
+        transaction_hashes_iterable=None,
+        start_block=483920,
+        end_block=483920,
+        batch_size=2,
+        batch_web3_provider=SizedMockBatchWeb3Provider(lambda file: read_resource(resource_group, file)),
+        max_workers=1,
+        item_exporter=receipts_and_logs_item_exporter(str(tmpdir.join('receipts.csv')), str(tmpdir.join('logs.csv')))
+    )
+    job.run()
+
+    # The eth_getBlockByNumber response and the eth_getTransactionReceipt responses of the 4 transactions in the block
+    assert job.batch_work_executor.bytes_per_item == 1000 + 1000 * 4
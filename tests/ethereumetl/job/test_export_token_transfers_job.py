@@ -22,12 +22,17 @@
 
 
 import pytest
+from hexbytes import HexBytes
 from ethereumetl.web3_utils import build_web3
 
 import tests.resources
+from ethereumetl.executors import batch_work_executor
+from ethereumetl.executors.retry_policy import RetryPolicy
 from ethereumetl.jobs.export_token_transfers_job import ExportTokenTransfersJob
 from ethereumetl.jobs.exporters.token_transfers_item_exporter import token_transfers_item_exporter
+from ethereumetl.service.token_transfer_extractor import TRANSFER_EVENT_TOPIC
 from ethereumetl.thread_local_proxy import ThreadLocalProxy
+from ethereumetl.utils import is_log_limit_error
 from tests.ethereumetl.job.helpers import get_web3_provider
 from tests.helpers import compare_lines_ignore_order, read_file
 
@@ -57,3 +62,137 @@ def test_export_token_transfers_job(tmpdir, start_block, end_block, batch_size,
     compare_lines_ignore_order(
         read_resource(resource_group, 'expected_token_transfers.csv'), read_file(output_file)
     )
+
+
+class LimitedLogsEth:
+    """Returns max_logs fake transfer logs per block and fails like Infura for ranges with more than max_logs logs."""
+
+    def __init__(self, logs_per_block, max_logs):
+        self.logs_per_block = logs_per_block
+        self.max_logs = max_logs
+        self.requested_ranges = []
+
+    def getLogs(self, filter_params):
+        start_block, end_block = filter_params['fromBlock'], filter_params['toBlock']
+        self.requested_ranges.append((start_block, end_block))
+        logs = [build_transfer_log(block_number, log_index)
+                for block_number in range(start_block, end_block + 1)
+                for log_index in range(self.logs_per_block)]
+        if len(logs) > self.max_logs:
+            raise ValueError({'code': -32005, 'message': 'query returned more than {} results'.format(self.max_logs)})
+        return logs
+
+
+class LimitedLogsWeb3:
+    def __init__(self, eth):
+        self.eth = eth
+
+
+def build_transfer_log(block_number, log_index):
+    # The log as formatted by web3
+    return {
+        'logIndex': log_index,
+        'transactionHash': HexBytes(block_number.to_bytes(32, 'big')),
+        'transactionIndex': 0,
+        'blockHash': HexBytes(block_number.to_bytes(32, 'big')),
+        'blockNumber': block_number,
+        'address': '0x' + '11' * 20,
+        'data': '0x' + '{:064x}'.format(log_index),
+        'topics': [
+            HexBytes(TRANSFER_EVENT_TOPIC),
+            HexBytes((1).to_bytes(32, 'big')),
+            HexBytes((2).to_bytes(32, 'big')),
+        ],
+    }
+
+
+def test_export_token_transfers_job_splits_dense_ranges(tmpdir):
+    output_file = str(tmpdir.join('token_transfers.csv'))
+    eth = LimitedLogsEth(logs_per_block=10, max_logs=100)
+
+    job = ExportTokenTransfersJob(
+        start_block=0, end_block=99, batch_size=100,
+        web3=LimitedLogsWeb3(eth),
+        item_exporter=token_transfers_item_exporter(output_file),
+        max_workers=1,
+        max_logs_per_request=100
+    )
+    job.run()
+
+    assert len(read_file(output_file).splitlines()) == 1 + 100 * 10
+    # After the first failures the ranges are sized by the learned density instead of bisected
+    successful_ranges = [(start, end) for start, end in eth.requested_ranges if (end - start + 1) * 10 <= 100]
+    assert len(successful_ranges) < len(eth.requested_ranges)
+    assert len(eth.requested_ranges) - len(successful_ranges) <= 4
+    covered_blocks = sorted(block for start, end in successful_ranges for block in range(start, end + 1))
+    assert covered_blocks == list(range(100))
+
+
+def test_export_token_transfers_job_grows_sparse_ranges(tmpdir):
+    output_file = str(tmpdir.join('token_transfers.csv'))
+    eth = LimitedLogsEth(logs_per_block=1, max_logs=1000)
+
+    job = ExportTokenTransfersJob(
+        start_block=0, end_block=999, batch_size=10,
+        web3=LimitedLogsWeb3(eth),
+        item_exporter=token_transfers_item_exporter(output_file),
+        max_workers=1,
+        max_logs_per_request=1000
+    )
+    job.run()
+
+    assert len(read_file(output_file).splitlines()) == 1 + 1000
+    # Once the density is known, ranges are sized to the limit instead of the batch size
+    assert max(end - start + 1 for start, end in eth.requested_ranges) > 10
+    assert len(eth.requested_ranges) < 100
+    covered_blocks = sorted(block for start, end in eth.requested_ranges for block in range(start, end + 1))
+    assert covered_blocks == list(range(1000))
+
+
+class RateLimitedLogsEth(LimitedLogsEth):
+    """Fails the first rate_limited_requests requests like Infura does for rate limited projects."""
+
+    def __init__(self, logs_per_block, max_logs, rate_limited_requests):
+        super().__init__(logs_per_block, max_logs)
+        self.rate_limited_requests = rate_limited_requests
+
+    def getLogs(self, filter_params):
+        if self.rate_limited_requests > 0:
+            self.rate_limited_requests -= 1
+            self.requested_ranges.append((filter_params['fromBlock'], filter_params['toBlock']))
+            raise ValueError({'code': -32005, 'message': 'daily request count exceeded, request rate limited'})
+        return super().getLogs(filter_params)
+
+
+def test_export_token_transfers_job_retries_rate_limited_ranges(tmpdir, monkeypatch):
+    monkeypatch.setattr(batch_work_executor, 'get_retry_policy', lambda: RetryPolicy(base_delay=0, max_delay=0))
+    output_file = str(tmpdir.join('token_transfers.csv'))
+    eth = RateLimitedLogsEth(logs_per_block=1, max_logs=100, rate_limited_requests=1)
+
+    job = ExportTokenTransfersJob(
+        start_block=0, end_block=9, batch_size=10,
+        web3=LimitedLogsWeb3(eth),
+        item_exporter=token_transfers_item_exporter(output_file),
+        max_workers=1
+    )
+    job.run()
+
+    # The batch is retried by the executor, the range isn't bisected
+    assert eth.requested_ranges == [(0, 9)] + [(block_number, block_number) for block_number in range(10)]
+    assert len(read_file(output_file).splitlines()) == 1 + 10
+
+
+@pytest.mark.parametrize("error,expected", [
+    ({'code': -32005, 'message': 'query returned more than 10000 results'}, True),
+    ({'code': -32602, 'message': 'Log response size exceeded. You can make eth_getLogs requests with up to a 2K block '
+                                 'range and no limit on the response size'}, True),
+    ({'code': -32000, 'message': 'block range is too wide'}, True),
+    ({'code': -32000, 'message': 'exceed maximum block range: 5000'}, True),
+    ({'code': -32602, 'message': 'invalid block range params'}, False),
+    ({'code': -32005, 'message': 'daily request count exceeded, request rate limited'}, False),
+    ({'code': -32005, 'message': 'project ID request rate exceeded'}, False),
+    ({'code': -32000, 'message': 'header not found'}, False),
+    ({'code': -32000, 'message': 'query timeout exceeded'}, False),
+])
+def test_is_log_limit_error(error, expected):
+    assert is_log_limit_error(error) == expected
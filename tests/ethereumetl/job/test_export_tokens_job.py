@@ -21,14 +21,24 @@
 # SOFTWARE.
 
 
+import json
+
 import pytest
+from eth_abi import decode_abi, encode_abi
 from ethereumetl.web3_utils import build_web3
 
 import tests.resources
+from ethereumetl.executors.retry_policy import RetryPolicy
 from ethereumetl.jobs.export_tokens_job import ExportTokensJob
 from ethereumetl.jobs.exporters.tokens_item_exporter import tokens_item_exporter
+from ethereumetl.providers import batch_request
+from ethereumetl.service import eth_token_service
+from ethereumetl.service.eth_token_service import MULTICALL3_ADDRESS
+from ethereumetl.service.token_cache import TokenMetadataCache
 from ethereumetl.thread_local_proxy import ThreadLocalProxy
 from tests.ethereumetl.job.helpers import get_web3_provider
+from tests.ethereumetl.job.mock_batch_web3_provider import MockBatchWeb3Provider
+from tests.ethereumetl.job.mock_web3_provider import build_file_name
 from tests.helpers import compare_lines_ignore_order, read_file, skip_if_slow_tests_disabled
 
 RESOURCE_GROUP = 'test_export_tokens_job'
@@ -61,3 +71,269 @@ def test_export_tokens_job(tmpdir, token_addresses, resource_group, web3_provide
     compare_lines_ignore_order(
         read_resource(resource_group, 'expected_tokens.csv'), read_file(output_file)
     )
+
+
+@pytest.mark.parametrize("token_addresses,batch_size,resource_group,web3_provider_type", [
+    (['0xf763be8b3263c268e9789abfb3934564a7b80054', '0x86fa049857e0209aa7d9e616f7eb3b3b78ecfdb0'], 2,
+     'tokens_in_batch', 'mock'),
+    skip_if_slow_tests_disabled(
+        (['0xf763be8b3263c268e9789abfb3934564a7b80054', '0x86fa049857e0209aa7d9e616f7eb3b3b78ecfdb0'], 2,
+         'tokens_in_batch', 'infura')
+    )
+])
+def test_export_tokens_job_batch(tmpdir, token_addresses, batch_size, resource_group, web3_provider_type):
+    output_file = str(tmpdir.join('tokens.csv'))
+
+    job = ExportTokensJob(
+        token_addresses_iterable=token_addresses,
+        web3=ThreadLocalProxy(
+            lambda: build_web3(get_web3_provider(
+                web3_provider_type, lambda file: read_resource(resource_group, file), batch=True))
+        ),
+        item_exporter=tokens_item_exporter(output_file),
+        max_workers=5,
+        batch_size=batch_size
+    )
+    job.run()
+
+    compare_lines_ignore_order(
+        read_resource(resource_group, 'expected_tokens.csv'), read_file(output_file)
+    )
+
+
+class MockMulticallBatchWeb3Provider(MockBatchWeb3Provider):
+    """Answers the calls in aggregate3 calls to Multicall3 with the eth_call responses of the resource group."""
+
+    def __init__(self, read_resource):
+        super().__init__(read_resource)
+        self.multicall_count = 0
+
+    def make_request(self, method, params):
+        if method == 'eth_getCode' and params[0].lower() == MULTICALL3_ADDRESS:
+            return {'jsonrpc': '2.0', 'id': 0, 'result': '0x6080'}
+        return super().make_request(method, params)
+
+    def make_batch_request(self, text):
+        web3_response = []
+        for req in json.loads(text):
+            if req['method'] == 'eth_call' and req['params'][0]['to'] == MULTICALL3_ADDRESS:
+                self.multicall_count += 1
+                web3_response.append({'jsonrpc': '2.0', 'id': req['id'], 'result': self._aggregate3(req['params'][0])})
+            else:
+                web3_response.extend(super().make_batch_request(json.dumps([req])))
+        return web3_response
+
+    def _aggregate3(self, transaction):
+        calls = decode_abi(['(address,bool,bytes)[]'], bytes.fromhex(transaction['data'][10:]))[0]
+        call_results = []
+        for target, _, call_data in calls:
+            file_name = build_file_name('eth_call', [{'to': target.lower(), 'data': '0x' + call_data.hex()}, 'latest'])
+            result = json.loads(self.read_resource(file_name)).get('result')
+            call_results.append((result is not None, bytes.fromhex(result[2:]) if result is not None else b''))
+        return '0x' + encode_abi(['(bool,bytes)[]'], [call_results]).hex()
+
+
+def test_export_tokens_job_multicall(tmpdir):
+    output_file = str(tmpdir.join('tokens.csv'))
+    resource_group = 'tokens_in_batch'
+    provider = MockMulticallBatchWeb3Provider(lambda file: read_resource(resource_group, file))
+
+    job = ExportTokensJob(
+        token_addresses_iterable=['0xf763be8b3263c268e9789abfb3934564a7b80054',
+                                  '0x86fa049857e0209aa7d9e616f7eb3b3b78ecfdb0'],
+        web3=build_web3(provider),
+        item_exporter=tokens_item_exporter(output_file),
+        max_workers=1,
+        batch_size=2
+    )
+    job.run()
+
+    assert provider.multicall_count == 1
+    compare_lines_ignore_order(
+        read_resource(resource_group, 'expected_tokens.csv'), read_file(output_file)
+    )
+
+
+class OutOfGasMulticallBatchWeb3Provider(MockMulticallBatchWeb3Provider):
+    """Fails the totalSupply() calls to failing_address in aggregate3, like a call running out of gas."""
+
+    def __init__(self, read_resource, failing_address):
+        super().__init__(read_resource)
+        self.failing_address = failing_address
+        self.eth_calls = []
+
+    def make_batch_request(self, text):
+        self.eth_calls.extend(req['params'][0] for req in json.loads(text)
+                              if req['method'] == 'eth_call' and req['params'][0]['to'] != MULTICALL3_ADDRESS)
+        return super().make_batch_request(text)
+
+    def _aggregate3(self, transaction):
+        calls = decode_abi(['(address,bool,bytes)[]'], bytes.fromhex(transaction['data'][10:]))[0]
+        call_results = decode_abi(['(bool,bytes)[]'], bytes.fromhex(super()._aggregate3(transaction)[2:]))[0]
+        call_results = [(False, b'') if (target.lower(), call_data.hex()) == (self.failing_address, '18160ddd')
+                        else call_result for (target, _, call_data), call_result in zip(calls, call_results)]
+        return '0x' + encode_abi(['(bool,bytes)[]'], [call_results]).hex()
+
+
+def test_export_tokens_job_multicall_resends_failed_calls(tmpdir):
+    output_file = str(tmpdir.join('tokens.csv'))
+    resource_group = 'tokens_in_batch'
+    failing_address = '0xf763be8b3263c268e9789abfb3934564a7b80054'
+    provider = OutOfGasMulticallBatchWeb3Provider(lambda file: read_resource(resource_group, file), failing_address)
+
+    job = ExportTokensJob(
+        token_addresses_iterable=[failing_address, '0x86fa049857e0209aa7d9e616f7eb3b3b78ecfdb0'],
+        web3=build_web3(provider),
+        item_exporter=tokens_item_exporter(output_file),
+        max_workers=1,
+        batch_size=2
+    )
+    job.run()
+
+    # The failed call is sent again, the calls of fields with a result aren't
+    assert {'to': failing_address, 'data': '0x18160ddd'} in provider.eth_calls
+    assert {'to': failing_address, 'data': '0xf76f8d78'} not in provider.eth_calls
+    compare_lines_ignore_order(
+        read_resource(resource_group, 'expected_tokens.csv'), read_file(output_file)
+    )
+
+
+def test_export_tokens_job_token_cache(tmpdir):
+    resource_group = 'tokens_in_batch'
+    token_addresses = ['0xf763be8b3263c268e9789abfb3934564a7b80054', '0x86fa049857e0209aa7d9e616f7eb3b3b78ecfdb0']
+    token_cache_file = str(tmpdir.join('tokens.db'))
+
+    def export_tokens(output_file, total_supply_refresh_blocks):
+        requested_files = []
+
+        def read_resource_and_record(file):
+            requested_files.append(file)
+            return read_resource(resource_group, file)
+
+        token_cache = TokenMetadataCache(token_cache_file, total_supply_refresh_blocks=total_supply_refresh_blocks)
+        job = ExportTokensJob(
+            token_addresses_iterable=token_addresses,
+            web3=build_web3(get_web3_provider('mock', read_resource_and_record, batch=True)),
+            item_exporter=tokens_item_exporter(output_file),
+            max_workers=1,
+            batch_size=2,
+            token_cache=token_cache
+        )
+        job.run()
+        token_cache.close()
+
+        compare_lines_ignore_order(read_resource(resource_group, 'expected_tokens.csv'), read_file(output_file))
+        return [file for file in requested_files if file.startswith('web3_response.eth_call')]
+
+    assert len(export_tokens(str(tmpdir.join('tokens_1.csv')), total_supply_refresh_blocks=100)) == 14
+    # Served from the cache
+    assert export_tokens(str(tmpdir.join('tokens_2.csv')), total_supply_refresh_blocks=100) == []
+    # Only the outdated total supply is read again
+    requested_calls = export_tokens(str(tmpdir.join('tokens_3.csv')), total_supply_refresh_blocks=0)
+    assert sorted(requested_calls) == sorted(
+        'web3_response.eth_call_data_0x18160ddd_to_{}_latest.json'.format(address) for address in token_addresses)
+
+
+def test_export_tokens_job_batch_doesnt_resend_reverted_calls(tmpdir):
+    resource_group = 'tokens_in_batch'
+    requested_files = []
+
+    def read_resource_and_record(file):
+        requested_files.append(file)
+        return read_resource(resource_group, file)
+
+    job = ExportTokensJob(
+        token_addresses_iterable=['0xf763be8b3263c268e9789abfb3934564a7b80054',
+                                  '0x86fa049857e0209aa7d9e616f7eb3b3b78ecfdb0'],
+        web3=build_web3(get_web3_provider('mock', read_resource_and_record, batch=True)),
+        item_exporter=tokens_item_exporter(str(tmpdir.join('tokens.csv'))),
+        max_workers=1,
+        batch_size=2
+    )
+    job.run()
+
+    # SYMBOL(), NAME() and DECIMALS() revert for both tokens, the reverts are final
+    eth_call_files = [file for file in requested_files if file.startswith('web3_response.eth_call')]
+    assert len(eth_call_files) == 14
+    assert len(set(eth_call_files)) == 14
+
+
+class BatchLimitWeb3Provider(MockBatchWeb3Provider):
+    """Answers batches with more than max_batch_size requests with one error, like erigon does."""
+
+    def __init__(self, read_resource, max_batch_size):
+        super().__init__(read_resource)
+        self.max_batch_size = max_batch_size
+        self.batch_sizes = []
+
+    def make_batch_request(self, text):
+        batch_size = len(json.loads(text))
+        self.batch_sizes.append(batch_size)
+        if batch_size > self.max_batch_size:
+            return {'jsonrpc': '2.0', 'id': None, 'error': {'code': -32600, 'message': 'batch limit exceeded'}}
+        return super().make_batch_request(text)
+
+
+def test_export_tokens_job_batch_limit(tmpdir, monkeypatch):
+    monkeypatch.setattr(eth_token_service, 'MAX_CALLS_PER_BATCH', 12)
+    output_file = str(tmpdir.join('tokens.csv'))
+    resource_group = 'tokens_in_batch'
+    provider = BatchLimitWeb3Provider(lambda file: read_resource(resource_group, file), max_batch_size=5)
+
+    job = ExportTokensJob(
+        token_addresses_iterable=['0xf763be8b3263c268e9789abfb3934564a7b80054',
+                                  '0x86fa049857e0209aa7d9e616f7eb3b3b78ecfdb0'],
+        web3=build_web3(provider),
+        item_exporter=tokens_item_exporter(output_file),
+        max_workers=1,
+        batch_size=2
+    )
+    job.run()
+
+    # The first batch is split until it fits, the next batches use the smaller size
+    assert provider.batch_sizes[:3] == [12, 6, 3]
+    assert max(provider.batch_sizes[3:]) == 3
+    compare_lines_ignore_order(
+        read_resource(resource_group, 'expected_tokens.csv'), read_file(output_file)
+    )
+
+
+class HeaderNotFoundBatchWeb3Provider(MockBatchWeb3Provider):
+    """Fails the totalSupply() calls to failing_address with an error that isn't a revert."""
+
+    def __init__(self, read_resource, failing_address):
+        super().__init__(read_resource)
+        self.failing_address = failing_address
+
+    def make_batch_request(self, text):
+        web3_response = []
+        for req in json.loads(text):
+            if req['method'] == 'eth_call' and req['params'][0] == {'to': self.failing_address, 'data': '0x18160ddd'}:
+                web3_response.append(
+                    {'jsonrpc': '2.0', 'id': req['id'], 'error': {'code': -32000, 'message': 'header not found'}})
+            else:
+                web3_response.extend(super().make_batch_request(json.dumps([req])))
+        return web3_response
+
+
+def test_export_tokens_job_token_cache_skips_failed_tokens(tmpdir, monkeypatch):
+    monkeypatch.setattr(batch_request, 'get_retry_policy', lambda: RetryPolicy(base_delay=0, max_delay=0))
+    resource_group = 'tokens_in_batch'
+    failing_address = '0xf763be8b3263c268e9789abfb3934564a7b80054'
+    token_cache = TokenMetadataCache(str(tmpdir.join('tokens.db')))
+
+    job = ExportTokensJob(
+        token_addresses_iterable=[failing_address, '0x86fa049857e0209aa7d9e616f7eb3b3b78ecfdb0'],
+        web3=build_web3(HeaderNotFoundBatchWeb3Provider(
+            lambda file: read_resource(resource_group, file), failing_address)),
+        item_exporter=tokens_item_exporter(str(tmpdir.join('tokens.csv'))),
+        max_workers=1,
+        batch_size=2,
+        token_cache=token_cache
+    )
+    job.run()
+
+    # The failure isn't cached as a token without metadata, the token is requested again in the next run
+    assert list(token_cache.get_many([failing_address, '0x86fa049857e0209aa7d9e616f7eb3b3b78ecfdb0'])) == \
+        ['0x86fa049857e0209aa7d9e616f7eb3b3b78ecfdb0']
+    token_cache.close()
@@ -25,7 +25,7 @@ import pytest
 from ethereumetl.web3_utils import build_web3
 
 import tests.resources
-from ethereumetl.jobs.export_traces_job import ExportTracesJob
+from ethereumetl.jobs.export_traces_job import ExportTracesJob, get_contiguous_ranges
 from ethereumetl.jobs.exporters.traces_item_exporter import traces_item_exporter
 from ethereumetl.thread_local_proxy import ThreadLocalProxy
 from tests.ethereumetl.job.helpers import get_web3_provider
@@ -63,3 +63,59 @@ def test_export_traces_job(tmpdir, start_block, end_block, resource_group, web3_
     compare_lines_ignore_order(
         read_resource(resource_group, 'expected_traces.csv'), read_file(traces_output_file)
     )
+
+
+@pytest.mark.parametrize("start_block,end_block,batch_size,resource_group,web3_provider_type", [
+    (0, 0, 5, 'block_without_transactions', 'mock'),
+    (1000690, 1000690, 5, 'block_with_create', 'mock'),
+    (1000000, 1000000, 5, 'block_with_subtraces', 'mock'),
+])
+def test_export_traces_job_batch(tmpdir, start_block, end_block, batch_size, resource_group, web3_provider_type):
+    traces_output_file = str(tmpdir.join('actual_traces.csv'))
+
+    job = ExportTracesJob(
+        start_block=start_block, end_block=end_block, batch_size=batch_size,
+        web3=None,
+        batch_web3_provider=ThreadLocalProxy(
+            lambda: get_web3_provider(web3_provider_type, lambda file: read_resource(resource_group, file), batch=True)
+        ),
+        max_workers=5,
+        item_exporter=traces_item_exporter(traces_output_file),
+    )
+    job.run()
+
+    compare_lines_ignore_order(
+        read_resource(resource_group, 'expected_traces.csv'), read_file(traces_output_file)
+    )
+
+
+@pytest.mark.parametrize("start_block,end_block,resource_group,trace_filter_supported", [
+    # trace_filter returns the traces in reverse order, they are exported with the trace_block indexes
+    (1000000, 1000000, 'block_with_subtraces', True),
+    # trace_filter is not supported by the node, the job falls back to trace_block
+    (1000690, 1000690, 'block_with_create', False),
+])
+def test_export_traces_job_trace_filter(tmpdir, start_block, end_block, resource_group, trace_filter_supported):
+    traces_output_file = str(tmpdir.join('actual_traces.csv'))
+
+    job = ExportTracesJob(
+        start_block=start_block, end_block=end_block, batch_size=5,
+        web3=None,
+        batch_web3_provider=ThreadLocalProxy(
+            lambda: get_web3_provider('mock', lambda file: read_resource(resource_group, file), batch=True)
+        ),
+        max_workers=5,
+        item_exporter=traces_item_exporter(traces_output_file),
+        use_trace_filter=True,
+    )
+    job.run()
+
+    assert job.trace_filter_supported == trace_filter_supported
+    compare_lines_ignore_order(
+        read_resource(resource_group, 'expected_traces.csv'), read_file(traces_output_file)
+    )
+
+
+def test_get_contiguous_ranges():
+    assert list(get_contiguous_ranges([7, 1, 2, 3, 9, 10])) == [(1, 3), (7, 7), (9, 10)]
+    assert list(get_contiguous_ranges([])) == []
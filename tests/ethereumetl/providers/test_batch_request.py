@@ -0,0 +1,146 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import asyncio
+import json
+
+from ethereumetl.executors.retry_policy import RetryPolicy, RetryBudget
+from ethereumetl.json_rpc_requests import generate_get_block_by_number_json_rpc
+from ethereumetl.providers.batch_request import make_batch_request, make_batch_request_async
+from ethereumetl.providers.sized_response import with_byte_size, get_byte_size
+
+NO_DELAY = RetryPolicy(base_delay=0, max_delay=0)
+
+
+class FlakyNode:
+    """Fails each request id listed in failures once, returning the responses in reverse order."""
+
+    def __init__(self, failures, error=None):
+        self.failures = failures
+        self.error = error
+        self.batches = []
+
+    def make_batch_request(self, text):
+        requests = json.loads(text)
+        self.batches.append([request['id'] for request in requests])
+        response = []
+        for request in reversed(requests):
+            if request['id'] in self.failures:
+                self.failures.discard(request['id'])
+                if self.error is None:
+                    response.append({'jsonrpc': '2.0', 'id': request['id'], 'result': None})
+                else:
+                    response.append({'jsonrpc': '2.0', 'id': request['id'], 'error': self.error})
+            else:
+                response.append({'jsonrpc': '2.0', 'id': request['id'], 'result': request['params'][0]})
+        return with_byte_size(response, 100)
+
+
+class AsyncFlakyNode(FlakyNode):
+    async def make_batch_request(self, text):
+        return super().make_batch_request(text)
+
+
+class AlwaysContains(set):
+    def __contains__(self, item):
+        return True
+
+    def discard(self, item):
+        pass
+
+
+def get_requests(count):
+    return list(generate_get_block_by_number_json_rpc(range(count), False))
+
+
+def test_make_batch_request_retries_only_failed_requests():
+    node = FlakyNode(failures={1, 3}, error={'code': -32000, 'message': 'header not found'})
+    response = make_batch_request(node, get_requests(5), retry_policy=NO_DELAY)
+
+    assert node.batches == [[0, 1, 2, 3, 4], [1, 3]]
+    assert [response_item['id'] for response_item in response] == [0, 1, 2, 3, 4]
+    assert all(response_item['result'] is not None for response_item in response)
+    assert get_byte_size(response) == 200
+
+
+def test_make_batch_request_returns_responses_in_request_order():
+    node = FlakyNode(failures=set())
+    response = make_batch_request(node, get_requests(3), retry_policy=NO_DELAY)
+
+    assert node.batches == [[0, 1, 2]]
+    assert [response_item['id'] for response_item in response] == [0, 1, 2]
+    assert get_byte_size(response) == 100
+
+
+def test_make_batch_request_retries_null_results():
+    node = FlakyNode(failures={2})
+    response = make_batch_request(node, get_requests(3), retry_policy=NO_DELAY)
+
+    assert node.batches == [[0, 1, 2], [2]]
+    assert response[2]['result'] == '0x2'
+
+
+def test_make_batch_request_does_not_retry_non_retriable_errors():
+    node = FlakyNode(failures={0}, error={'code': -32602, 'message': 'invalid argument'})
+    response = make_batch_request(node, get_requests(2), retry_policy=NO_DELAY)
+
+    assert node.batches == [[0, 1]]
+    assert response[0]['error']['code'] == -32602
+
+
+def test_make_batch_request_does_not_retry_unsupported_methods():
+    node = FlakyNode(failures={0}, error={'code': -32000, 'message': 'the method eth_getBlockReceipts does not exist'})
+    make_batch_request(node, get_requests(2), retry_policy=NO_DELAY)
+
+    assert node.batches == [[0, 1]]
+
+
+def test_make_batch_request_does_not_retry_reverted_calls():
+    for error in ({'code': -32000, 'message': 'execution reverted'}, {'code': 3, 'message': 'execution reverted: paused'}):
+        node = FlakyNode(failures={0}, error=error)
+        make_batch_request(node, get_requests(2), retry_policy=NO_DELAY)
+
+        assert node.batches == [[0, 1]]
+
+
+def test_make_batch_request_gives_up_after_max_retries():
+    node = FlakyNode(failures=AlwaysContains())
+    response = make_batch_request(node, get_requests(2), max_retries=2, retry_policy=NO_DELAY)
+
+    assert node.batches == [[0, 1], [0, 1], [0, 1]]
+    assert all(response_item['result'] is None for response_item in response)
+
+
+def test_make_batch_request_respects_retry_budget():
+    node = FlakyNode(failures=AlwaysContains())
+    retry_policy = RetryPolicy(base_delay=0, max_delay=0, budget=RetryBudget(min_retries_per_second=0, max_tokens=1))
+    make_batch_request(node, get_requests(2), retry_policy=retry_policy)
+
+    assert len(node.batches) == 2
+
+
+def test_make_batch_request_async():
+    node = AsyncFlakyNode(failures={0, 4}, error={'code': -32603, 'message': 'internal error'})
+    response = asyncio.run(make_batch_request_async(node, get_requests(5), retry_policy=NO_DELAY))
+
+    assert node.batches == [[0, 1, 2, 3, 4], [0, 4]]
+    assert [response_item['result'] for response_item in response] == ['0x0', '0x1', '0x2', '0x3', '0x4']
@@ -0,0 +1,122 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import json
+import socket
+import threading
+
+import pytest
+from web3._utils.threads import Timeout
+
+from ethereumetl.providers import ipc
+from ethereumetl.providers.ipc import JsonResponseReader
+from ethereumetl.providers.sized_response import get_byte_size
+
+RESPONSES = [
+    {'jsonrpc': '2.0', 'id': 1, 'result': '0x1b4'},
+    [{'jsonrpc': '2.0', 'id': 0, 'result': {'input': '0x'}}, {'jsonrpc': '2.0', 'id': 1, 'result': None}],
+    {'jsonrpc': '2.0', 'id': 2, 'error': {'code': -32000, 'message': 'unbalanced ]}[{ in "quoted" text \\'}},
+    {'jsonrpc': '2.0', 'id': 3, 'result': ['\\"', '\\\\', '"}', 'x' * 5000]},
+]
+
+
+def read_response(data, chunk_size, initial_buffer_size=16):
+    reader = JsonResponseReader(initial_buffer_size=initial_buffer_size)
+    server, client = socket.socketpair()
+    try:
+        def send():
+            for i in range(0, len(data), chunk_size):
+                server.sendall(data[i:i + chunk_size])
+        sender = threading.Thread(target=send)
+        sender.start()
+        with Timeout(5) as timeout:
+            response = reader.read(client, timeout)
+        sender.join()
+        return response
+    finally:
+        server.close()
+        client.close()
+
+
+@pytest.mark.parametrize('response', RESPONSES)
+@pytest.mark.parametrize('chunk_size', [1, 3, 7, 100000])
+def test_json_response_reader(response, chunk_size):
+    data = (json.dumps(response) + '\n').encode('utf-8')
+    actual_response = read_response(data, chunk_size)
+    assert actual_response == response
+    if isinstance(response, list):
+        assert get_byte_size(actual_response) == len(data) - 1
+
+
+@pytest.mark.parametrize('line_ending', ['', '\n', '\r\n'])
+@pytest.mark.parametrize('indent', [None, 1])
+@pytest.mark.parametrize('chunk_size', [1, 5])
+def test_json_response_reader_line_endings(line_ending, indent, chunk_size):
+    # Pretty printed documents have newlines after closing brackets before the end of the document
+    response = RESPONSES[1]
+    data = (json.dumps(response, indent=indent) + line_ending).encode('utf-8')
+    assert read_response(data, chunk_size) == response
+
+
+def test_json_response_reader_skips_scan_for_newline_delimited_responses(monkeypatch):
+    reader = JsonResponseReader(initial_buffer_size=16)
+    server, client = socket.socketpair()
+    try:
+        with Timeout(5) as timeout:
+            server.sendall((json.dumps(RESPONSES[0]) + '\n').encode('utf-8'))
+            assert reader.read(client, timeout) == RESPONSES[0]
+            assert reader.newline_delimited
+
+            monkeypatch.setattr(ipc, 'JSON_TOKEN_REGEX', None)
+            for response in RESPONSES:
+                data = (json.dumps(response) + '\n').encode('utf-8')
+                # Chunks ending with a closing bracket don't trigger the bracket scan
+                server.sendall(data[:-2])
+                server.sendall(data[-2:])
+                assert reader.read(client, timeout) == response
+    finally:
+        server.close()
+        client.close()
+
+
+def test_json_response_reader_reuses_buffer():
+    reader = JsonResponseReader(initial_buffer_size=16)
+    server, client = socket.socketpair()
+    try:
+        with Timeout(5) as timeout:
+            for response in RESPONSES:
+                server.sendall(json.dumps(response).encode('utf-8'))
+                assert reader.read(client, timeout) == response
+    finally:
+        server.close()
+        client.close()
+
+
+def test_json_response_reader_closed_socket():
+    reader = JsonResponseReader()
+    server, client = socket.socketpair()
+    server.sendall(b'{"jsonrpc": "2.0", "id"')
+    server.close()
+    with pytest.raises(ConnectionError):
+        with Timeout(5) as timeout:
+            reader.read(client, timeout)
+    client.close()
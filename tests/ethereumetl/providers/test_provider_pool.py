@@ -0,0 +1,94 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import pytest
+from requests.exceptions import ConnectionError as RequestsConnectionError
+
+from ethereumetl.providers import pool
+from ethereumetl.providers.pool import BatchProviderPool
+
+
+class FakeProvider:
+    def __init__(self, name, fail=False):
+        self.name = name
+        self.fail = fail
+        self.request_count = 0
+
+    def make_batch_request(self, text):
+        self.request_count += 1
+        if self.fail:
+            raise RequestsConnectionError('Connection refused')
+        return [{'jsonrpc': '2.0', 'id': 0, 'result': self.name}]
+
+
+@pytest.fixture(autouse=True)
+def clear_endpoint_health():
+    pool._endpoint_health_registry.clear()
+    yield
+    pool._endpoint_health_registry.clear()
+
+
+def test_provider_pool_retries_on_other_endpoint_and_ejects_failing_one():
+    dead = FakeProvider('dead', fail=True)
+    alive = FakeProvider('alive')
+    provider_pool = BatchProviderPool({'http://dead': dead, 'http://alive': alive})
+
+    for _ in range(50):
+        assert provider_pool.make_batch_request('[]')[0]['result'] == 'alive'
+
+    assert dead.request_count == pool.EJECT_AFTER_FAILURES
+    assert alive.request_count == 50
+
+
+def test_provider_pool_raises_when_all_endpoints_fail():
+    provider_pool = BatchProviderPool({
+        'http://dead1': FakeProvider('dead1', fail=True),
+        'http://dead2': FakeProvider('dead2', fail=True),
+    })
+
+    with pytest.raises(RequestsConnectionError):
+        provider_pool.make_batch_request('[]')
+
+
+def test_provider_pool_prefers_faster_endpoint():
+    pool.get_endpoint_health('http://fast').record_success(0.01)
+    pool.get_endpoint_health('http://slow').record_success(1.0)
+    fast = FakeProvider('fast')
+    slow = FakeProvider('slow')
+    provider_pool = BatchProviderPool({'http://fast': fast, 'http://slow': slow})
+
+    for _ in range(200):
+        provider_pool.make_batch_request('[]')
+
+    assert fast.request_count > slow.request_count * 5
+
+
+def test_provider_pool_shares_health_between_instances():
+    dead = FakeProvider('dead', fail=True)
+    for _ in range(pool.EJECT_AFTER_FAILURES):
+        pool.get_endpoint_health('http://dead').record_failure()
+
+    provider_pool = BatchProviderPool({'http://dead': dead, 'http://alive': FakeProvider('alive')})
+    provider_pool.make_batch_request('[]')
+
+    assert dead.request_count == 0
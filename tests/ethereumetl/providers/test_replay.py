@@ -0,0 +1,127 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import asyncio
+import json
+import time
+
+import pytest
+
+import tests.resources
+from ethereumetl.jobs.export_blocks_job import ExportBlocksJob
+from ethereumetl.jobs.exporters.blocks_and_transactions_item_exporter import blocks_and_transactions_item_exporter
+from ethereumetl.providers import replay
+from ethereumetl.providers.auto import get_provider_from_uri, get_async_provider_from_uri
+from ethereumetl.providers.replay import RpcArchiveWriter, RecordingProvider, ReplayMissError
+from ethereumetl.thread_local_proxy import ThreadLocalProxy
+from tests.ethereumetl.job.helpers import get_web3_provider
+from tests.helpers import compare_lines_ignore_order, read_file
+
+
+def read_resource(resource_group, file_name):
+    return tests.resources.read_resource(['test_export_blocks_job', resource_group], file_name)
+
+
+class FakeNode:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.block_number = 100
+
+    def make_request(self, method, params):
+        time.sleep(self.latency)
+        self.block_number += 1
+        return {'jsonrpc': '2.0', 'id': 7, 'result': hex(self.block_number)}
+
+    def make_batch_request(self, text):
+        time.sleep(self.latency)
+        return [{'jsonrpc': '2.0', 'id': request['id'], 'result': request['params']} for request in json.loads(text)]
+
+
+@pytest.fixture(autouse=True)
+def clear_archives():
+    replay._archives.clear()
+    yield
+    replay._archives.clear()
+
+
+def export_blocks(tmpdir, batch_web3_provider, batch_size):
+    blocks_output_file = str(tmpdir.join('actual_blocks.csv'))
+    transactions_output_file = str(tmpdir.join('actual_transactions.csv'))
+    job = ExportBlocksJob(
+        start_block=47218, end_block=47219, batch_size=batch_size,
+        batch_web3_provider=batch_web3_provider,
+        max_workers=5,
+        item_exporter=blocks_and_transactions_item_exporter(blocks_output_file, transactions_output_file),
+        export_blocks=True,
+        export_transactions=True
+    )
+    job.run()
+    compare_lines_ignore_order(
+        read_resource('blocks_with_transactions', 'expected_blocks.csv'), read_file(blocks_output_file))
+    compare_lines_ignore_order(
+        read_resource('blocks_with_transactions', 'expected_transactions.csv'), read_file(transactions_output_file))
+
+
+def test_export_blocks_job_record_and_replay(tmpdir):
+    archive_path = str(tmpdir.join('rpc_archive.jsonl.gz'))
+    writer = RpcArchiveWriter(archive_path)
+    export_blocks(tmpdir, ThreadLocalProxy(lambda: RecordingProvider(get_web3_provider(
+        'mock', lambda file: read_resource('blocks_with_transactions', file), batch=True), writer)), batch_size=1)
+    writer.close()
+
+    # Requests are replayed individually, so the batches don't need to match the recorded ones
+    export_blocks(tmpdir, ThreadLocalProxy(
+        lambda: get_provider_from_uri('replay://' + archive_path, batch=True)), batch_size=2)
+
+
+def test_replay_provider(tmpdir):
+    archive_path = str(tmpdir.join('rpc_archive.jsonl.gz'))
+    writer = RpcArchiveWriter(archive_path)
+    recording_provider = RecordingProvider(FakeNode(latency=0.05), writer)
+    recording_provider.make_batch_request(json.dumps([
+        {'jsonrpc': '2.0', 'method': 'eth_getCode', 'params': ['0x1', '0x10'], 'id': 0},
+        {'jsonrpc': '2.0', 'method': 'eth_getCode', 'params': ['0x2', '0x10'], 'id': 1},
+    ]))
+    recording_provider.make_request('eth_blockNumber', [])
+    recording_provider.make_request('eth_blockNumber', [])
+    writer.close()
+
+    replay_provider = get_provider_from_uri('replay://' + archive_path)
+    response = replay_provider.make_batch_request(json.dumps([
+        {'jsonrpc': '2.0', 'method': 'eth_getCode', 'params': ['0x2', '0x10'], 'id': 5},
+    ]))
+    assert response == [{'jsonrpc': '2.0', 'id': 5, 'result': ['0x2', '0x10']}]
+
+    # Repeated requests get the recorded responses in order, then the last one again
+    assert [replay_provider.make_request('eth_blockNumber', [])['result'] for _ in range(3)] == \
+        ['0x65', '0x66', '0x66']
+
+    with pytest.raises(ReplayMissError):
+        replay_provider.make_request('eth_getCode', ['0x3', '0x10'])
+
+    latency_provider = get_provider_from_uri('replay://{}?emulate_latency=true'.format(archive_path))
+    start_time = time.time()
+    latency_provider.make_request('eth_getCode', ['0x1', '0x10'])
+    assert time.time() - start_time >= 0.05
+
+    async_provider = get_async_provider_from_uri('replay://' + archive_path)
+    assert asyncio.run(async_provider.make_request('eth_getCode', ['0x1', '0x10']))['result'] == ['0x1', '0x10']
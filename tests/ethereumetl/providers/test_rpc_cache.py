@@ -0,0 +1,140 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import asyncio
+import json
+
+import pytest
+
+from blockchainetl import json_codec
+from ethereumetl.json_rpc_requests import generate_get_block_by_number_json_rpc, generate_get_receipt_json_rpc
+from ethereumetl.providers.cache import RpcResponseCache, CachingBatchProvider, AsyncCachingBatchProvider
+
+HEAD_BLOCK_NUMBER = 1000
+
+
+class FakeNode:
+    def __init__(self):
+        self.requested_methods = []
+
+    def make_request(self, method, params):
+        self.requested_methods.append(method)
+        assert method == 'eth_blockNumber'
+        return {'jsonrpc': '2.0', 'id': 1, 'result': hex(HEAD_BLOCK_NUMBER)}
+
+    def make_batch_request(self, text):
+        responses = []
+        for request in json.loads(text):
+            self.requested_methods.append(request['method'])
+            responses.append({'jsonrpc': '2.0', 'id': request['id'], 'result': self._result(request)})
+        return responses
+
+    def _result(self, request):
+        if request['method'] == 'eth_getBlockByNumber':
+            return {'number': request['params'][0], 'transactions': []}
+        elif request['method'] == 'eth_getTransactionReceipt':
+            transaction_hash = request['params'][0]
+            return None if transaction_hash == '0xpending' else {'transactionHash': transaction_hash, 'blockNumber': '0x10'}
+
+
+class AsyncFakeNode(FakeNode):
+    async def make_request(self, method, params):
+        return super().make_request(method, params)
+
+    async def make_batch_request(self, text):
+        return super().make_batch_request(text)
+
+
+@pytest.fixture
+def rpc_cache(tmpdir):
+    cache = RpcResponseCache(str(tmpdir.join('rpc_cache.sqlite')), finality_depth=100)
+    yield cache
+    cache.close()
+
+
+def get_blocks(provider, block_numbers):
+    return provider.make_batch_request(json.dumps(list(generate_get_block_by_number_json_rpc(block_numbers, False))))
+
+
+def test_rpc_cache_serves_finalized_blocks(rpc_cache):
+    node = FakeNode()
+    provider = CachingBatchProvider(node, rpc_cache)
+
+    first_responses = get_blocks(provider, [1, 2, 3])
+    assert node.requested_methods == ['eth_getBlockByNumber'] * 3 + ['eth_blockNumber']
+
+    node.requested_methods = []
+    second_responses = get_blocks(provider, [1, 2, 3])
+    assert node.requested_methods == []
+    assert second_responses == first_responses
+
+    # Cached and fetched responses are returned in request order with their request ids
+    mixed_responses = get_blocks(provider, [4, 2, 5])
+    assert node.requested_methods == ['eth_getBlockByNumber'] * 2
+    assert [(response['id'], response['result']['number']) for response in mixed_responses] == \
+        [(0, '0x4'), (1, '0x2'), (2, '0x5')]
+
+
+def test_rpc_cache_skips_recent_blocks_and_empty_results(rpc_cache):
+    node = FakeNode()
+    provider = CachingBatchProvider(node, rpc_cache)
+
+    safe_block_number = HEAD_BLOCK_NUMBER - rpc_cache.finality_depth
+    get_blocks(provider, [safe_block_number, safe_block_number + 1])
+    receipts_rpc = list(generate_get_receipt_json_rpc(['0xabc', '0xpending']))
+    provider.make_batch_request(json.dumps(receipts_rpc))
+
+    node.requested_methods = []
+    get_blocks(provider, [safe_block_number, safe_block_number + 1])
+    provider.make_batch_request(json.dumps(receipts_rpc))
+    assert node.requested_methods == ['eth_getBlockByNumber', 'eth_getTransactionReceipt']
+
+
+def test_rpc_cache_evicts_least_recently_used(tmpdir):
+    cache = RpcResponseCache(str(tmpdir.join('rpc_cache.sqlite')), max_size_bytes=2000, finality_depth=0)
+    node = FakeNode()
+    provider = CachingBatchProvider(node, cache)
+
+    for block_number in range(100):
+        get_blocks(provider, [block_number])
+        get_blocks(provider, [0])
+        assert cache.size_bytes <= cache.max_size_bytes
+
+    node.requested_methods = []
+    get_blocks(provider, [0, 99, 1])
+    assert node.requested_methods == ['eth_getBlockByNumber']
+
+    reopened_cache = RpcResponseCache(cache.path)
+    assert reopened_cache.size_bytes == cache.size_bytes
+    reopened_cache.close()
+    cache.close()
+
+
+def test_async_rpc_cache(rpc_cache):
+    node = AsyncFakeNode()
+    provider = AsyncCachingBatchProvider(node, rpc_cache)
+    request_text = json_codec.dumps(list(generate_get_block_by_number_json_rpc([1, 2], False)))
+
+    first_responses = asyncio.run(provider.make_batch_request(request_text))
+    node.requested_methods = []
+    assert asyncio.run(provider.make_batch_request(request_text)) == first_responses
+    assert node.requested_methods == []
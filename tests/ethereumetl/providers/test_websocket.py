@@ -0,0 +1,115 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+import websockets
+from web3.providers.websocket import _get_threaded_loop
+
+from ethereumetl.misc.retriable_value_error import RetriableValueError
+from ethereumetl.providers.sized_response import get_byte_size
+from ethereumetl.providers.websocket import WebsocketMultiplexer
+
+BATCH_ERROR = {'jsonrpc': '2.0', 'id': None, 'error': {'code': -32600, 'message': 'invalid batch'}}
+
+
+async def handle_connection(websocket, path=None):
+    # Answers with the names of the methods, fails batches with method fail and never answers method slow.
+    # Method stale gets a response to an unknown request first
+    async for message in websocket:
+        payload = json.loads(message)
+        requests = payload if isinstance(payload, list) else [payload]
+        if any(request['method'] == 'slow' for request in requests):
+            continue
+        if any(request['method'] == 'stale' for request in requests):
+            # Like a late response to a request that already timed out
+            await websocket.send(json.dumps({'jsonrpc': '2.0', 'id': 10 ** 9, 'result': '0x0'}))
+        if any(request['method'] == 'fail' for request in requests):
+            await websocket.send(json.dumps(BATCH_ERROR))
+            continue
+        response = [{'jsonrpc': '2.0', 'id': request['id'], 'result': request['method'] + ' ✓'}
+                    for request in requests]
+        await websocket.send(json.dumps(response if isinstance(payload, list) else response[0], ensure_ascii=False))
+
+
+async def serve():
+    return await websockets.serve(handle_connection, '127.0.0.1', 0)
+
+
+@pytest.fixture
+def multiplexer():
+    loop = _get_threaded_loop()
+    server = asyncio.run_coroutine_threadsafe(serve(), loop).result()
+    port = server.sockets[0].getsockname()[1]
+    yield WebsocketMultiplexer('ws://127.0.0.1:{}'.format(port), loop, connections=1)
+    server.close()
+
+
+def build_batch(*methods):
+    return [{'jsonrpc': '2.0', 'method': method, 'params': [], 'id': idx} for idx, method in enumerate(methods)]
+
+
+def test_websocket_multiplexer_byte_size_of_text_messages(multiplexer):
+    response = multiplexer.request(build_batch('eth_blockNumber', 'eth_chainId'), timeout=5)
+
+    assert [(item['id'], item['result']) for item in response] == [(0, 'eth_blockNumber ✓'), (1, 'eth_chainId ✓')]
+    expected_byte_size = len(json.dumps([
+        {'jsonrpc': '2.0', 'id': idx + 1, 'result': method + ' ✓'}
+        for idx, method in enumerate(['eth_blockNumber', 'eth_chainId'])], ensure_ascii=False).encode('utf-8'))
+    assert get_byte_size(response) == expected_byte_size
+
+
+def test_websocket_multiplexer_returns_batch_error_to_the_only_waiting_request(multiplexer):
+    response = multiplexer.request(build_batch('eth_blockNumber', 'fail'), timeout=5)
+
+    assert response == BATCH_ERROR
+
+
+def test_websocket_multiplexer_fails_waiting_requests_on_unmatched_response(multiplexer):
+    errors = []
+
+    def request_slow():
+        try:
+            multiplexer.request(build_batch('slow'), timeout=5)
+        except RetriableValueError as e:
+            errors.append(e)
+
+    slow_request = threading.Thread(target=request_slow)
+    slow_request.start()
+    while len(multiplexer._pending) == 0:
+        time.sleep(0.01)
+
+    # Both requests wait on the one connection, it's not known which one failed
+    with pytest.raises(RetriableValueError):
+        multiplexer.request(build_batch('fail'), timeout=5)
+    slow_request.join()
+    assert len(errors) == 1
+
+
+def test_websocket_multiplexer_ignores_responses_to_unknown_requests(multiplexer):
+    response = multiplexer.request(build_batch('stale'), timeout=5)
+
+    assert [(item['id'], item['result']) for item in response] == [(0, 'stale ✓')]
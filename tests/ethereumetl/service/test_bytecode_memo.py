@@ -0,0 +1,72 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+from ethereumetl.service.bytecode_memo import BytecodeMemo
+from ethereumetl.service.eth_contract_service import EthContractService, get_bytecode_hash
+
+ERC20_BYTECODE = '0x6060604052600436106100565763ffffffff7c0100000000000000000000000000000000000000000000000000000000' \
+                 '60003504166318160ddd811461005b57806323b872dd1461008057806370a08231146100a8578063a9059cbb146100c7578063' \
+                 '095ea7b3146100e9578063dd62ed3e1461010b575b600080fd5b'
+
+
+def test_bytecode_memo_lru():
+    bytecode_memo = BytecodeMemo(max_size=2)
+    bytecode_memo.put(b'a', (['0x18160ddd'], False, False))
+    bytecode_memo.put(b'b', ([], False, False))
+    assert bytecode_memo.get(b'a') == (['0x18160ddd'], False, False)
+    bytecode_memo.put(b'c', ([], False, False))
+
+    # b is the least recently used
+    assert bytecode_memo.get(b'b') is None
+    assert bytecode_memo.get(b'a') is not None
+    assert len(bytecode_memo) == 2
+
+
+def test_bytecode_memo_on_disk(tmpdir):
+    path = str(tmpdir.join('bytecode_memo.sqlite'))
+    bytecode_memo = BytecodeMemo(path=path)
+    bytecode_memo.put(b'a', (['0x18160ddd', '0x70a08231'], True, False))
+    bytecode_memo.close()
+
+    bytecode_memo = BytecodeMemo(path=path)
+    assert bytecode_memo.get(b'a') == (['0x18160ddd', '0x70a08231'], True, False)
+    assert bytecode_memo.get(b'b') is None
+    bytecode_memo.close()
+
+
+def test_classify_contract_memoized():
+    bytecode_memo = BytecodeMemo()
+    eth_contract_service = EthContractService(bytecode_memo)
+
+    classification = eth_contract_service.classify_contract(ERC20_BYTECODE)
+    assert classification == EthContractService().classify_contract(ERC20_BYTECODE)
+    assert classification[1] is True
+    assert bytecode_memo.get(get_bytecode_hash(ERC20_BYTECODE)) == classification
+    # Empty bytecode isn't memoized
+    assert eth_contract_service.classify_contract('0x') == ([], False, False)
+    assert len(bytecode_memo) == 1
+
+    # Served from the memo, and changing the result doesn't change the memo
+    eth_contract_service.get_function_sighashes = None
+    memoized_classification = eth_contract_service.classify_contract(ERC20_BYTECODE)
+    assert memoized_classification == classification
+    memoized_classification[0].append('0xffffffff')
+    assert eth_contract_service.classify_contract(ERC20_BYTECODE) == classification
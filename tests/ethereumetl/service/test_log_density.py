@@ -0,0 +1,60 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+from ethereumetl.service.log_density import LogDensity
+
+
+def test_log_density_unknown_era():
+    log_density = LogDensity(max_logs_per_request=1000, era_size=100)
+    assert log_density.get_range_size(50) is None
+
+    log_density.record_logs(0, 9, 0)
+    assert log_density.get_range_size(50) is None
+
+
+def test_log_density_sizes_ranges_by_era():
+    log_density = LogDensity(max_logs_per_request=1000, era_size=100)
+    log_density.record_logs(0, 9, 100)
+    log_density.record_logs(100, 199, 100)
+
+    assert log_density.get_range_size(50) == 80
+    assert log_density.get_range_size(150) == 800
+    assert log_density.get_range_size(250) is None
+
+
+def test_log_density_weights():
+    log_density = LogDensity(max_logs_per_request=1000, era_size=100, default_range_size=10)
+    log_density.record_logs(0, 9, 100)
+    log_density.record_logs(100, 199, 0)
+
+    assert log_density.get_weight(50) == 10
+    assert log_density.get_weight(150) == 0
+    # A range of default_range_size blocks
+    assert log_density.get_weight(250) == 80
+
+
+def test_log_density_limit_exceeded():
+    log_density = LogDensity(max_logs_per_request=1000, era_size=100)
+    log_density.record_logs(0, 99, 100)
+    log_density.record_limit_exceeded(0, 9)
+
+    assert log_density.get_density(0) == 100
+    assert log_density.get_range_size(0) == 8
@@ -0,0 +1,56 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+from ethereumetl.domain.token import EthToken
+from ethereumetl.service.token_cache import TokenMetadataCache
+
+
+def build_token(address, total_supply):
+    token = EthToken()
+    token.address = address
+    token.symbol = 'EOS'
+    token.name = None
+    token.decimals = 18
+    token.total_supply = total_supply
+    return token
+
+
+def test_token_cache_round_trip(tmpdir):
+    path = str(tmpdir.join('tokens.db'))
+    cache = TokenMetadataCache(path)
+    cache.put_many([build_token('0x86fa049857e0209aa7d9e616f7eb3b3b78ecfdb0', 10 ** 27)], 1000000)
+    cache.close()
+
+    # The cache outlives the process
+    cache = TokenMetadataCache(path)
+    cached = cache.get_many(['0x86fa049857e0209aa7d9e616f7eb3b3b78ecfdb0', '0xf763be8b3263c268e9789abfb3934564a7b80054'])
+    assert list(cached) == ['0x86fa049857e0209aa7d9e616f7eb3b3b78ecfdb0']
+    token, total_supply_block_number = cached['0x86fa049857e0209aa7d9e616f7eb3b3b78ecfdb0']
+    assert (token.symbol, token.name, token.decimals, token.total_supply) == ('EOS', None, 18, 10 ** 27)
+    assert total_supply_block_number == 1000000
+    cache.close()
+
+
+def test_token_cache_total_supply_refresh(tmpdir):
+    cache = TokenMetadataCache(str(tmpdir.join('tokens.db')), total_supply_refresh_blocks=100)
+    assert cache.is_total_supply_fresh(1000, 1099)
+    assert not cache.is_total_supply_fresh(1000, 1100)
+    cache.close()
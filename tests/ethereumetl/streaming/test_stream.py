@@ -20,6 +20,7 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import json
 import os
 
 import pytest
@@ -28,6 +29,7 @@ from ethereumetl.thread_local_proxy import ThreadLocalProxy
 
 import tests.resources
 from ethereumetl.enumeration.entity_type import EntityType
+from ethereumetl.executors.scheduler import get_scheduler, set_scheduler
 from blockchainetl.jobs.exporters.composite_item_exporter import CompositeItemExporter
 from blockchainetl.streaming.streamer import Streamer
 from tests.ethereumetl.job.helpers import get_web3_provider
@@ -40,6 +42,15 @@ def read_resource(resource_group, file_name):
     return tests.resources.read_resource([RESOURCE_GROUP, resource_group], file_name)
 
 
+@pytest.fixture(autouse=True)
+def shared_scheduler():
+    yield
+    scheduler = get_scheduler()
+    set_scheduler(None)
+    if scheduler is not None:
+        scheduler.shutdown()
+
+
 @pytest.mark.parametrize("start_block, end_block, batch_size, resource_group, entity_types, provider_type", [
     (1755634, 1755635, 1, 'blocks_1755634_1755635', EntityType.ALL_FOR_INFURA, 'mock'),
     skip_if_slow_tests_disabled([1755634, 1755635, 1, 'blocks_1755634_1755635', EntityType.ALL_FOR_INFURA, 'infura']),
@@ -102,6 +113,7 @@ def test_stream(tmpdir, start_block, end_block, batch_size, resource_group, enti
         compare_lines_ignore_order(
             read_resource(resource_group, 'expected_transactions.json'), read_file(transactions_output_file)
         )
+        assert_sorted(transactions_output_file, ('block_number', 'transaction_index'))
 
     if 'log' in entity_types:
         print('=====================')
@@ -109,6 +121,7 @@ def test_stream(tmpdir, start_block, end_block, batch_size, resource_group, enti
         compare_lines_ignore_order(
             read_resource(resource_group, 'expected_logs.json'), read_file(logs_output_file)
         )
+        assert_sorted(logs_output_file, ('block_number', 'log_index'))
 
     if 'token_transfer' in entity_types:
         print('=====================')
@@ -123,6 +136,7 @@ def test_stream(tmpdir, start_block, end_block, batch_size, resource_group, enti
         compare_lines_ignore_order(
             read_resource(resource_group, 'expected_traces.json'), read_file(traces_output_file)
         )
+        assert_sorted(traces_output_file, ('block_number', 'trace_index'))
 
     if 'contract' in entity_types:
         print('=====================')
@@ -137,3 +151,8 @@ def test_stream(tmpdir, start_block, end_block, batch_size, resource_group, enti
         compare_lines_ignore_order(
             read_resource(resource_group, 'expected_tokens.json'), read_file(tokens_output_file)
         )
+
+
+def assert_sorted(file, fields):
+    keys = [tuple(json.loads(line)[field] for field in fields) for line in read_file(file).splitlines() if line]
+    assert keys == sorted(keys)
@@ -53,6 +53,17 @@ def test_progress_logger_with_total_items():
     assert logger_mock.logs[101].startswith('Finished work. Total items processed: 9900. Took ')
 
 
+def test_progress_logger_with_status():
+    logger_mock = LoggerMock()
+    progress_logger = ProgressLogger(logger=logger_mock, log_item_step=1000, status_getter=lambda: 'Batch size is 10.')
+
+    progress_logger.start()
+    progress_logger.track(1000)
+    progress_logger.finish()
+
+    assert logger_mock.logs[1] == '1000 items processed. Batch size is 10.'
+
+
 class LoggerMock:
     def __init__(self):
         self.logs = []